@@ -0,0 +1,56 @@
+"""Invalid-action masks: which of the four actions do not run straight into a wall or a body.
+
+The envs expose them as action_masks() (one row of four bools per env, in env
+action order), which is the method sb3_contrib's MaskablePPO looks for. Models
+trained with masks are MaskablePPO models. load_model() picks the right class
+from the saved file, so evaluation and export work for both kinds.
+"""
+import json
+import zipfile
+
+import numpy as np
+
+# Env-handlingerne i cellekoordinater (celle = y * width + x), som DX/DY i battlesnake_vec_env.py
+ENV_DELTAS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+def action_mask(state, snake_id):
+    """Bool per env action (ENV_DELTAS order) for `snake_id` on a BoardState under the standard rules.
+
+    A tail that moves away this turn is free; a stacked tail (the snake just ate)
+    is not. If no action is safe every action is allowed, so a policy always has
+    something to choose from.
+    """
+    width = state.width
+    head = state.snakes[snake_id].head
+    x, y = head % width, head // width
+    occupied = state.occupied
+    for body in state.snakes.values():
+        if len(body) > 1 and body.cells[-2] != body.tail:
+            occupied &= ~(1 << body.tail)
+
+    mask = np.zeros(len(ENV_DELTAS), dtype=bool)
+    for action, (dx, dy) in enumerate(ENV_DELTAS):
+        if state.in_bounds(x + dx, y + dy):
+            mask[action] = not (occupied >> ((y + dy) * width + x + dx)) & 1
+    if not mask.any():
+        mask[:] = True
+    return mask
+
+
+def is_maskable(path):
+    """True if the SB3 .zip at `path` was saved by MaskablePPO (read from its metadata, nothing is loaded)."""
+    with zipfile.ZipFile(path) as archive:
+        data = json.loads(archive.read("data"))
+    return data.get("policy_class", {}).get("__module__", "").startswith("sb3_contrib")
+
+
+def load_model(path, **kwargs):
+    """PPO.load or, for a model trained with action masks, MaskablePPO.load (needs sb3-contrib)."""
+    if is_maskable(path):
+        from sb3_contrib import MaskablePPO
+
+        return MaskablePPO.load(path, **kwargs)
+    from stable_baselines3 import PPO
+
+    return PPO.load(path, **kwargs)
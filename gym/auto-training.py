@@ -1,110 +1,302 @@
+import functools
+import json
 import os
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 from re import VERBOSE
 from stable_baselines3 import PPO
-from battlesnake_env import BattlesnakeEnv
+from stable_baselines3.common.callbacks import BaseCallback, CallbackList
+from battlesnake_vec_env import BattlesnakeVecEnv
+from shared_memory_vec_env import SharedMemoryVecEnv
+from env_profiler import EnvProfiler, ProfilerCallback
+from league_env import make_league_env
+from action_mask import is_maskable, load_model
+from behavior_cloning import PRETRAINED_MODEL
+from evaluation import CACHE_FILE, evaluate_models
+from hyperparameter_search import HYPERPARAMETERS_FILE
+from symmetry import BoardSymmetry, augment_rollout_buffer, restore_rollout_buffer
+from training_db import PLANNED, TRAINED, TrainingDB, remove_model_files
 
 # Konfigurationsparametre
 MODELS_DIR = "models"
 EVALUATION_GAMES = 100  # Reduceret antal evalueringer
+EVALUATION_SEEDS = range(EVALUATION_GAMES)  # Samme spil for alle modeller, så resultaterne kan caches
+EVALUATION_WORKERS = os.cpu_count()  # Processer til evaluering
 TRAINING_TIMESTEPS = 100000
 GENERATIONS = 100  # Antal iterationer i træningscyklussen
+N_ENVS = 8  # Antal spil, der simuleres samtidig under træning
+N_WORKERS = 1  # Antal processer, som N_ENVS fordeles på (1 = alt i træningsprocessen)
+PARALLEL_CANDIDATES = False  # Træn generationens 3 kandidater samtidig i hver sin proces
+PROFILE_ENV = False  # Mål tiden i miljøets faser og log den med SB3 (gemmes som <model>.profile.json)
+LEAGUE_MODE = False  # Træn mod 1-3 modstandere fra en pulje af tidligere generationer og bots i stedet for SimpleSnake
+LEAGUE_POOL_SIZE = 5  # Antal seneste generationer i modstanderpuljen
+OBSERVATION = "board"  # "board" (ét tal pr. celle) eller "channels" (featureplaner, se observation.py)
+TRAINING_DB = os.path.join(MODELS_DIR, "training.db")  # Generationer, modeller og scorer, så et afbrudt løb kan genoptages
+CHECKPOINT_DIR = os.path.join(MODELS_DIR, "checkpoints")
+CHECKPOINT_EVERY = 20000  # Gem et checkpoint for hver N trin under model.learn (0 = aldrig)
+KEEP_MODELS = 20  # Behold kun de N bedste evaluerede modeller på disken (None = behold alle)
+SYMMETRY_AUGMENTATION = False  # Træn på hver rollout i alle brættets spejlinger og rotationer (op til 8x data pr. miljøtrin)
+ACTION_MASKING = False  # Masker træk ind i vægge og kroppe med MaskablePPO (kræver sb3-contrib, se action_mask.py)
+HYPERPARAMETERS = {"learning_rate": 0.0003, "ent_coef": 0.005}  # Overskrives af HYPERPARAMETERS_FILE fra hyperparameter_search.py
 
 # Sikre, at models-mappen findes
 os.makedirs(MODELS_DIR, exist_ok=True)
 
-def get_latest_model():
-    """Find the latest generation model in the models directory."""
-    models = [f for f in os.listdir(MODELS_DIR) if f.endswith(".zip")]
-    if not models:
-        return None
+def model_number(path):
+    """(generation, candidate) from a name like model_gen3_2.zip."""
+    name = os.path.basename(path)
+    return int(name.split("_gen")[-1].split("_")[0]), int(name.split("_")[-1].split(".")[0])
+
+def list_generation_models():
+    """Generation models in the models directory, oldest first."""
+    models = [f for f in os.listdir(MODELS_DIR) if f.endswith(".zip") and "_gen" in f]
 
     # Sort models by generation and model number
-    models.sort(key=lambda x: (int(x.split("_gen")[-1].split("_")[0]), int(x.split("_")[-1].split(".")[0])))
-    return os.path.join(MODELS_DIR, models[-1])
+    models.sort(key=model_number)
+    return [os.path.join(MODELS_DIR, f) for f in models]
+
+def get_latest_model():
+    """Find the latest generation model in the models directory."""
+    models = list_generation_models()
+    return models[-1] if models else None
 
 def evaluate_all_models():
     """Evaluate all models and find the best one."""
-    models = [os.path.join(MODELS_DIR, f) for f in os.listdir(MODELS_DIR) if f.endswith(".zip")]
+    # Kun generationerne; models/pretrained.zip fra behavior_cloning.py er et udgangspunkt, ikke en kandidat
+    models = list_generation_models()
     if len(models) < 3:
         return None
 
-    scores = {}
-    for model_path in models:
-        scores[model_path] = evaluate_model(model_path, EVALUATION_GAMES)
+    scores = evaluate(models)
 
     best_model_path = max(scores, key=scores.get)
     print(f"Bedste eksisterende model: {best_model_path} med score: {scores[best_model_path]}")
     return best_model_path
 
-def train_model(base_model_path, new_model_path, timesteps):
-    """Træn en ny model baseret på en eksisterende."""
-    # Indlæs basemodellen eller opret en ny
-    if base_model_path:
-        model = PPO.load(base_model_path, device='cpu', learning_rate=0.0003, ent_coef=0.005)
-    else:
-        env = BattlesnakeEnv()
-        model = PPO("MlpPolicy", env, verbose=1, device='cpu', learning_rate=0.0003, ent_coef=0.005)
+def make_env(profiler=None):
+    """Opret træningsmiljøet, fordelt på N_WORKERS processer hvis der er flere."""
+    env_fn = None
+    if LEAGUE_MODE:
+        # Hver proces indlæser puljen selv og kører modstandernes træk samlet
+        env_fn = functools.partial(make_league_env, models=list_generation_models()[-LEAGUE_POOL_SIZE:], observation=OBSERVATION)
+    if N_WORKERS > 1:
+        # Ellers ville N_ENVS // N_WORKERS stille og roligt træne på færre miljøer end N_ENVS
+        if N_ENVS % N_WORKERS:
+            raise ValueError(f"N_ENVS ({N_ENVS}) must be a multiple of N_WORKERS ({N_WORKERS})")
+        # Profileren ser kun miljøer i træningsprocessen; her måles kun rollout-tiden
+        return SharedMemoryVecEnv(n_workers=N_WORKERS, envs_per_worker=N_ENVS // N_WORKERS, env_fn=env_fn,
+                                  observation=OBSERVATION)
+    if env_fn:
+        return env_fn(N_ENVS, profiler=profiler)
+    return BattlesnakeVecEnv(n_envs=N_ENVS, profiler=profiler, observation=OBSERVATION)
+
+class CheckpointCallback(BaseCallback):
+    """Save the model to `path` every `every` timesteps, replacing the previous checkpoint atomically."""
+
+    def __init__(self, path, every):
+        super().__init__()
+        self.path = path
+        self.every = every
+        self._last = 0
+
+    def _on_training_start(self):
+        self._last = self.num_timesteps
+
+    def _on_step(self):
+        if self.num_timesteps - self._last >= self.every:
+            self._last = self.num_timesteps
+            tmp_path = self.path[:-len(".zip")] + ".tmp.zip"
+            self.model.save(tmp_path)
+            os.replace(tmp_path, self.path)
+        return True
+
+class SymmetryCallback(BaseCallback):
+    """Train on every rollout in all of the board's rotations and reflections (see symmetry.py)."""
+
+    def __init__(self, width, height):
+        super().__init__()
+        self.symmetry = BoardSymmetry(width, height)
+        self._n_envs = None
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_start(self):
+        # collect_rollouts har allerede nulstillet bufferen med det udvidede antal miljøer
+        self._restore()
 
+    def _on_rollout_end(self):
+        self._n_envs = augment_rollout_buffer(self.model.rollout_buffer, self.model.policy, self.symmetry)
+
+    def _on_training_end(self):
+        self._restore()
+
+    def _restore(self):
+        if self._n_envs is not None:
+            restore_rollout_buffer(self.model.rollout_buffer, self._n_envs)
+            self._n_envs = None
+
+def hyperparameters():
+    """PPO-parametre: standardværdierne, opdateret med den bedste konfiguration fra hyperparameter_search.py."""
+    params = dict(HYPERPARAMETERS)
+    if os.path.exists(HYPERPARAMETERS_FILE):
+        with open(HYPERPARAMETERS_FILE) as f:
+            params.update(json.load(f)["params"])
+    return params
+
+def algorithm():
+    """MaskablePPO when training with action masks, otherwise PPO."""
+    if ACTION_MASKING:
+        from sb3_contrib import MaskablePPO
+        return MaskablePPO
+    return PPO
+
+def checkpoint_path(model_path):
+    return os.path.join(CHECKPOINT_DIR, os.path.basename(model_path))
+
+def train_model(base_model_path, new_model_path, timesteps, seed=None):
+    """Træn en ny model baseret på en eksisterende, eller fortsæt fra modellens checkpoint.
+
+    Returns the timesteps the model has trained and the seconds it took in this call.
+    """
+    started = time.time()
     # Initialiser miljø
-    env = BattlesnakeEnv()
-    model.set_env(env)
+    profiler = EnvProfiler() if PROFILE_ENV else None
+    env = make_env(profiler)
+
+    # Indlæs checkpointet fra et afbrudt løb, basemodellen, den forudtrænede model (behavior_cloning.py) eller opret en ny
+    # (behavior cloning lærer af brætter, så den forudtrænede model findes kun som "board")
+    checkpoint = checkpoint_path(new_model_path)
+    resumed = os.path.exists(checkpoint)
+    if not base_model_path and OBSERVATION == "board" and os.path.exists(PRETRAINED_MODEL):
+        base_model_path = PRETRAINED_MODEL
+    if resumed:
+        model = algorithm().load(checkpoint, env=env, device='cpu')
+        print(f"Fortsætter {new_model_path} fra trin {model.num_timesteps}")
+    elif base_model_path and is_maskable(base_model_path) == ACTION_MASKING:
+        model = algorithm().load(base_model_path, env=env, device='cpu', **hyperparameters())
+    else:
+        model = algorithm()("MlpPolicy", env, verbose=1, device='cpu', **hyperparameters())
+        if base_model_path:
+            # Maskerede og umaskerede policies har de samme lag, så vægtene kan flyttes direkte
+            model.policy.load_state_dict(load_model(base_model_path, device='cpu').policy.state_dict())
+    if seed is not None:
+        model.set_random_seed(seed)
 
     # Træn modellen
-    model.learn(total_timesteps=timesteps)
+    callbacks = []
+    if profiler:
+        callbacks.append(ProfilerCallback(profiler, new_model_path.replace(".zip", ".profile.json")))
+    if CHECKPOINT_EVERY:
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        callbacks.append(CheckpointCallback(checkpoint, CHECKPOINT_EVERY))
+    if SYMMETRY_AUGMENTATION:
+        callbacks.append(SymmetryCallback(env.width, env.height))
+    remaining = timesteps - model.num_timesteps if resumed else timesteps
+    if remaining > 0:
+        model.learn(total_timesteps=remaining, callback=CallbackList(callbacks), reset_num_timesteps=not resumed)
+    env.close()
 
-    # Gem den trænede model
+    # Gem den trænede model; checkpointet er ikke længere nødvendigt
     model.save(new_model_path)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
     print(f"Model gemt: {new_model_path}")
+    return model.num_timesteps, time.time() - started
+
+def evaluate(model_paths):
+    """Evaluér modellerne parallelt på EVALUATION_SEEDS; uændrede modeller hentes fra cachen."""
+    scores = evaluate_models(
+        model_paths,
+        EVALUATION_SEEDS,
+        workers=EVALUATION_WORKERS,
+        cache_path=os.path.join(MODELS_DIR, CACHE_FILE),
+    )
+    for model_path, avg_score in scores.items():
+        print(f"Model {model_path} gennemsnitlig score: {avg_score}")
+    return scores
 
 def evaluate_model(model_path, games):
     """Evaluér en model over et antal spil."""
-    model = PPO.load(model_path, device='cpu')
-    env = BattlesnakeEnv()
-
-    total_score = 0
-    for _ in range(games):
-        obs, _ = env.reset()
-        done = False
-        while not done:
-            action, _ = model.predict(obs, deterministic=True)
-            obs, reward, done, truncated, _ = env.step(action)
-            total_score += reward
-            if done or truncated:
-                break
-
-    avg_score = total_score / games
-    print(f"Model {model_path} gennemsnitlig score: {avg_score}")
-    return avg_score
+    return evaluate_models([model_path], range(games), workers=EVALUATION_WORKERS)[model_path]
 
-def main(start_model=None):
-    # Start med en specificeret base model, eller find den seneste model
-    base_model_path = start_model or get_latest_model()
+def resume_point(db, start_model=None):
+    """(generation, base model) to continue from, according to the training database."""
+    last = db.last_generation()
+    if last is None:
+        # Ny database: registrér eksisterende generationer, så nummereringen fortsætter efter dem
+        existing = list_generation_models()
+        for path in existing:
+            generation, candidate = model_number(path)
+            db.add_model(path, generation, candidate, status=TRAINED)
+        base_model_path = start_model or get_latest_model()
+        # Hvis der er mere end 3 modeller, evaluér for at finde den bedste
+        if not start_model:
+            base_model_path = evaluate_all_models() or base_model_path
+        return max((model_number(path)[0] for path in existing), default=0) + 1, base_model_path
+    if last["finished"] is None:
+        print(f"Genoptager generation {last['generation']}")
+        return last["generation"], last["base_model"]
+    return last["generation"] + 1, start_model or last["best_model"]
 
-    # Hvis der er mere end 3 modeller, evaluér for at finde den bedste
-    if not start_model:
-        base_model_path = evaluate_all_models() or base_model_path
+def train_candidates(db, base_model_path, rows):
+    """Træn de kandidater, der endnu ikke er trænet, og registrér dem efterhånden."""
+    if PARALLEL_CANDIDATES and len(rows) > 1:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(rows), mp_context=context) as executor:
+            futures = {row["path"]: executor.submit(train_model, base_model_path, row["path"], TRAINING_TIMESTEPS, row["seed"]) for row in rows}
+            for path, future in futures.items():
+                db.model_trained(path, *future.result())
+    else:
+        for row in rows:
+            db.model_trained(row["path"], *train_model(base_model_path, row["path"], TRAINING_TIMESTEPS, row["seed"]))
+
+def prune_models(db, best_model_path):
+    """Slet de modeller, der er dårligere end de KEEP_MODELS bedste (men aldrig basen eller ligapuljen)."""
+    if KEEP_MODELS is None:
+        return
+    protected = {best_model_path}
+    if LEAGUE_MODE:
+        protected.update(list_generation_models()[-LEAGUE_POOL_SIZE:])
+    for path in db.dominated(KEEP_MODELS, protected):
+        remove_model_files(path)
+        db.model_pruned(path)
+        print(f"Model fjernet: {path}")
+
+def main(start_model=None):
+    # Fortsæt hvor databasen slap; ellers start med en specificeret base model eller find den seneste model
+    db = TrainingDB(TRAINING_DB)
+    first_generation, base_model_path = resume_point(db, start_model)
 
-    for generation in range(1, GENERATIONS + 1):
+    for generation in range(first_generation, GENERATIONS + 1):
         print(f"=== Generation {generation} ===")
-        new_models = []
+        db.start_generation(generation, base_model_path)
 
-        # Træn 3 nye modeller
-        for i in range(3):
-            new_model_path = os.path.join(MODELS_DIR, f"model_gen{generation}_{i + 1}.zip")
-            train_model(base_model_path, new_model_path, TRAINING_TIMESTEPS)
-            new_models.append(new_model_path)
+        # Træn 3 nye modeller (med faste seeds, så et genoptaget løb træner de samme kandidater)
+        new_models = [os.path.join(MODELS_DIR, f"model_gen{generation}_{i + 1}.zip") for i in range(3)]
+        for i, path in enumerate(new_models):
+            db.add_model(path, generation, i + 1, base_model_path, seed=generation * 1000 + i + 1)
+        started = time.time()
+        train_candidates(db, base_model_path, db.models(generation, PLANNED))
+        train_seconds = time.time() - started
 
         # Evaluér alle modeller
-        scores = {}
-        for model_path in new_models:
-            scores[model_path] = evaluate_model(model_path, EVALUATION_GAMES)
+        started = time.time()
+        scores = evaluate(new_models)
+        for path, score in scores.items():
+            db.model_scored(path, score)
+        eval_seconds = time.time() - started
 
         # Vælg den bedste model
         best_model_path = max(scores, key=scores.get)
         print(f"Bedste model: {best_model_path} med score: {scores[best_model_path]}")
+        db.finish_generation(generation, best_model_path, train_seconds, eval_seconds)
+        prune_models(db, best_model_path)
 
         # Brug den bedste model som base for næste generation
         base_model_path = best_model_path
+    db.close()
 
 if __name__ == "__main__":
     main()
@@ -2,17 +2,27 @@ import gymnasium
 from gymnasium import spaces
 import numpy as np
 import random
+from board_state import SnakeBody
+from env_profiler import profile_phase
+from observation import CHANNELS, encode_snakes, observation_space
 from simple_snake import SimpleSnake
 
 
 class BattlesnakeEnv(gymnasium.Env):
-    def __init__(self, width=11, height=11):
+    def __init__(self, width=11, height=11, profiler=None, observation="board"):
         super(BattlesnakeEnv, self).__init__()
         self.width = width
         self.height = height
 
-        # Observation space: the board as a flat array
-        self.observation_space = spaces.Box(low=0, high=3, shape=(width * height,), dtype=np.int32)
+        # Valgfri EnvProfiler, der måler tiden i hver fase af step
+        self.profiler = profiler
+
+        # Observation space: the board as a flat array, or binary feature planes (see observation.py)
+        self.observation = observation
+        self.observation_space = observation_space(observation, width, height)
+        self._channels = np.zeros((len(CHANNELS), width * height), dtype=np.float32)
+        # Brættet fra den seneste observation, som modstanderen genbruger i næste step
+        self._board = None
 
         # Action space: up, down, left, right
         self.action_space = spaces.Discrete(4)
@@ -28,11 +38,11 @@ class BattlesnakeEnv(gymnasium.Env):
         if seed is not None:
             self.seed(seed)
 
-        self.snake = [
-            {"x": self.width // 2, "y": self.height // 2},
-            {"x": self.width // 2, "y": self.height // 2 + 1},
-            {"x": self.width // 2, "y": self.height // 2 + 2}
-        ]
+        self.snake = SnakeBody([
+            self._cell({"x": self.width // 2, "y": self.height // 2}),
+            self._cell({"x": self.width // 2, "y": self.height // 2 + 1}),
+            self._cell({"x": self.width // 2, "y": self.height // 2 + 2})
+        ])
         self.food = self._generate_food()
         self.done = False
         self.steps = 0
@@ -40,39 +50,57 @@ class BattlesnakeEnv(gymnasium.Env):
 
         # Reset modstanderslangen
         self.opponent.reset(self.width, self.height)
-        self.opponent.body = [
-            {"x": self.width // 4, "y": self.height // 4},
-            {"x": self.width // 4, "y": self.height // 4 + 1},
-            {"x": self.width // 4, "y": self.height // 4 + 2}
-        ]
+        self.opponent.body = SnakeBody([
+            self._cell({"x": self.width // 4, "y": self.height // 4}),
+            self._cell({"x": self.width // 4, "y": self.height // 4 + 1}),
+            self._cell({"x": self.width // 4, "y": self.height // 4 + 2})
+        ])
 
-        return self._get_observation(), {}
+        return self._observe(), {}
 
     def step(self, action):
         """Tag et trin i miljøet."""
+        if self.profiler is None:
+            return self._step(action)
+
+        with self.profiler.phase("step"):
+            result = self._step(action)
+        self.profiler.count("env_steps")
+        if result[2]:
+            self.profiler.episode_end(self.steps)
+        return result
+
+    def _step(self, action):
         direction = self._get_direction(action)
-        new_head = {"x": self.snake[0]["x"] + direction["x"], "y": self.snake[0]["y"] + direction["y"]}
+        head = self._point(self.snake.head)
+        new_head = {"x": head["x"] + direction["x"], "y": head["y"] + direction["y"]}
 
         # Modstanderen foretager et træk
-        opponent_board = self._get_observation().reshape(self.height, self.width)  # Sørg for 2D-format
-        opponent_action = self.opponent.get_action(opponent_board)
+        board = self._board if self._board is not None else self._get_observation()
+        self._board = None
+        opponent_board = board.reshape(self.height, self.width)  # Sørg for 2D-format
+        with profile_phase(self.profiler, "opponent"):
+            opponent_action = self.opponent.get_action(opponent_board)
         opponent_direction = self._get_direction(opponent_action)
         opponent_new_head = {
             "x": self.opponent.head["x"] + opponent_direction["x"],
             "y": self.opponent.head["y"] + opponent_direction["y"],
         }
 
-        player_collision = (
-            not self._is_within_bounds(new_head) or
-            new_head in self.snake or
-            new_head in self.opponent.body
-        )
-
-        opponent_collision = (
-            not self._is_within_bounds(opponent_new_head) or
-            opponent_new_head in self.opponent.body or
-            opponent_new_head in self.snake
-        )
+        with profile_phase(self.profiler, "collisions"):
+            new_cell = self._cell(new_head)
+            player_collision = (
+                not self._is_within_bounds(new_head) or
+                new_cell in self.snake or
+                new_cell in self.opponent.body
+            )
+
+            opponent_new_cell = self._cell(opponent_new_head)
+            opponent_collision = (
+                not self._is_within_bounds(opponent_new_head) or
+                opponent_new_cell in self.opponent.body or
+                opponent_new_cell in self.snake
+            )
 
         step_data = {
             "you": {
@@ -85,7 +113,7 @@ class BattlesnakeEnv(gymnasium.Env):
             "board": {
                 "width": self.width,
                 "height": self.height,
-                "food": [{"x": self.food["x"], "y": self.food["y"]}],
+                "food": [self.food],
                 "snakes": [
                     {"id": "PlayerSnake", "body": self.snake, "head": new_head},
                     {"id": "OpponentSnake", "body": self.opponent.body, "head": opponent_new_head}
@@ -98,23 +126,24 @@ class BattlesnakeEnv(gymnasium.Env):
             #self.done = True
             step_data["you"]["health"] = 0
             reward = self._calculate_reward(step_data)
-            return self._get_observation(), reward, self.done, False, {}
+            return self._observe(), reward, self.done, False, {}
 
         if opponent_collision:
             #self.done = True
             step_data["winnerName"] = "PlayerSnake"
             reward = self._calculate_reward(step_data)
-            return self._get_observation(), reward, self.done, False, {}
+            return self._observe(), reward, self.done, False, {}
 
-        if new_head == self.food:
+        if new_cell == self.food:
             reward = 100  # Belønning for mad
             self.health = min(100, self.health + 20)  # Øg sundhed med 20, men maksimer ved 100
-            self.food = self._generate_food()
+            with profile_phase(self.profiler, "food"):
+                self.food = self._generate_food()
         else:
             reward = -1  # Straf for ikke at spise mad
             self.snake.pop()
 
-        self.snake.insert(0, new_head)  # Slangen vokser altid ved at indsætte nyt hoved
+        self.snake.push(new_cell)  # Slangen vokser altid ved at indsætte nyt hoved
 
         self.opponent.move(opponent_new_head)
 
@@ -126,32 +155,47 @@ class BattlesnakeEnv(gymnasium.Env):
 
         reward += self._calculate_reward(step_data)
 
-        return self._get_observation(), reward, self.done, False, {}
+        return self._observe(), reward, self.done, False, {}
+
+    def _observe(self):
+        """The observation step and reset return; the board is kept for the opponent's next move."""
+        if self.observation == "channels":
+            with profile_phase(self.profiler, "observation"):
+                encode_snakes(self._channels, self.snake, [self.opponent.body], [self.food], self.health)
+            return self._channels.reshape(-1).copy()
+        self._board = self._get_observation()
+        return self._board
 
     def _get_observation(self):
-        board = np.zeros((self.width, self.height), dtype=np.int32)
+        with profile_phase(self.profiler, "observation"):
+            board = np.zeros(self.width * self.height, dtype=np.int32)
 
-        board[self.snake[0]["y"], self.snake[0]["x"]] = 1
-        for segment in self.snake[1:]:
-            board[segment["y"], segment["x"]] = 2
+            # Hovederne skrives efter kroppene, så de ender samme sted som før
+            board[list(self.snake)] = 2
+            board[self.snake.head] = 1
 
-        board[self.opponent.head["y"], self.opponent.head["x"]] = 3
-        for segment in self.opponent.body[1:]:
-            board[segment["y"], segment["x"]] = 4
+            board[list(self.opponent.body)] = 4
+            board[self.opponent.body.head] = 3
 
-        board[self.food["y"], self.food["x"]] = 5
+            board[self.food] = 5
 
-        return board.flatten()
+            return board
 
     def _generate_food(self):
         while True:
-            food = {"x": random.randint(0, self.width - 1), "y": random.randint(0, self.height - 1)}
+            food = self._cell({"x": random.randint(0, self.width - 1), "y": random.randint(0, self.height - 1)})
             if food not in self.snake and food not in self.opponent.body:
                 return food
 
     def _is_within_bounds(self, position):
         return 0 <= position["x"] < self.width and 0 <= position["y"] < self.height
 
+    def _cell(self, position):
+        return position["y"] * self.width + position["x"]
+
+    def _point(self, cell):
+        return {"x": cell % self.width, "y": cell // self.width}
+
     def _get_direction(self, action):
         directions = {
             "up": {"x": 0, "y": -1},
@@ -172,49 +216,56 @@ class BattlesnakeEnv(gymnasium.Env):
         return [seed]
 
     def _calculate_reward(self, step_data):
-        reward = 0
+        with profile_phase(self.profiler, "reward"):
+            reward = 0
 
-        # Belønning for at spise mad
-        reward += self.reward_for_food(step_data)
+            # Belønning for at spise mad
+            reward += self.reward_for_food(step_data)
 
-        # Straf for kollisioner
-        reward += self.penalty_for_collisions(step_data)
+            # Straf for kollisioner
+            reward += self.penalty_for_collisions(step_data)
 
-        # Belønning for overlevelse
-        reward += 1
+            # Belønning for overlevelse
+            reward += 1
 
-        return reward
+            return reward
 
     def reward_for_food(self, step_data):
         reward = 0
         if 'board' in step_data and 'food' in step_data['board']:
-            food_positions = [(food['x'], food['y']) for food in step_data['board']['food']]
             if 'you' in step_data and 'head' in step_data['you']:
-                head_position = (step_data['you']['head']['x'], step_data['you']['head']['y'])
-                if head_position in food_positions:
+                head_position = step_data['you']['head']
+                if self._is_within_bounds(head_position) and self._cell(head_position) in step_data['board']['food']:
                     reward += 100  # Belønning for at spise mad
         return reward
 
     def penalty_for_collisions(self, step_data):
         penalty = 0
         if 'you' in step_data and 'head' in step_data['you']:
-            head_position = (step_data['you']['head']['x'], step_data['you']['head']['y'])
+            head_position = step_data['you']['head']
 
-            if (head_position[0] < 0 or head_position[0] >= self.width or
-                    head_position[1] < 0 or head_position[1] >= self.height):
+            if not self._is_within_bounds(head_position):
                 penalty -= 500  # Høj straf for at ramme væggen
+                return penalty
 
-            elif head_position in [(segment['x'], segment['y']) for segment in step_data['you']['body'][1:]]:
+            head_cell = self._cell(head_position)
+            body = step_data['you']['body']
+            if head_cell in body and head_cell != body.head:
                 penalty -= 500  # Høj straf for at ramme egen krop
 
             for snake in step_data['board']['snakes']:
                 if snake['id'] != step_data['you']['id']:
-                    opponent_positions = [(segment['x'], segment['y']) for segment in snake['body']]
-                    if head_position in opponent_positions:
+                    if head_cell in snake['body']:
                         penalty -= 500  # Høj straf for at ramme modstanderens krop
 
         return penalty
 
+    def action_masks(self):
+        """Bool per action: True if it does not hit a wall or a body this step (all True if none is safe)."""
+        safe_moves = self._get_safe_moves(self._point(self.snake.head))
+        mask = np.array([move in safe_moves for move in ["up", "down", "left", "right"]])
+        return mask if mask.any() else np.ones(4, dtype=bool)
+
     def _get_safe_moves(self, head_position):
         """Return a list of safe moves based on the current head position."""
         safe_moves = []
@@ -228,8 +279,8 @@ class BattlesnakeEnv(gymnasium.Env):
         for move, delta in directions.items():
             new_position = {"x": head_position["x"] + delta["x"], "y": head_position["y"] + delta["y"]}
             if self._is_within_bounds(new_position) and \
-               new_position not in self.snake and \
-               new_position not in self.opponent.body:
+               self._cell(new_position) not in self.snake and \
+               self._cell(new_position) not in self.opponent.body:
                 safe_moves.append(move)
 
         return safe_moves
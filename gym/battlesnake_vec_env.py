@@ -0,0 +1,302 @@
+import random
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from env_profiler import profile_phase
+from observation import BatchEncoder, observation_space
+
+# Samme rækkefølge som BattlesnakeEnv._get_direction: up, down, left, right
+MOVES = ["up", "down", "left", "right"]
+DX = np.array([0, 0, -1, 1], dtype=np.int64)
+DY = np.array([-1, 1, 0, 0], dtype=np.int64)
+
+
+class BatchedVecEnv(VecEnv):
+    """VecEnv plumbing for envs that hold all their games in one object.
+
+    Attributes belong to the whole batch, so get_attr() returns the same value for
+    every env and set_attr() only accepts indices that cover every env. Batched
+    methods (e.g. action_masks) return one row per env, which env_method() splits.
+    Subclasses set `recorder` (an optional ReplayWriter), which close() flushes.
+    """
+
+    recorder = None
+
+    def close(self):
+        # Den sidste, halvfulde chunk skrives, før miljøet lukkes
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        if len(set(self._get_indices(indices))) != self.num_envs:
+            raise ValueError(f"{attr_name} is shared by all {self.num_envs} envs and cannot be set for some of them")
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        """Call a batched method once and split its result per env."""
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result[env_idx] for env_idx in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+
+class BattlesnakeVecEnv(BatchedVecEnv):
+    """N BattlesnakeEnv games held as NumPy arrays and advanced in one step() call.
+
+    Every board is stored as flat cell indices (y * width + x): ring-buffer bodies
+    for both snakes, boolean occupancy grids, health, food and the last observation.
+    The rules, rewards and observations match BattlesnakeEnv.step exactly, including
+    the opponent (SimpleSnake) and the random food placement, so a seeded env here
+    replays the same game as a seeded BattlesnakeEnv.
+    """
+
+    def __init__(self, n_envs=1, width=11, height=11, profiler=None, recorder=None, observation="board"):
+        self.width = width
+        self.height = height
+        self.render_mode = None
+
+        # Valgfri EnvProfiler, der måler tiden i hver fase af step_wait
+        self.profiler = profiler
+        # Valgfri ReplayWriter, der gemmer hver tur (bræt, handling, belønning)
+        self.recorder = recorder
+        # "channels" giver agenten featureplaner (observation.py); modstanderen ser altid brættet
+        self.observation = observation
+        self._encoder = BatchEncoder(n_envs, width, height) if observation == "channels" else None
+
+        cells = width * height
+        self._cells = cells
+        self._index = np.arange(n_envs)
+
+        # Ring buffers med hovedet ved _head og kroppen bagud i bufferen
+        self._body = np.zeros((n_envs, cells), dtype=np.int64)
+        self._head = np.zeros(n_envs, dtype=np.int64)
+        self._length = np.zeros(n_envs, dtype=np.int64)
+        self._opp_body = np.zeros((n_envs, cells), dtype=np.int64)
+        self._opp_head = np.zeros(n_envs, dtype=np.int64)
+        self._opp_length = np.zeros(n_envs, dtype=np.int64)
+
+        self._occupied = np.zeros((n_envs, cells), dtype=bool)
+        self._opp_occupied = np.zeros((n_envs, cells), dtype=bool)
+        self._food = np.zeros(n_envs, dtype=np.int64)
+        self._health = np.zeros(n_envs, dtype=np.int64)
+        self._steps = np.zeros(n_envs, dtype=np.int64)
+        self._obs = np.zeros((n_envs, cells), dtype=np.int32)
+        self._rngs = [random.Random() for _ in range(n_envs)]
+        self._actions = np.zeros(n_envs, dtype=np.int64)
+
+        # Manhattan-diamanter til SimpleSnake._heuristic_space for alle celler på én gang
+        ys, xs = np.divmod(np.arange(cells), width)
+        distance = np.abs(xs[:, None] - xs[None, :]) + np.abs(ys[:, None] - ys[None, :])
+        self._diamonds = (distance <= min(width, height)).astype(np.float32)
+
+        super().__init__(n_envs, observation_space(observation, width, height), spaces.Discrete(4))
+
+        # BattlesnakeEnv.__init__ nulstiller også én gang, før den seedes
+        for env_idx in range(n_envs):
+            self._reset_env(env_idx)
+        self._update_observation()
+
+    def reset(self):
+        for env_idx in range(self.num_envs):
+            if self._seeds[env_idx] is not None:
+                self._rngs[env_idx].seed(self._seeds[env_idx])
+            self._reset_env(env_idx)
+        self._update_observation()
+        self._reset_seeds()
+        self._reset_options()
+        return self._agent_obs().copy()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+
+    def step_wait(self):
+        if self.profiler is None:
+            return self._step_wait()
+
+        with self.profiler.phase("step"):
+            result = self._step_wait()
+        self.profiler.count("env_steps", self.num_envs)
+        return result
+
+    def _step_wait(self):
+        w, h = self.width, self.height
+        index = self._index
+        if self.recorder is not None:
+            frames, health, turns = self._obs.copy(), self._health.copy(), self._steps.copy()
+
+        head = self._body[index, self._head]
+        new_x = head % w + DX[self._actions]
+        new_y = head // w + DY[self._actions]
+        in_bounds = (new_x >= 0) & (new_x < w) & (new_y >= 0) & (new_y < h)
+        new_head = np.where(in_bounds, new_y * w + new_x, 0)
+
+        # Modstanderen vælger sit træk ud fra den nuværende observation
+        with profile_phase(self.profiler, "opponent"):
+            opp_actions = self._opponent_actions()
+        opp_head = self._opp_body[index, self._opp_head]
+        opp_x = opp_head % w + DX[opp_actions]
+        opp_y = opp_head // w + DY[opp_actions]
+        opp_in_bounds = (opp_x >= 0) & (opp_x < w) & (opp_y >= 0) & (opp_y < h)
+        opp_new_head = np.where(opp_in_bounds, opp_y * w + opp_x, 0)
+
+        with profile_phase(self.profiler, "collisions"):
+            hit_self = in_bounds & self._occupied[index, new_head]
+            hit_opponent = in_bounds & self._opp_occupied[index, new_head]
+            player_collision = ~in_bounds | hit_self | hit_opponent
+            opponent_collision = ~opp_in_bounds | self._opp_occupied[index, opp_new_head] | self._occupied[index, opp_new_head]
+            on_food = in_bounds & (new_head == self._food)
+
+        # Kollisioner: intet flytter sig, kun _calculate_reward tæller
+        rewards = 100 * on_food + 1 - 500 * (~in_bounds * 1 + hit_self + hit_opponent)
+
+        moving = ~player_collision & ~opponent_collision
+        eating = moving & on_food
+        growing = np.flatnonzero(eating)
+        with profile_phase(self.profiler, "food"):
+            for env_idx in growing:
+                # Som _generate_food: ny mad undgår de gamle kroppe, før nogen har flyttet sig
+                self._food[env_idx] = self._generate_food(env_idx)
+
+        with profile_phase(self.profiler, "move"):
+            movers = np.flatnonzero(moving)
+            shrinking = np.flatnonzero(moving & ~on_food)
+            tail = (self._head[shrinking] + self._length[shrinking] - 1) % self._cells
+            self._occupied[shrinking, self._body[shrinking, tail]] = False
+            self._length[shrinking] -= 1
+            self._push(self._body, self._head, self._length, self._occupied, movers, new_head[movers])
+
+            opp_tail = (self._opp_head[movers] + self._opp_length[movers] - 1) % self._cells
+            self._push(self._opp_body, self._opp_head, self._opp_length, self._opp_occupied, movers, opp_new_head[movers])
+            self._opp_occupied[movers, self._opp_body[movers, opp_tail]] = False
+            self._opp_length[movers] -= 1
+
+        self._health[growing] = np.minimum(100, self._health[growing] + 20)
+        self._health[movers] -= 1
+        self._steps[movers] += 1
+        dones = moving & (self._health <= 0)
+
+        head_on = moving & (new_head == opp_new_head)
+        rewards = np.where(moving, np.where(eating, 201, 0) - 500 * head_on, rewards)
+
+        self._update_observation()
+        infos = [{"TimeLimit.truncated": False} for _ in range(self.num_envs)]
+        ended = np.flatnonzero(dones)
+        for env_idx in ended:
+            infos[env_idx]["terminal_observation"] = self._agent_obs()[env_idx].copy()
+            if self.profiler is not None:
+                self.profiler.episode_end(self._steps[env_idx])
+            self._reset_env(env_idx)
+        if len(ended):
+            self._update_observation()
+
+        if self.recorder is not None:
+            self.recorder.record_steps(frames, self._actions, rewards, dones, health, turns)
+        return self._agent_obs().copy(), rewards.astype(np.float32), dones, infos
+
+    def action_masks(self):
+        """(n_envs, 4) bools: the actions that do not hit a wall or a body this step, by the rules of step_wait.
+
+        A board where every action is fatal allows all four, so a masked policy
+        still has a distribution to sample from.
+        """
+        w, h = self.width, self.height
+        index = self._index
+        head = self._body[index, self._head]
+        new_x = (head % w)[:, None] + DX
+        new_y = (head // w)[:, None] + DY
+        in_bounds = (new_x >= 0) & (new_x < w) & (new_y >= 0) & (new_y < h)
+        cells = np.where(in_bounds, new_y * w + new_x, 0)
+        blocked = self._occupied | self._opp_occupied
+        masks = in_bounds & ~blocked[index[:, None], cells]
+        masks[~masks.any(axis=1)] = True
+        return masks
+
+    def _reset_env(self, env_idx):
+        """Reset one game exactly like BattlesnakeEnv.reset."""
+        w, h = self.width, self.height
+        self._occupied[env_idx] = False
+        self._head[env_idx] = 0
+        self._length[env_idx] = 0
+        for offset in (2, 1, 0):
+            self._push_one(self._body, self._head, self._length, self._occupied, env_idx, (h // 2 + offset) * w + w // 2)
+
+        # BattlesnakeEnv genererer maden, mens modstanderen stadig har sin gamle krop
+        self._food[env_idx] = self._generate_food(env_idx)
+        self._health[env_idx] = 100
+        self._steps[env_idx] = 0
+
+        self._opp_occupied[env_idx] = False
+        self._opp_head[env_idx] = 0
+        self._opp_length[env_idx] = 0
+        for offset in (2, 1, 0):
+            self._push_one(self._opp_body, self._opp_head, self._opp_length, self._opp_occupied, env_idx, (h // 4 + offset) * w + w // 4)
+
+    def _push(self, body, head, length, occupied, rows, cells):
+        head[rows] = (head[rows] - 1) % self._cells
+        body[rows, head[rows]] = cells
+        occupied[rows, cells] = True
+        length[rows] += 1
+
+    def _push_one(self, body, head, length, occupied, env_idx, cell):
+        head[env_idx] = (head[env_idx] - 1) % self._cells
+        body[env_idx, head[env_idx]] = cell
+        occupied[env_idx, cell] = True
+        length[env_idx] += 1
+
+    def _generate_food(self, env_idx):
+        rng = self._rngs[env_idx]
+        blocked = self._occupied[env_idx] | self._opp_occupied[env_idx]
+        while True:
+            x = rng.randint(0, self.width - 1)
+            y = rng.randint(0, self.height - 1)
+            if not blocked[y * self.width + x]:
+                return y * self.width + x
+
+    def _update_observation(self):
+        """Vectorized BattlesnakeEnv._get_observation for all boards."""
+        with profile_phase(self.profiler, "observation"):
+            index = self._index
+            obs = self._obs
+            np.multiply(self._occupied, 2, out=obs)
+            obs[index, self._body[index, self._head]] = 1
+            obs[self._opp_occupied] = 4
+            obs[index, self._opp_body[index, self._opp_head]] = 3
+            obs[index, self._food] = 5
+            if self._encoder is not None:
+                self._encoder.encode(self._body, self._head, self._length, self._occupied,
+                                     self._opp_body, self._opp_head, self._opp_length, self._opp_occupied,
+                                     self._food, self._health)
+
+    def _agent_obs(self):
+        """The observations the agent sees: the boards, or their feature planes."""
+        return self._obs if self._encoder is None else self._encoder.buffer
+
+    def _opponent_actions(self):
+        """Vectorized SimpleSnake.get_action on the current observations."""
+        w, h = self.width, self.height
+        index = self._index
+        board = self._obs
+
+        head = self._opp_body[index, self._opp_head]
+        x = head % w + DX[:, None]
+        y = head // w + DY[:, None]
+        in_bounds = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        cells = np.where(in_bounds, y * w + x, 0).T
+        values = board[index[:, None], cells]
+        valid = in_bounds.T & ((values == 0) | (values == 5))
+        food = valid & (values == 5)
+
+        space = (board == 0).astype(np.float32) @ self._diamonds
+        scores = np.where(valid, space[index[:, None], cells], -1)
+
+        actions = np.where(food.any(axis=1), food.argmax(axis=1), scores.argmax(axis=1))
+        for env_idx in np.flatnonzero(~valid.any(axis=1)):
+            # Fallback: tilfældig handling
+            actions[env_idx] = MOVES.index(self._rngs[env_idx].choice(MOVES))
+        return actions
@@ -0,0 +1,174 @@
+"""Behaviour cloning: warm-start PPO from the heuristic snake in snake/main.py.
+
+    python behavior_cloning.py --games 5000 --workers 8 --epochs 10
+
+Games between heuristic snakes are played with game_engine in parallel processes.
+Every move is recorded as a replay row (the mover's board as an env observation
+plus the move as an env action). Supervised training of a fresh SB3 MlpPolicy
+then streams the rows from the memory-mapped shards. The result is saved as
+models/pretrained.zip, which auto-training's train_model() starts from when
+there is no base model.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from board_state import BoardState
+from game_engine import Game
+from replay import GameRecorder, ReplayDataset
+
+SNAKE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "snake")
+DATA_DIR = os.path.join("replays", "heuristic")
+PRETRAINED_MODEL = os.path.join("models", "pretrained.zip")
+# Samme hyperparametre som train_model i auto-training.py
+LEARNING_RATE = 0.0003
+ENT_COEF = 0.005
+N_ENVS = 8
+
+
+def _heuristic():
+    sys.path.insert(0, SNAKE_DIR)
+    from main import choose_move
+
+    return choose_move
+
+
+def _record_games(directory, seeds, n_snakes, explore, settings):
+    """Play the heuristic against itself for every seed and record each seat's moves."""
+    choose_move = _heuristic()
+    recorder = GameRecorder(directory, prefix="heuristic")
+
+    for seed in seeds:
+        rng = random.Random(seed)
+
+        def teacher(data):
+            state = BoardState.from_request(data)
+            move = choose_move(data, state)
+            recorder.record_move(data, move, state)
+            # Af og til et tilfældigt træk, så der også er data fra dårlige stillinger
+            if rng.random() < explore:
+                return rng.choice(["up", "down", "left", "right"])
+            return move
+
+        teacher.end = recorder.end_game
+        Game({f"heuristic-{i + 1}": teacher for i in range(n_snakes)}, seed=seed, **settings).play()
+    recorder.close()
+    return len(seeds)
+
+
+def generate(directory=DATA_DIR, games=1000, seed=0, workers=None, n_snakes=2, explore=0.05, **settings):
+    """Record `games` heuristic games into `directory`, one shard per worker process.
+
+    `explore` is the chance that a snake plays a random move instead of its label,
+    so the data also covers positions the heuristic would not walk into itself.
+    """
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count()
+    seeds = list(range(seed, seed + games))
+    chunks = [seeds[i::workers] for i in range(workers) if seeds[i::workers]]
+    if len(chunks) == 1:
+        return _record_games(directory, chunks[0], n_snakes, explore, settings)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=context) as executor:
+        futures = [executor.submit(_record_games, directory, chunk, n_snakes, explore, settings) for chunk in chunks]
+        return sum(future.result() for future in futures)
+
+
+def make_model(env=None):
+    """A fresh PPO model like the one train_model() would create."""
+    from stable_baselines3 import PPO
+    from battlesnake_vec_env import BattlesnakeVecEnv
+
+    env = env or BattlesnakeVecEnv(n_envs=N_ENVS)
+    return PPO("MlpPolicy", env, verbose=1, device="cpu", learning_rate=LEARNING_RATE, ent_coef=ENT_COEF)
+
+
+def accuracy(policy, dataset, indices, batch_size=4096):
+    """Share of rows in `indices` where the policy's greedy action equals the recorded one."""
+    import torch
+
+    correct = 0
+    with torch.no_grad():
+        for start in range(0, len(indices), batch_size):
+            batch = dataset.gather(indices[start:start + batch_size])
+            obs = torch.as_tensor(batch["frames"], dtype=torch.float32)
+            actions = policy.get_distribution(obs).distribution.probs.argmax(dim=1).numpy()
+            correct += int((actions == batch["actions"]).sum())
+    return correct / max(len(indices), 1)
+
+
+def pretrain(dataset, model=None, epochs=5, batch_size=512, learning_rate=1e-3, validation=0.05, seed=0):
+    """Fit the model's policy head to the recorded actions with cross-entropy.
+
+    Batches are gathered from the memory-mapped shards, so the dataset does not
+    have to fit in memory. A `validation` share of the rows is held out and its
+    accuracy is printed after every epoch. Returns the model.
+    """
+    import torch
+
+    model = model or make_model()
+    policy = model.policy
+    policy.set_training_mode(True)
+    optimizer = torch.optim.Adam(policy.parameters(), lr=learning_rate)
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(dataset))
+    held_out = order[:int(len(order) * validation)]
+    train = order[len(held_out):]
+
+    for epoch in range(1, epochs + 1):
+        rng.shuffle(train)
+        total_loss = 0.0
+        for start in range(0, len(train), batch_size):
+            batch = dataset.gather(train[start:start + batch_size])
+            obs = torch.as_tensor(batch["frames"], dtype=torch.float32)
+            actions = torch.as_tensor(batch["actions"], dtype=torch.int64)
+            loss = -policy.get_distribution(obs).log_prob(actions).mean()
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(actions)
+        policy.set_training_mode(False)
+        print(f"Epoke {epoch}: loss {total_loss / max(len(train), 1):.4f}, "
+              f"validering {accuracy(policy, dataset, held_out):.1%}")
+        policy.set_training_mode(True)
+
+    policy.set_training_mode(False)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=DATA_DIR, help="Replay directory with heuristic games")
+    parser.add_argument("--games", type=int, default=2000, help="Games to record first (0 = only use existing data)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--snakes", type=int, default=2, help="Heuristic snakes per game")
+    parser.add_argument("--explore", type=float, default=0.05)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--output", default=PRETRAINED_MODEL)
+    args = parser.parse_args()
+
+    if args.games:
+        generate(args.data, args.games, args.seed, args.workers, args.snakes, args.explore)
+    dataset = ReplayDataset(args.data)
+    print(f"{len(dataset)} træk fra {len(dataset.shards)} shards")
+    if not len(dataset):
+        sys.exit(f"Ingen 11x11-data i {args.data}")
+
+    model = pretrain(dataset, epochs=args.epochs, batch_size=args.batch_size,
+                     learning_rate=args.learning_rate, seed=args.seed)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    model.save(args.output)
+    print(f"Model gemt: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
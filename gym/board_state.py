@@ -0,0 +1,132 @@
+from collections import deque
+
+
+def mask_cells(mask):
+    """List the cells set in a bitmask, lowest first."""
+    cells = []
+    while mask:
+        low = mask & -mask
+        cells.append(low.bit_length() - 1)
+        mask ^= low
+    return cells
+
+
+class SnakeBody:
+    """Snake body as int cells (y * width + x), head first, with an occupancy bitmask.
+
+    Membership tests are a single bit test on `mask` instead of a scan over the body.
+    Stacked tail segments (start of game, right after eating) are allowed: a cell only
+    leaves the mask once the last segment on it is popped.
+    """
+
+    __slots__ = ("cells", "mask")
+
+    def __init__(self, cells=()):
+        self.cells = deque(cells)
+        self.mask = 0
+        for cell in self.cells:
+            self.mask |= 1 << cell
+
+    @property
+    def head(self):
+        return self.cells[0]
+
+    @property
+    def tail(self):
+        return self.cells[-1]
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def __contains__(self, cell):
+        return cell >= 0 and (self.mask >> cell) & 1 == 1
+
+    def push(self, cell):
+        """Add a new head."""
+        self.cells.appendleft(cell)
+        self.mask |= 1 << cell
+
+    def pop(self):
+        """Remove and return the tail segment."""
+        cell = self.cells.pop()
+        # Cellen kan stadig være dækket af en stablet hale eller et hoved, der lige er rykket ind på halen
+        if not self.cells or self.cells[-1] != cell and self.cells[0] != cell:
+            self.mask &= ~(1 << cell)
+        return cell
+
+    def copy(self):
+        body = SnakeBody.__new__(SnakeBody)
+        body.cells = self.cells.copy()
+        body.mask = self.mask
+        return body
+
+    def points(self, width):
+        """Return the body as Battlesnake API {"x", "y"} dicts."""
+        return [{"x": cell % width, "y": cell // width} for cell in self.cells]
+
+
+class BoardState:
+    """Battlesnake board with int-encoded cells and bitmask occupancy."""
+
+    __slots__ = ("width", "height", "snakes", "health", "food")
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.snakes = {}
+        self.health = {}
+        self.food = 0
+
+    @classmethod
+    def from_request(cls, data):
+        """Build the state from a Battlesnake API /move payload."""
+        board = data["board"]
+        state = cls(board["width"], board["height"])
+        for snake in board["snakes"]:
+            state.add_snake(snake["id"], snake["body"], snake["health"])
+        you = data["you"]
+        if you["id"] not in state.snakes:
+            state.add_snake(you["id"], you["body"], you["health"])
+        for food in board["food"]:
+            state.food |= 1 << state.cell(food["x"], food["y"])
+        return state
+
+    def add_snake(self, snake_id, body, health=100):
+        self.snakes[snake_id] = SnakeBody(self.cell(point["x"], point["y"]) for point in body)
+        self.health[snake_id] = health
+
+    def cell(self, x, y):
+        return y * self.width + x
+
+    def point(self, cell):
+        return {"x": cell % self.width, "y": cell // self.width}
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    @property
+    def occupied(self):
+        """Bitmask of every cell covered by a snake."""
+        mask = 0
+        for body in self.snakes.values():
+            mask |= body.mask
+        return mask
+
+    def is_free(self, x, y):
+        """True if (x, y) is on the board and not covered by any snake."""
+        return self.in_bounds(x, y) and not (self.occupied >> (y * self.width + x)) & 1
+
+    def food_cells(self):
+        return mask_cells(self.food)
+
+    def copy(self):
+        state = BoardState.__new__(BoardState)
+        state.width = self.width
+        state.height = self.height
+        state.snakes = {snake_id: body.copy() for snake_id, body in self.snakes.items()}
+        state.health = dict(self.health)
+        state.food = self.food
+        return state
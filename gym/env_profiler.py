@@ -0,0 +1,161 @@
+import json
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import nullcontext
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+_NO_PHASE = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "started", "memory")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.track_memory:
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        profiler = self.profiler
+        profiler.seconds[self.name] += time.perf_counter() - self.started
+        profiler.calls[self.name] += 1
+        if profiler.track_memory:
+            profiler.allocated[self.name] += max(0, tracemalloc.get_traced_memory()[0] - self.memory)
+        return False
+
+
+class EnvProfiler:
+    """Opt-in timings and counters for the training envs' hot path.
+
+    BattlesnakeEnv and BattlesnakeVecEnv take one as `profiler=` and time their
+    phases ("step" around the whole step, and inside it "observation",
+    "opponent", "collisions", "reward", "food", ...). Phases nest, so their share
+    is relative to "step". With track_memory=True tracemalloc also records the bytes
+    each phase leaves allocated. That costs far more than the timing itself.
+    Only envs in the same process report here, not SharedMemoryVecEnv workers.
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.reset()
+
+    def reset(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.allocated = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.episode_lengths = []
+        self.started = time.perf_counter()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def episode_end(self, length):
+        self.episode_lengths.append(int(length))
+
+    def summary(self):
+        """Everything recorded since the last reset as a JSON-friendly dict."""
+        elapsed = time.perf_counter() - self.started
+        step_seconds = self.seconds.get("step", 0.0)
+        phases = {}
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            phases[name] = {
+                "calls": self.calls[name],
+                "seconds": round(seconds, 6),
+                "mean_us": round(seconds / self.calls[name] * 1e6, 3),
+                "share_of_step": round(seconds / step_seconds, 4) if step_seconds else None,
+            }
+            if self.track_memory:
+                phases[name]["allocated_bytes"] = self.allocated[name]
+        lengths = self.episode_lengths
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "env_steps": self.counters.get("env_steps", 0),
+            "env_steps_per_second": round(self.counters.get("env_steps", 0) / step_seconds, 1) if step_seconds else None,
+            "env_share_of_elapsed": round(step_seconds / elapsed, 4) if elapsed else None,
+            "phases": phases,
+            "counters": dict(self.counters),
+            "episodes": len(lengths),
+            "episode_length_mean": round(sum(lengths) / len(lengths), 2) if lengths else None,
+            "episode_length_max": max(lengths) if lengths else None,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def profile_phase(profiler, name):
+    """Context manager timing `name` on `profiler`; a shared no-op when profiler is None."""
+    return _NO_PHASE if profiler is None else _Phase(profiler, name)
+
+
+class ProfilerCallback(BaseCallback):
+    """Log an EnvProfiler to SB3's logger (stdout/TensorBoard) after every rollout.
+
+    Rollout wall time is split into env time (the profiler's "step" phase) and the
+    rest (policy forward passes, buffer bookkeeping). Time from one rollout's end to
+    the next one's start is the gradient update. If `path` is set, the profiler's
+    summary is written there at the end of training.
+    """
+
+    def __init__(self, profiler, path=None, verbose=0):
+        super().__init__(verbose)
+        self.profiler = profiler
+        self.path = path
+        self._rollout_started = None
+        self._rollout_ended = None
+        self._rollout_timesteps = 0
+        self._step_seconds = 0.0
+        self._phase_seconds = {}
+        self._phase_calls = {}
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self._rollout_ended is not None:
+            self.logger.record("env_profile/train_seconds", now - self._rollout_ended)
+        self._rollout_started = now
+        self._rollout_timesteps = self.num_timesteps
+        self._phase_seconds = dict(self.profiler.seconds)
+        self._phase_calls = dict(self.profiler.calls)
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        now = time.perf_counter()
+        self._rollout_ended = now
+        rollout_seconds = now - self._rollout_started
+        steps = self.num_timesteps - self._rollout_timesteps
+        self.logger.record("env_profile/rollout_seconds", rollout_seconds)
+        self.logger.record("env_profile/timesteps_per_second", steps / rollout_seconds if rollout_seconds else 0.0)
+
+        seconds = self.profiler.seconds
+        calls = self.profiler.calls
+        env_seconds = seconds.get("step", 0.0) - self._phase_seconds.get("step", 0.0)
+        if env_seconds:
+            self.logger.record("env_profile/env_share_of_rollout", env_seconds / rollout_seconds)
+        for name in seconds:
+            delta_calls = calls[name] - self._phase_calls.get(name, 0)
+            if delta_calls:
+                delta_seconds = seconds[name] - self._phase_seconds.get(name, 0.0)
+                self.logger.record(f"env_profile/{name}_mean_us", delta_seconds / delta_calls * 1e6)
+        lengths = self.profiler.episode_lengths
+        if lengths:
+            recent = lengths[-100:]
+            self.logger.record("env_profile/episode_length_mean", sum(recent) / len(recent))
+
+    def _on_training_end(self):
+        if self.path:
+            self.profiler.save(self.path)
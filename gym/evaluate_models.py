@@ -1,29 +1,12 @@
-from stable_baselines3 import PPO
-from battlesnake_env import BattlesnakeEnv
+from evaluation import evaluate_models
 
 models = ["model1.zip", "model2.zip", "model3.zip", "model4.zip"]
 
-scores = {}
+# Samme 100 seedede spil for hver model, spillet parallelt og cachet på filens hash
+scores = evaluate_models(models, range(100), cache_path="evaluation_cache.json")
 
-for model_path in models:
-    print(f"Evaluating model: {model_path}")
-    model = PPO.load(model_path)
-    score = 0
-
-    env = BattlesnakeEnv()
-
-    obs, _ = env.reset()
-
-    for _ in range(1000):
-        action, _ = model.predict(obs, deterministic=True)
-
-        obs, reward, done, truncated, _ = env.step(action)
-        score += reward
-
-        if done or truncated:
-            obs, _ = env.reset()
-
-    scores[model_path] = score
+for model_path, score in scores.items():
+    print(f"Evaluating model: {model_path}: {score}")
 
 best_model = max(scores, key=scores.get)
 print(f"Best model: {best_model} with score: {scores[best_model]}")
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Et spil, hvor begge slanger er låst fast, slutter aldrig af sig selv
+MAX_TURNS = 1000
+CACHE_FILE = "evaluation_cache.json"
+
+# Modeller indlæst i denne proces, nøglet på (sti, hash)
+_loaded_models = {}
+
+
+def file_hash(path):
+    """SHA-256 of a model file, so renamed or retrained files are told apart."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(model_hash, seeds, max_turns):
+    seed_digest = hashlib.sha256(",".join(str(seed) for seed in seeds).encode()).hexdigest()[:16]
+    return f"{model_hash}:{seed_digest}:{max_turns}"
+
+
+def load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path) as f:
+        return json.load(f)
+
+
+def save_cache(cache_path, cache):
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+
+def _init_worker():
+    import torch
+
+    # Hver proces spiller sine egne spil, så én tråd pr. proces er nok
+    torch.set_num_threads(1)
+
+
+def _load_model(model_path, model_hash):
+    from action_mask import load_model
+
+    key = (model_path, model_hash)
+    if key not in _loaded_models:
+        _loaded_models[key] = load_model(model_path, device="cpu")
+    return _loaded_models[key]
+
+
+def play_games(model_path, model_hash, seeds, max_turns=MAX_TURNS):
+    """Play one game per seed at the same time and return the summed reward of each game.
+
+    All games step together in a BattlesnakeVecEnv, so every turn is a single batched
+    predict call. A game's reward stops counting once it ends or after max_turns.
+    """
+    from action_mask import is_maskable
+    from battlesnake_vec_env import BattlesnakeVecEnv
+    from observation import observation_mode
+
+    model = _load_model(model_path, model_hash)
+    # Modeller trænet med action masks spiller også med dem
+    masked = is_maskable(model_path)
+    # Modellen spiller med den observation, den er trænet på
+    observation = observation_mode(model.observation_space.shape[0])
+    env = BattlesnakeVecEnv(n_envs=len(seeds), observation=observation)
+    env._seeds = list(seeds)
+    obs = env.reset()
+
+    totals = np.zeros(len(seeds), dtype=np.float64)
+    playing = np.ones(len(seeds), dtype=bool)
+    for _ in range(max_turns):
+        if masked:
+            actions, _ = model.predict(obs, deterministic=True, action_masks=env.action_masks())
+        else:
+            actions, _ = model.predict(obs, deterministic=True)
+        obs, rewards, dones, _ = env.step(actions)
+        totals += rewards * playing
+        playing &= ~dones
+        if not playing.any():
+            break
+    return totals.tolist()
+
+
+def evaluate_models(model_paths, seeds, max_turns=MAX_TURNS, workers=None, cache_path=None):
+    """Average score per game for each model, reusing cached results for unchanged files.
+
+    Uncached models are split into chunks of seeds and played in a process pool.
+    """
+    seeds = list(seeds)
+    workers = workers or os.cpu_count() or 1
+    cache = load_cache(cache_path) if cache_path else {}
+
+    hashes = {path: file_hash(path) for path in model_paths}
+    keys = {path: cache_key(hashes[path], seeds, max_turns) for path in model_paths}
+    pending = [path for path in model_paths if keys[path] not in cache]
+
+    if pending:
+        chunks_per_model = max(1, workers // len(pending))
+        chunk_size = max(1, -(-len(seeds) // chunks_per_model))
+        chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+
+        if workers > 1:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as executor:
+                futures = {path: [executor.submit(play_games, path, hashes[path], chunk, max_turns) for chunk in chunks] for path in pending}
+                totals = {path: [total for future in path_futures for total in future.result()] for path, path_futures in futures.items()}
+        else:
+            totals = {path: [total for chunk in chunks for total in play_games(path, hashes[path], chunk, max_turns)] for path in pending}
+
+        for path in pending:
+            cache[keys[path]] = sum(totals[path]) / len(seeds)
+        if cache_path:
+            save_cache(cache_path, cache)
+
+    return {path: cache[keys[path]] for path in model_paths}
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+from action_mask import load_model
+from numpy_policy import NumpyPolicy
+
+# Navne på torch-aktiveringer, som NumpyPolicy kender
+ACTIVATION_NAMES = {
+    torch.nn.Tanh: "tanh",
+    torch.nn.ReLU: "relu",
+}
+
+
+def export_policy(model):
+    """Copy the actor of an SB3 MlpPolicy (policy_net + action_net) into a NumpyPolicy."""
+    policy = model.policy
+    weights, biases = [], []
+    for layer in policy.mlp_extractor.policy_net:
+        if isinstance(layer, torch.nn.Linear):
+            weights.append(layer.weight.detach().cpu().numpy())
+            biases.append(layer.bias.detach().cpu().numpy())
+    weights.append(policy.action_net.weight.detach().cpu().numpy())
+    biases.append(policy.action_net.bias.detach().cpu().numpy())
+    return NumpyPolicy(weights, biases, ACTIVATION_NAMES[policy.activation_fn])
+
+
+def check_parity(model, numpy_policy, samples=2000, seed=0):
+    """Compare NumpyPolicy logits and greedy actions with SB3 on random boards.
+
+    Returns the largest absolute logit difference; raises AssertionError on mismatch.
+    """
+    rng = np.random.default_rng(seed)
+    size = numpy_policy.input_size
+    observations = rng.integers(0, 6, size=(samples, size)).astype(np.int32)
+
+    with torch.no_grad():
+        obs_tensor, _ = model.policy.obs_to_tensor(observations)
+        expected = model.policy.get_distribution(obs_tensor).distribution.logits.cpu().numpy()
+    # torch's Categorical gemmer normaliserede logits (log-softmax)
+    difference = float(np.abs(numpy_policy.log_probabilities(observations) - expected).max())
+    assert difference < 1e-4, f"logits differ by {difference}"
+
+    sb3_actions, _ = model.predict(observations, deterministic=True)
+    numpy_actions, _ = numpy_policy.predict(observations, deterministic=True)
+    assert (sb3_actions == numpy_actions).all(), "greedy actions differ"
+    return difference
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eksportér en SB3 PPO-model til en NumPy .npz-fil.")
+    parser.add_argument("model", help="SB3 .zip model")
+    parser.add_argument("output", nargs="?", help="Destination .npz (default: next to the model)")
+    parser.add_argument("--memmap", action="store_true", help="Write a .weights directory of .npy files, which servers memory-map")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + (".weights" if args.memmap else ".npz")
+    model = load_model(args.model, device="cpu")
+    numpy_policy = export_policy(model)
+    if args.memmap:
+        numpy_policy.save_memmap(output)
+    else:
+        numpy_policy.save(output)
+
+    # Paritetstest mod SB3 på den gemte fil
+    try:
+        difference = check_parity(model, NumpyPolicy.load(output))
+    except AssertionError as error:
+        print(f"Paritetstest fejlede for {output}: {error}")
+        sys.exit(1)
+    print(f"Eksporteret {args.model} -> {output} (max logit-afvigelse {difference:.2e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import threading
+import time
+
+from board_state import BoardState, mask_cells
+
+
+class CachedGame:
+    """A game's BoardState as of `turn`, plus whatever derived data a server keeps with it."""
+
+    __slots__ = ("state", "turn", "touched", "extra")
+
+    def __init__(self, state, turn):
+        self.state = state
+        self.turn = turn
+        self.touched = time.monotonic()
+        self.extra = None
+
+
+class GameStateCache:
+    """Per-game board states that are updated with each turn's delta instead of rebuilt.
+
+    Entries are keyed by (game id, our snake id), created on /start (or on the first
+    /move we see) and dropped on /end or after `ttl` seconds without a request.
+    update() moves every snake by its new head, pops or stacks its tail to the
+    reported length and swaps in the food. Anything that does not line up with the
+    payload (missing turns, unknown snakes, a head, neck or tail in the wrong place)
+    falls back to a full rebuild. With several worker processes every process
+    has its own cache. A game that lands on another worker is just rebuilt there.
+    Only one worker gets the game's /end, so expired entries are also dropped
+    every `evict_every` calls to update().
+    """
+
+    def __init__(self, ttl=600.0, evict_every=1000):
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._updates = 0
+        self._games = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.rebuilds = 0
+
+    @staticmethod
+    def key(data):
+        return data["game"]["id"], data["you"]["id"]
+
+    def start(self, data):
+        game = CachedGame(BoardState.from_request(data), data.get("turn", 0))
+        with self._lock:
+            self._games[self.key(data)] = game
+        self._evict_expired()
+        return game
+
+    def get(self, data):
+        """The game this payload belongs to as last updated, or None."""
+        with self._lock:
+            return self._games.get(self.key(data))
+
+    def end(self, data):
+        with self._lock:
+            self._games.pop(self.key(data), None)
+
+    def update(self, data):
+        """Return (game, changed_cells) for this /move payload.
+
+        changed_cells holds every cell whose contents may differ from the previous
+        turn, or is None when the state was rebuilt from scratch.
+        """
+        with self._lock:
+            game = self._games.get(self.key(data))
+
+        turn = data.get("turn", 0)
+        changed = None
+        if game is not None and turn == game.turn:
+            changed = set()
+        elif game is not None and turn == game.turn + 1:
+            changed = self._apply_delta(game.state, data)
+
+        if changed is None:
+            self.rebuilds += 1
+            game = CachedGame(BoardState.from_request(data), turn)
+            with self._lock:
+                self._games[self.key(data)] = game
+        else:
+            self.hits += 1
+            game.turn = turn
+        game.touched = time.monotonic()
+
+        # Spil, hvis /end landede hos en anden worker, ryddes op her
+        self._updates += 1
+        if self._updates % self.evict_every == 0:
+            self._evict_expired()
+        return game, changed
+
+    def __len__(self):
+        return len(self._games)
+
+    def _apply_delta(self, state, data):
+        board = data["board"]
+        snakes = {snake["id"]: snake for snake in board["snakes"]}
+        if data["you"]["id"] not in snakes:
+            snakes[data["you"]["id"]] = data["you"]
+        if any(snake_id not in state.snakes for snake_id in snakes):
+            return None
+
+        changed = set()
+        for snake_id in [snake_id for snake_id in state.snakes if snake_id not in snakes]:
+            # Elimineret siden sidste tur
+            changed.update(state.snakes.pop(snake_id))
+            del state.health[snake_id]
+
+        for snake_id, snake in snakes.items():
+            body = state.snakes[snake_id]
+            points = snake["body"]
+            changed.add(body.head)
+            changed.add(body.pop())
+            body.push(state.cell(points[0]["x"], points[0]["y"]))
+            changed.add(body.head)
+            while len(body) < len(points):
+                body.cells.append(body.tail)
+            while len(body) > len(points):
+                changed.add(body.pop())
+            state.health[snake_id] = snake["health"]
+
+            if (
+                len(points) > 1 and body.cells[1] != state.cell(points[1]["x"], points[1]["y"]) or
+                body.tail != state.cell(points[-1]["x"], points[-1]["y"])
+            ):
+                return None
+
+        food = 0
+        for point in board["food"]:
+            food |= 1 << state.cell(point["x"], point["y"])
+        changed.update(mask_cells(state.food ^ food))
+        state.food = food
+        return changed
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            for key in [key for key, game in self._games.items() if game.touched < cutoff]:
+                del self._games[key]
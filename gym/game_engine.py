@@ -0,0 +1,402 @@
+"""In-process Battlesnake games with the official standard rules, without the Go CLI or HTTP.
+
+    python game_engine.py -s a=main:choose_move -s b=main:choose_move --path ../snake --games 200 --workers 8
+    python game_engine.py -s local=http://localhost:8080 -s heuristic=main:choose_move --path ../snake
+
+A snake is any callable that takes a /move payload (the API dict) and returns
+"up", "down", "left" or "right". It may also have start(data) and end(data)
+methods. HttpSnake wraps a running server, so snake/main.py and trained-snake
+can also play over HTTP.
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import urllib.request
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from board_state import BoardState, SnakeBody, mask_cells
+
+# Samme koordinater som Battlesnake API'et: "up" øger y
+MOVES = {
+    "up": (0, 1),
+    "down": (0, -1),
+    "left": (-1, 0),
+    "right": (1, 0),
+}
+
+# Elimineringsårsager med de officielle navne
+OUT_OF_HEALTH = "out-of-health"
+WALL_COLLISION = "wall-collision"
+SELF_COLLISION = "snake-self-collision"
+BODY_COLLISION = "snake-collision"
+HEAD_COLLISION = "head-collision"
+
+# Brætstørrelser med faste startpladser, som i den officielle motor
+FIXED_START_SIZES = {(7, 7), (11, 11), (19, 19)}
+
+
+class HttpSnake:
+    """A snake server behind its Battlesnake API, called with the game's timeout."""
+
+    def __init__(self, url, timeout_ms=500):
+        self.url = url.rstrip("/")
+        self.timeout_ms = timeout_ms
+
+    def _post(self, path, data):
+        request = urllib.request.Request(f"{self.url}{path}", data=json.dumps(data).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout_ms / 1000) as response:
+            body = response.read()
+        return json.loads(body) if path == "/move" else None
+
+    def start(self, data):
+        self._post("/start", data)
+
+    def end(self, data):
+        self._post("/end", data)
+
+    def __call__(self, data):
+        return self._post("/move", data)["move"]
+
+
+class Game:
+    """One game under the standard (or royale) ruleset.
+
+    `snakes` maps snake names to policies. Every turn each living snake is asked
+    for a move with its own payload. All snakes then move at once, and the turn
+    is resolved in the official order: move, starve, hazard damage, feed,
+    eliminate, spawn food. A policy that raises or returns something other than a
+    move keeps going in its current direction, like a snake that times out.
+    """
+
+    def __init__(self, snakes, width=11, height=11, seed=None, ruleset="standard",
+                 food_spawn_chance=15, minimum_food=1, hazard_damage=14, hazards=(),
+                 shrink_every_n_turns=25, max_turns=None, timeout=500):
+        self.policies = dict(snakes)
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.ruleset = ruleset
+        self.food_spawn_chance = food_spawn_chance
+        self.minimum_food = minimum_food
+        self.hazard_damage = hazard_damage
+        self.shrink_every_n_turns = shrink_every_n_turns
+        self.max_turns = max_turns
+        self.timeout = timeout
+
+        self.id = str(uuid.UUID(int=self.rng.getrandbits(128)))
+        self.turn = 0
+        self.state = BoardState(width, height)
+        self.hazards = 0
+        for x, y in hazards:
+            self.hazards |= 1 << self.state.cell(x, y)
+        self.eliminated = {}
+        # Royale: hvor langt hazard-kanten er rykket ind fra hver side
+        self._royale_bounds = [0, width - 1, 0, height - 1]
+        self._place_snakes()
+        self._place_initial_food()
+
+    # Opsætning
+
+    def _place_snakes(self):
+        width, height = self.width, self.height
+        names = list(self.policies)
+        if (width, height) in FIXED_START_SIZES and len(names) <= 8:
+            low, mid, high = 1, (width - 1) // 2, width - 2
+            corners = [(low, low), (low, high), (high, low), (high, high)]
+            edges = [(low, mid), (mid, low), (mid, high), (high, mid)]
+            self.rng.shuffle(corners)
+            self.rng.shuffle(edges)
+            starts = corners + edges if len(names) > 4 else corners
+        else:
+            # Tilfældige felter med lige paritet, så ingen starter hoved mod hoved
+            starts = [(x, y) for x in range(width) for y in range(height) if (x + y) % 2 == 0]
+            self.rng.shuffle(starts)
+        if len(starts) < len(names):
+            raise ValueError(f"No room for {len(names)} snakes on a {width}x{height} board")
+        for name, (x, y) in zip(names, starts):
+            self.state.snakes[name] = SnakeBody([self.state.cell(x, y)] * 3)
+            self.state.health[name] = 100
+
+    def _place_initial_food(self):
+        state = self.state
+        center_x, center_y = (self.width - 1) // 2, (self.height - 1) // 2
+        if (self.width, self.height) not in FIXED_START_SIZES:
+            self._spawn_food(len(state.snakes))
+            return
+
+        for body in state.snakes.values():
+            head_x, head_y = body.head % self.width, body.head // self.width
+            options = []
+            for x, y in ((head_x - 1, head_y - 1), (head_x - 1, head_y + 1), (head_x + 1, head_y - 1), (head_x + 1, head_y + 1)):
+                if (x, y) == (center_x, center_y) or (state.food >> state.cell(x, y)) & 1:
+                    continue
+                # Maden skal ligge længere væk fra midten end slangen på mindst én akse
+                away = (
+                    x < head_x < center_x or center_x < head_x < x or
+                    y < head_y < center_y or center_y < head_y < y
+                )
+                corner = x in (0, self.width - 1) and y in (0, self.height - 1)
+                if away and not corner:
+                    options.append(state.cell(x, y))
+            if options:
+                state.food |= 1 << self.rng.choice(options)
+        center = state.cell(center_x, center_y)
+        if not (state.occupied >> center) & 1:
+            state.food |= 1 << center
+
+    def _spawn_food(self, count):
+        blocked = self.state.occupied | self.state.food
+        free = [cell for cell in range(self.width * self.height) if not (blocked >> cell) & 1]
+        for cell in self.rng.sample(free, min(count, len(free))):
+            self.state.food |= 1 << cell
+
+    # API-payloads
+
+    def _snake_dict(self, name):
+        body = self.state.snakes[name]
+        points = body.points(self.width)
+        return {
+            "id": name, "name": name, "latency": "0", "health": self.state.health[name],
+            "body": points, "head": points[0], "length": len(points), "shout": "", "customizations": {},
+        }
+
+    def payloads(self):
+        """The request body every living snake gets this turn, keyed by name."""
+        snakes = {name: self._snake_dict(name) for name in self.state.snakes}
+        board = {
+            "height": self.height,
+            "width": self.width,
+            "food": [self.state.point(cell) for cell in self.state.food_cells()],
+            "hazards": [self.state.point(cell) for cell in mask_cells(self.hazards)],
+            "snakes": list(snakes.values()),
+        }
+        game = {
+            "id": self.id,
+            "ruleset": {"name": self.ruleset, "version": "python", "settings": {
+                "foodSpawnChance": self.food_spawn_chance,
+                "minimumFood": self.minimum_food,
+                "hazardDamagePerTurn": self.hazard_damage,
+                "royale": {"shrinkEveryNTurns": self.shrink_every_n_turns},
+            }},
+            "map": "standard",
+            "timeout": self.timeout,
+            "source": "local",
+        }
+        return {name: {"game": game, "turn": self.turn, "board": board, "you": you} for name, you in snakes.items()}
+
+    # Regler
+
+    def _current_direction(self, name):
+        body = self.state.snakes[name]
+        if len(body) < 2 or body.cells[1] == body.head:
+            return "up"
+        dx = body.head % self.width - body.cells[1] % self.width
+        dy = body.head // self.width - body.cells[1] // self.width
+        return next(move for move, delta in MOVES.items() if delta == (dx, dy))
+
+    def _ask(self, name, data):
+        try:
+            move = self.policies[name](data)
+        except Exception:
+            move = None
+        return move if move in MOVES else self._current_direction(name)
+
+    def is_over(self):
+        alive = len(self.state.snakes)
+        if self.max_turns is not None and self.turn >= self.max_turns:
+            return True
+        return alive == 0 if len(self.policies) == 1 else alive <= 1
+
+    def step(self, moves):
+        """Resolve one turn from a {name: move} dict for the living snakes."""
+        state = self.state
+        width = self.width
+
+        out_of_bounds = set()
+        for name, body in state.snakes.items():
+            dx, dy = MOVES[moves[name]]
+            x, y = body.head % width + dx, body.head // width + dy
+            if not state.in_bounds(x, y):
+                out_of_bounds.add(name)
+                continue
+            body.pop()
+            body.push(y * width + x)
+
+        for name in state.snakes:
+            state.health[name] -= 1
+
+        for name, body in state.snakes.items():
+            head = body.head
+            if name not in out_of_bounds and (self.hazards >> head) & 1 and not (state.food >> head) & 1:
+                state.health[name] = max(0, state.health[name] - self.hazard_damage)
+
+        eaten = 0
+        for name, body in state.snakes.items():
+            if name not in out_of_bounds and (state.food >> body.head) & 1:
+                state.health[name] = 100
+                body.cells.append(body.tail)
+                eaten |= 1 << body.head
+        state.food &= ~eaten
+
+        self._eliminate(out_of_bounds)
+        self._update_map()
+        self.turn += 1
+
+    def _eliminate(self, out_of_bounds):
+        state = self.state
+        causes = {}
+        for name in state.snakes:
+            if state.health[name] <= 0:
+                causes[name] = (OUT_OF_HEALTH, None)
+            elif name in out_of_bounds:
+                causes[name] = (WALL_COLLISION, None)
+
+        # Kollisioner tæller kun mod slanger, der overlevede sult og vægge
+        standing = {name: body for name, body in state.snakes.items() if name not in causes}
+        collisions = {}
+        for name, body in standing.items():
+            head = body.head
+            if body.cells.count(head) > 1:
+                collisions[name] = (SELF_COLLISION, name)
+                continue
+            for other_name, other in standing.items():
+                if other_name != name and (other.mask >> head) & 1 and (other.head != head or other.cells.count(head) > 1):
+                    collisions[name] = (BODY_COLLISION, other_name)
+                    break
+            if name in collisions:
+                continue
+            for other_name, other in standing.items():
+                if other_name != name and other.head == head and len(body) <= len(other):
+                    collisions[name] = (HEAD_COLLISION, other_name)
+                    break
+        causes.update(collisions)
+
+        for name, (cause, by) in causes.items():
+            self.eliminated[name] = {"turn": self.turn + 1, "cause": cause, "by": by}
+            del state.snakes[name]
+            del state.health[name]
+
+    def _update_map(self):
+        if self.ruleset == "royale" and self.shrink_every_n_turns and (self.turn + 1) % self.shrink_every_n_turns == 0:
+            self._shrink()
+        food = len(mask_cells(self.state.food))
+        if food < self.minimum_food:
+            self._spawn_food(self.minimum_food - food)
+        elif self.food_spawn_chance > 0 and 100 - self.rng.randrange(100) < self.food_spawn_chance:
+            self._spawn_food(1)
+
+    def _shrink(self):
+        """Royale: turn the next row or column on a random side into hazard."""
+        bounds = self._royale_bounds
+        if bounds[0] > bounds[1] or bounds[2] > bounds[3]:
+            return
+        side = self.rng.randrange(4)
+        for x in range(self.width):
+            for y in range(self.height):
+                if (side == 0 and x == bounds[0] or side == 1 and x == bounds[1] or
+                        side == 2 and y == bounds[2] or side == 3 and y == bounds[3]):
+                    self.hazards |= 1 << self.state.cell(x, y)
+        bounds[side] += 1 if side in (0, 2) else -1
+
+    # Afvikling
+
+    def play(self):
+        """Play until one snake (or none) is left and return the result."""
+        for name, data in self.payloads().items():
+            start = getattr(self.policies[name], "start", None)
+            if start:
+                start(data)
+
+        last_payloads = {}
+        while not self.is_over():
+            payloads = self.payloads()
+            last_payloads.update(payloads)
+            self.step({name: self._ask(name, data) for name, data in payloads.items()})
+
+        final = self.payloads()
+        for name, policy in self.policies.items():
+            end = getattr(policy, "end", None)
+            if end:
+                data = final.get(name) or last_payloads.get(name)
+                if data:
+                    end(data)
+        return self.result()
+
+    def result(self):
+        alive = list(self.state.snakes)
+        return {
+            "seed": self.seed,
+            "turns": self.turn,
+            "winner": alive[0] if len(alive) == 1 else None,
+            "alive": alive,
+            "eliminated": self.eliminated,
+        }
+
+
+def play_game(snakes, seed=None, **settings):
+    return Game(snakes, seed=seed, **settings).play()
+
+
+def play_games(snakes, seeds, workers=None, **settings):
+    """Play one game per seed, spread over `workers` processes; results come back in seed order.
+
+    The policies are pickled to every worker, so they have to be module-level
+    functions or picklable objects such as HttpSnake.
+    """
+    seeds = list(seeds)
+    if workers == 1 or len(seeds) <= 1:
+        return [play_game(snakes, seed, **settings) for seed in seeds]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(play_game, snakes, seed, **settings) for seed in seeds]
+        return [future.result() for future in futures]
+
+
+def resolve_policy(spec):
+    """A policy from the command line: a URL, or module:function on sys.path."""
+    if spec.startswith(("http://", "https://")):
+        return HttpSnake(spec)
+    module_name, attribute = spec.split(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-s", "--snake", action="append", required=True, help="name=URL or name=module:function")
+    parser.add_argument("--path", action="append", default=[], help="Directory to add to sys.path for module:function snakes")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--width", type=int, default=11)
+    parser.add_argument("--height", type=int, default=11)
+    parser.add_argument("--ruleset", choices=["standard", "royale"], default="standard")
+    parser.add_argument("--max-turns", type=int)
+    args = parser.parse_args()
+
+    for path in args.path:
+        sys.path.insert(0, os.path.abspath(path))
+    snakes = {}
+    for spec in args.snake:
+        name, policy = spec.split("=", 1)
+        snakes[name] = resolve_policy(policy)
+
+    results = play_games(snakes, range(args.seed, args.seed + args.games), args.workers,
+                         width=args.width, height=args.height, ruleset=args.ruleset, max_turns=args.max_turns)
+    wins = {name: sum(result["winner"] == name for result in results) for name in snakes}
+    print(json.dumps({
+        "games": len(results),
+        "wins": wins,
+        "draws": sum(result["winner"] is None for result in results),
+        "mean_turns": round(sum(result["turns"] for result in results) / len(results), 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""Parallel PPO hyperparameter search with asynchronous successive halving (ASHA).
+
+    python hyperparameter_search.py --trials 32 --workers 8 --min-timesteps 12500 --max-timesteps 100000
+
+Every trial is a sampled configuration that trains in rungs: min_timesteps,
+then eta times as many, up to max_timesteps (rounded to whole rollouts). After
+each rung the trial's model is saved and scored on the same seeded evaluation
+games as auto-training.py.
+A free worker continues the best trial that is in the top 1/eta of its rung and
+has not been continued yet, and otherwise starts a new trial. The rest are never
+trained further, so most of the compute goes to configurations that are already
+winning. Nobody waits for a rung to fill up.
+
+Trials, rung scores and timings are recorded in models/search/search.db. A
+search that is interrupted continues where it stopped. The best finished
+configuration is written to models/hyperparameters.json, which train_model()
+in auto-training.py uses instead of its defaults.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from training_db import remove_model_files
+
+SEARCH_DIR = os.path.join("models", "search")
+HYPERPARAMETERS_FILE = os.path.join("models", "hyperparameters.json")
+# Samme miljø og evalueringsspil som auto-training.py
+N_ENVS = 8
+OBSERVATION = "board"
+EVALUATION_GAMES = 100
+# Rollout-længder pr. miljø; potenser af 2, så den største går op i alle rung-budgetterne
+N_STEPS = (256, 512, 1024, 2048)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial INTEGER PRIMARY KEY,
+    params TEXT,
+    seed INTEGER,
+    status TEXT,
+    rung INTEGER,
+    timesteps INTEGER DEFAULT 0,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    trial INTEGER,
+    rung INTEGER,
+    timesteps INTEGER,
+    score REAL,
+    train_seconds REAL,
+    eval_seconds REAL,
+    finished REAL,
+    PRIMARY KEY (trial, rung)
+);
+"""
+
+# Status for et forsøg
+RUNNING = "running"
+PAUSED = "paused"
+COMPLETED = "completed"
+
+
+def sample_params(rng, n_steps=N_STEPS):
+    """One PPO configuration; the learning rate and entropy coefficient on a log scale."""
+    return {
+        "learning_rate": 10 ** rng.uniform(-5, -3),
+        "ent_coef": 10 ** rng.uniform(-4, -1.3),
+        "n_steps": rng.choice(n_steps),
+        # Potenser af 2, så minibatchen går op i n_steps * N_ENVS
+        "batch_size": rng.choice([64, 128, 256]),
+        "n_epochs": rng.choice([5, 10, 20]),
+        "gamma": rng.choice([0.95, 0.99, 0.995]),
+        "gae_lambda": rng.choice([0.9, 0.95, 0.98]),
+        "clip_range": rng.choice([0.1, 0.2, 0.3]),
+    }
+
+
+def rollout_sizes(min_timesteps):
+    """The n_steps choices whose rollout (n_steps * N_ENVS) fits in the first rung; at least the smallest."""
+    return tuple(n for n in N_STEPS if n * N_ENVS <= min_timesteps) or N_STEPS[:1]
+
+
+def rungs(min_timesteps, max_timesteps, eta, unit=1):
+    """Cumulative timesteps at the end of each rung.
+
+    E.g. 16384, 32768, 65536, 98304 for 12500 to 100000 with eta=2 and unit=8192.
+    PPO only stops after whole rollouts, so both ends are rounded to a multiple of
+    `unit` (the largest rollout), which makes every rung a whole number of rollouts
+    for every configuration.
+    """
+    min_timesteps = max(1, round(min_timesteps / unit)) * unit
+    max_timesteps = max(min_timesteps, round(max_timesteps / unit) * unit)
+    count = max(1, math.ceil(math.log(max_timesteps / min_timesteps, eta) - 1e-9) + 1)
+    return [min(max_timesteps, min_timesteps * eta ** rung) for rung in range(count)]
+
+
+class SearchDB:
+    """Trials and their score at every rung they finished."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add_trial(self, trial, params, seed):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO trials (trial, params, seed, status, rung, created) VALUES (?, ?, ?, ?, 0, ?)",
+                (trial, json.dumps(params), seed, RUNNING, time.time()),
+            )
+
+    def trials(self, status=None):
+        if status is None:
+            return self.conn.execute("SELECT * FROM trials ORDER BY trial").fetchall()
+        return self.conn.execute("SELECT * FROM trials WHERE status = ? ORDER BY trial", (status,)).fetchall()
+
+    def set_running(self, trial, rung):
+        with self.conn:
+            self.conn.execute("UPDATE trials SET status = ?, rung = ? WHERE trial = ?", (RUNNING, rung, trial))
+
+    def add_result(self, trial, rung, timesteps, score, train_seconds, eval_seconds, last_rung):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (trial, rung, timesteps, score, train_seconds, eval_seconds, time.time()),
+            )
+            self.conn.execute(
+                "UPDATE trials SET status = ?, timesteps = ? WHERE trial = ?",
+                (COMPLETED if last_rung else PAUSED, timesteps, trial),
+            )
+
+    def results(self, rung):
+        return self.conn.execute("SELECT * FROM results WHERE rung = ? ORDER BY score DESC", (rung,)).fetchall()
+
+    def promoted(self, rung):
+        """Trials that have started the rung after `rung`."""
+        rows = self.conn.execute("SELECT trial FROM trials WHERE rung > ?", (rung,)).fetchall()
+        return {row["trial"] for row in rows}
+
+    def best(self):
+        """(trial row, score) of the best result at the highest rung reached, or None."""
+        row = self.conn.execute(
+            "SELECT trial, score FROM results ORDER BY rung DESC, score DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        return self.conn.execute("SELECT * FROM trials WHERE trial = ?", (row["trial"],)).fetchone(), row["score"]
+
+
+def model_path(directory, trial):
+    return os.path.join(directory, f"trial_{trial}.zip")
+
+
+def run_rung(path, params, seed, timesteps, evaluation_games):
+    """Train the trial's model up to `timesteps` (continuing its saved model) and score it.
+
+    Runs in a worker process. Returns (score, timesteps trained in total, train_seconds, eval_seconds).
+    """
+    import torch
+    from stable_baselines3 import PPO
+    import evaluation
+    from battlesnake_vec_env import BattlesnakeVecEnv
+
+    # Hver proces træner én model ad gangen
+    torch.set_num_threads(1)
+    started = time.time()
+    env = BattlesnakeVecEnv(n_envs=N_ENVS, observation=OBSERVATION)
+    if os.path.exists(path):
+        model = PPO.load(path, env=env, device="cpu")
+    else:
+        model = PPO("MlpPolicy", env, verbose=0, device="cpu", seed=seed, **params)
+    remaining = timesteps - model.num_timesteps
+    if remaining > 0:
+        model.learn(total_timesteps=remaining, reset_num_timesteps=False)
+    env.close()
+    tmp_path = path[:-len(".zip")] + ".tmp.zip"
+    model.save(tmp_path)
+    os.replace(tmp_path, path)
+    train_seconds = time.time() - started
+
+    started = time.time()
+    score = evaluation.evaluate_models([path], range(evaluation_games), workers=1)[path]
+    # Hver rung er en ny fil; de gamle modeller skal ikke blive liggende i processen
+    evaluation._loaded_models.clear()
+    return score, model.num_timesteps, train_seconds, time.time() - started
+
+
+class ASHA:
+    """Asynchronous successive halving over `trials` sampled configurations."""
+
+    def __init__(self, directory=SEARCH_DIR, trials=32, workers=None, min_timesteps=12500, max_timesteps=100000,
+                 eta=2, evaluation_games=EVALUATION_GAMES, seed=0):
+        self.directory = directory
+        self.n_trials = trials
+        self.workers = workers or os.cpu_count()
+        self.n_steps = rollout_sizes(min_timesteps)
+        self.rungs = rungs(min_timesteps, max_timesteps, eta, max(self.n_steps) * N_ENVS)
+        self.eta = eta
+        self.evaluation_games = evaluation_games
+        self.seed = seed
+        os.makedirs(directory, exist_ok=True)
+        self.db = SearchDB(os.path.join(directory, "search.db"))
+
+    def next_job(self):
+        """(trial, rung) to run next: a promotion if one is due, else a new trial, else None."""
+        for rung in reversed(range(len(self.rungs) - 1)):
+            results = self.db.results(rung)
+            promoted = self.db.promoted(rung)
+            for row in results[:len(results) // self.eta]:
+                if row["trial"] not in promoted:
+                    self.db.set_running(row["trial"], rung + 1)
+                    return row["trial"], rung + 1
+
+        trial = len(self.db.trials())
+        if trial >= self.n_trials:
+            return None
+        params = sample_params(random.Random(self.seed * 100003 + trial), self.n_steps)
+        self.db.add_trial(trial, params, self.seed * 100003 + trial)
+        return trial, 0
+
+    def run(self):
+        """Run the search until every trial is finished or stopped; returns the best (trial row, score)."""
+        trials = {row["trial"]: row for row in self.db.trials()}
+        # Forsøg, der kørte, da søgningen blev afbrudt, tager deres rung om
+        pending = [(row["trial"], row["rung"]) for row in trials.values() if row["status"] == RUNNING]
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            futures = {}
+            while True:
+                while len(futures) < self.workers:
+                    job = pending.pop() if pending else self.next_job()
+                    if job is None:
+                        break
+                    trial, rung = job
+                    row = self.db.conn.execute("SELECT * FROM trials WHERE trial = ?", (trial,)).fetchone()
+                    futures[executor.submit(run_rung, model_path(self.directory, trial), json.loads(row["params"]),
+                                            row["seed"], self.rungs[rung], self.evaluation_games)] = (trial, rung)
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    trial, rung = futures.pop(future)
+                    score, timesteps, train_seconds, eval_seconds = future.result()
+                    self.db.add_result(trial, rung, timesteps, score, train_seconds, eval_seconds,
+                                       rung == len(self.rungs) - 1)
+                    print(f"Forsøg {trial} rung {rung} ({timesteps} trin): score {score:.1f}")
+
+        # De stoppede forsøg trænes ikke videre; kun de færdige modeller beholdes
+        for row in self.db.trials(PAUSED):
+            remove_model_files(model_path(self.directory, row["trial"]))
+        return self.db.best()
+
+    def save_best(self, path=HYPERPARAMETERS_FILE):
+        """Write the best configuration as JSON for auto-training.py and return it."""
+        best = self.db.best()
+        if best is None:
+            return None
+        row, score = best
+        params = json.loads(row["params"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"params": params, "trial": row["trial"], "score": score, "timesteps": row["timesteps"]}, f, indent=1)
+        os.replace(tmp_path, path)
+        return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directory", default=SEARCH_DIR, help="Trial models and search.db")
+    parser.add_argument("--trials", type=int, default=32, help="Configurations to sample")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--min-timesteps", type=int, default=12500, help="Timesteps of the first rung")
+    parser.add_argument("--max-timesteps", type=int, default=100000, help="Timesteps of the last rung")
+    parser.add_argument("--eta", type=int, default=2, help="Keep the best 1/eta of each rung")
+    parser.add_argument("--games", type=int, default=EVALUATION_GAMES, help="Evaluation games per rung")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=HYPERPARAMETERS_FILE)
+    args = parser.parse_args()
+
+    search = ASHA(args.directory, args.trials, args.workers, args.min_timesteps, args.max_timesteps, args.eta,
+                  args.games, args.seed)
+    print(f"Rungs: {search.rungs}")
+    search.run()
+    params = search.save_best(args.output)
+    search.db.close()
+    if params is None:
+        print("Ingen forsøg blev færdige")
+        return
+    print(f"Bedste konfiguration: {params} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import os
+import random
+
+import numpy as np
+from gymnasium import spaces
+
+from action_mask import action_mask, load_model
+from battlesnake_vec_env import BatchedVecEnv
+from env_profiler import profile_phase
+from game_engine import Game
+from numpy_policy import NumpyPolicy
+from observation import encode_state, observation_space
+from replay import ACTION_TO_MOVE, MOVE_TO_ACTION, frame
+from spatial import reachable_areas
+
+LEARNER = "learner"
+MAX_TURNS = 1000
+
+# Belønninger for den lærende slange
+SURVIVE_REWARD = 1
+FOOD_REWARD = 100
+DEATH_PENALTY = -500
+WIN_REWARD = 500
+
+
+def greedy_bot(data):
+    """Heuristic league opponent: nearest food when hungry, otherwise the safe move with the most space."""
+    board = data["board"]
+    width, height = board["width"], board["height"]
+    you = data["you"]
+    head_x, head_y = you["head"]["x"], you["head"]["y"]
+
+    blocked = 0
+    for snake in board["snakes"]:
+        # Haler flytter sig, så dem må man gerne følge
+        for point in snake["body"][:-1]:
+            blocked |= 1 << (point["y"] * width + point["x"])
+
+    moves = {}
+    for move, (dx, dy) in (("up", (0, 1)), ("down", (0, -1)), ("left", (-1, 0)), ("right", (1, 0))):
+        x, y = head_x + dx, head_y + dy
+        if 0 <= x < width and 0 <= y < height and not (blocked >> (y * width + x)) & 1:
+            moves[move] = (x, y)
+    if not moves:
+        return "up"
+
+    areas = reachable_areas(width, height, blocked, [y * width + x for x, y in moves.values()])
+    scores = {}
+    for (move, (x, y)), area in zip(moves.items(), areas):
+        scores[move] = area * 10
+        if you["health"] < 50 and board["food"]:
+            scores[move] -= min(abs(food["x"] - x) + abs(food["y"] - y) for food in board["food"])
+    return max(scores, key=scores.get)
+
+
+BOTS = {"greedy": greedy_bot}
+
+
+def load_frozen_policy(model_path, seed=None):
+    """A frozen generation as a NumpyPolicy; the .npz export next to the .zip is reused or written once.
+
+    Worker processes may export the same new generation at the same time; each
+    writes its own temporary file and renames it into place (NumpyPolicy.save),
+    so none of them reads a half-written export.
+    """
+    npz_path = os.path.splitext(model_path)[0] + ".npz"
+    if os.path.exists(npz_path) and os.path.getmtime(npz_path) >= os.path.getmtime(model_path):
+        return NumpyPolicy.load(npz_path, seed)
+
+    from export_policy import export_policy
+
+    export_policy(load_model(model_path, device="cpu")).save(npz_path)
+    return NumpyPolicy.load(npz_path, seed)
+
+
+class OpponentPool:
+    """Opponents a league game samples from: frozen PPO generations and heuristic bots.
+
+    Models are NumpyPolicy actors that take the same observations as the learner.
+    Bots are engine policies that take the /move payload. `bot_fraction` is the chance
+    that a seat gets a bot rather than a model, when there are both.
+    """
+
+    def __init__(self, models=(), bots=("greedy",), bot_fraction=0.25, seed=None):
+        self.rng = random.Random(seed)
+        self.models = [
+            load_frozen_policy(model, self.rng.getrandbits(64)) if isinstance(model, str) else model
+            for model in models
+        ]
+        self.bots = [BOTS[bot] if isinstance(bot, str) else bot for bot in bots]
+        if not self.models and not self.bots:
+            raise ValueError("The opponent pool needs at least one model or bot")
+        self.bot_fraction = bot_fraction if self.models and self.bots else float(not self.models)
+
+    def sample(self):
+        """("model", index) or ("bot", index) for one seat."""
+        if self.rng.random() < self.bot_fraction:
+            return "bot", self.rng.randrange(len(self.bots))
+        return "model", self.rng.randrange(len(self.models))
+
+
+class LeagueVecEnv(BatchedVecEnv):
+    """Self-play league: the learner against 1-3 opponents drawn from an OpponentPool.
+
+    Every board is a game_engine.Game with the full standard rules, so head-to-head,
+    starvation and food spawning work as in the arena. Observations and actions
+    follow BattlesnakeEnv (up lowers y, own head/body 1/2, opponents 3/4, food 5),
+    so models trained in either env fit both. Each step, the seats held by a frozen
+    model are gathered across all boards and answered with one forward pass per
+    model. An episode ends when the learner dies, wins or hits MAX_TURNS. With
+    observation="channels" everyone, the frozen models included, sees feature planes.
+    """
+
+    def __init__(self, n_envs=8, opponents=None, n_opponents=(1, 3), width=11, height=11,
+                 max_turns=MAX_TURNS, profiler=None, recorder=None, observation="board"):
+        self.width = width
+        self.height = height
+        self.render_mode = None
+        self.opponents = opponents or OpponentPool()
+        self.n_opponents = n_opponents
+        self.max_turns = max_turns
+        self.profiler = profiler
+        # Valgfri ReplayWriter, der gemmer den lærendes ture
+        self.recorder = recorder
+        self.observation = observation
+
+        self._rngs = [random.Random() for _ in range(n_envs)]
+        self._games = [None] * n_envs
+        self._seats = [None] * n_envs
+        self._actions = np.zeros(n_envs, dtype=np.int64)
+        space = observation_space(observation, width, height)
+        self._obs = np.zeros((n_envs, *space.shape), dtype=space.dtype)
+        super().__init__(n_envs, space, spaces.Discrete(4))
+
+    def reset(self):
+        for env_idx in range(self.num_envs):
+            if self._seeds[env_idx] is not None:
+                self._rngs[env_idx].seed(self._seeds[env_idx])
+            self._reset_game(env_idx)
+            self._obs[env_idx] = self.observe(self._games[env_idx], LEARNER)
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs.copy()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+
+    def step_wait(self):
+        with profile_phase(self.profiler, "opponent"):
+            moves = self._opponent_moves()
+        for env_idx in range(self.num_envs):
+            moves[env_idx][LEARNER] = ACTION_TO_MOVE[self._actions[env_idx]]
+
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = [{"TimeLimit.truncated": False} for _ in range(self.num_envs)]
+        if self.recorder is not None:
+            # Replays gemmer altid brættet
+            frames = self._obs.copy() if self.observation == "board" else [frame(game.state, LEARNER) for game in self._games]
+            health = [game.state.health[LEARNER] for game in self._games]
+            turns = [game.turn for game in self._games]
+        with profile_phase(self.profiler, "engine"):
+            for env_idx, game in enumerate(self._games):
+                length = len(game.state.snakes[LEARNER])
+                game.step(moves[env_idx])
+                rewards[env_idx], dones[env_idx] = self._reward(game, length)
+                if not dones[env_idx] and game.turn >= self.max_turns:
+                    dones[env_idx] = True
+                    infos[env_idx]["TimeLimit.truncated"] = True
+
+        with profile_phase(self.profiler, "observation"):
+            for env_idx, game in enumerate(self._games):
+                self._obs[env_idx] = self.observe(game, LEARNER)
+                if dones[env_idx]:
+                    infos[env_idx]["terminal_observation"] = self._obs[env_idx].copy()
+                    if self.profiler is not None:
+                        self.profiler.episode_end(game.turn)
+                    self._reset_game(env_idx)
+                    self._obs[env_idx] = self.observe(self._games[env_idx], LEARNER)
+        if self.recorder is not None:
+            self.recorder.record_steps(frames, self._actions, rewards, dones, health, turns)
+        if self.profiler is not None:
+            self.profiler.count("env_steps", self.num_envs)
+        return self._obs.copy(), rewards, dones, infos
+
+    def action_masks(self):
+        """(n_envs, 4) bools: the learner's actions that do not run into a wall or a body (standard rules)."""
+        return np.stack([action_mask(game.state, LEARNER) for game in self._games])
+
+    def observe(self, game, name):
+        """The observation from `name`'s point of view (zeros once it is dead)."""
+        if self.observation == "channels":
+            return encode_state(game.state, name)
+        return frame(game.state, name, np.int32)
+
+    def _reset_game(self, env_idx):
+        rng = self._rngs[env_idx]
+        low, high = self.n_opponents if isinstance(self.n_opponents, tuple) else (self.n_opponents, self.n_opponents)
+        seats = {f"opponent-{i + 1}": self.opponents.sample() for i in range(rng.randint(low, high))}
+        names = [LEARNER, *seats]
+        self._games[env_idx] = Game(dict.fromkeys(names), self.width, self.height, seed=rng.getrandbits(64))
+        self._seats[env_idx] = seats
+
+    def _opponent_moves(self):
+        """Every living opponent's move, with one batched forward pass per frozen model."""
+        moves = [{} for _ in range(self.num_envs)]
+        by_model = {}
+        for env_idx, (game, seats) in enumerate(zip(self._games, self._seats)):
+            payloads = None
+            for name, (kind, index) in seats.items():
+                if name not in game.state.snakes:
+                    continue
+                if kind == "model":
+                    by_model.setdefault(index, []).append((env_idx, name, self.observe(game, name)))
+                else:
+                    payloads = payloads or game.payloads()
+                    move = self.opponents.bots[index](payloads[name])
+                    moves[env_idx][name] = move if move in MOVE_TO_ACTION else "up"
+
+        for index, seats in by_model.items():
+            actions, _ = self.opponents.models[index].predict(np.stack([obs for _, _, obs in seats]))
+            for (env_idx, name, _), action in zip(seats, actions):
+                moves[env_idx][name] = ACTION_TO_MOVE[action]
+        return moves
+
+    def _reward(self, game, length):
+        """(reward, done) for the learner after a turn."""
+        snakes = game.state.snakes
+        if LEARNER not in snakes:
+            return DEATH_PENALTY, True
+        reward = SURVIVE_REWARD
+        if len(snakes[LEARNER]) > length:
+            reward += FOOD_REWARD
+        if len(snakes) == 1:
+            return reward + WIN_REWARD, True
+        return reward, False
+
+
+def make_league_env(n_envs, models=(), bots=("greedy",), bot_fraction=0.25, n_opponents=(1, 3), seed=None, profiler=None,
+                    recorder=None, observation="board"):
+    """Picklable LeagueVecEnv factory, e.g. for SharedMemoryVecEnv(env_fn=partial(make_league_env, models=...)).
+
+    Every process that calls it builds its own OpponentPool, so a worker batches the
+    opponents of its own boards.
+    """
+    pool = OpponentPool(models, bots, bot_fraction, seed)
+    return LeagueVecEnv(n_envs, pool, n_opponents, profiler=profiler, recorder=recorder, observation=observation)
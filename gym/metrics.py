@@ -0,0 +1,142 @@
+import bisect
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+# Øvre grænser i sekunder; et træk skal være svaret inden for 500 ms inkl. netværk
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.5, 1.0)
+PHASE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5)
+
+
+class Histogram:
+    """Prometheus histogram with one series per label value (e.g. per endpoint or phase)."""
+
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                # Tællinger pr. spand (den sidste er +Inf) og summen
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def lines(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {label: (list(counts), total) for label, (counts, total) in self._series.items()}
+        for label, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{self.label}="{label}",le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{self.label}="{label}"}} {total}'
+            yield f'{self.name}_count{{{self.label}="{label}"}} {cumulative}'
+
+
+class _Phase:
+    __slots__ = ("histogram", "name", "started")
+
+    def __init__(self, histogram, name):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, self.name)
+        return False
+
+
+class ServerMetrics:
+    """Request latencies, per-phase timings and gauges for a snake server, served on GET /metrics.
+
+    install() times every request per endpoint and counts the requests in flight
+    and the responses that took `near_deadline_ms` or longer. Views time their own
+    phases with `with metrics.phase("board"): ...`. Gauges are callbacks that are
+    read on each scrape, e.g. the number of games in flight.
+    /metrics uses the Prometheus text format. With several worker processes every
+    process has its own numbers, so a scrape shows the worker that answered it
+    (its pid is the `battlesnake_process_id` gauge).
+    """
+
+    def __init__(self, near_deadline_ms=300):
+        self.near_deadline = near_deadline_ms / 1000
+        self.requests = Histogram("battlesnake_request_seconds", "Request latency per endpoint", "endpoint",
+                                  LATENCY_BUCKETS)
+        self.phases = Histogram("battlesnake_phase_seconds", "Time spent in each phase of a request", "phase",
+                                PHASE_BUCKETS)
+        self.near_deadline_responses = {}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._gauges = [("battlesnake_process_id", "Worker process answering this scrape", os.getpid)]
+
+    def phase(self, name):
+        return _Phase(self.phases, name)
+
+    def add_gauge(self, name, help, value):
+        self._gauges.append((name, help, value))
+
+    def install(self, app):
+        """Time every request of `app` and add the /metrics route."""
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+            with self._lock:
+                self.in_flight += 1
+
+        @app.after_request
+        def record_latency(response):
+            seconds = time.perf_counter() - g.metrics_started
+            endpoint = request.endpoint or "none"
+            self.requests.observe(seconds, endpoint)
+            if seconds >= self.near_deadline:
+                with self._lock:
+                    self.near_deadline_responses[endpoint] = self.near_deadline_responses.get(endpoint, 0) + 1
+            return response
+
+        @app.teardown_request
+        def stop_timer(error=None):
+            # Kører også, når viewet kaster en exception
+            if "metrics_started" in g:
+                with self._lock:
+                    self.in_flight -= 1
+
+        @app.route("/metrics", methods=["GET"])
+        def metrics():
+            return Response("\n".join(self.lines()) + "\n", mimetype="text/plain; version=0.0.4")
+
+    def lines(self):
+        yield from self.requests.lines()
+        yield from self.phases.lines()
+        yield "# HELP battlesnake_near_deadline_total Responses that took near_deadline_ms or longer"
+        yield "# TYPE battlesnake_near_deadline_total counter"
+        with self._lock:
+            near_deadline = dict(self.near_deadline_responses)
+            in_flight = self.in_flight
+        for endpoint, count in sorted(near_deadline.items()):
+            yield f'battlesnake_near_deadline_total{{endpoint="{endpoint}"}} {count}'
+        yield "# HELP battlesnake_near_deadline_seconds Threshold for battlesnake_near_deadline_total"
+        yield "# TYPE battlesnake_near_deadline_seconds gauge"
+        yield f"battlesnake_near_deadline_seconds {self.near_deadline}"
+        yield "# HELP battlesnake_requests_in_flight Requests being handled"
+        yield "# TYPE battlesnake_requests_in_flight gauge"
+        yield f"battlesnake_requests_in_flight {in_flight}"
+        for name, help, value in self._gauges:
+            yield f"# HELP {name} {help}"
+            yield f"# TYPE {name} gauge"
+            yield f"{name} {value()}"
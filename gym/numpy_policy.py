@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+    "identity": lambda x: x,
+}
+
+
+class NumpyPolicy:
+    """Forward pass of an exported SB3 MlpPolicy actor in plain NumPy.
+
+    The weights come from export_policy.py: the hidden layers of
+    mlp_extractor.policy_net followed by action_net. Observations are cast to
+    float32 as SB3 does for Box spaces, so the logits match the torch policy.
+    """
+
+    def __init__(self, weights, biases, activation="tanh", seed=None):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activation = activation
+        self._activation = ACTIVATIONS[activation]
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def load(cls, path, seed=None):
+        """Load an .npz export, or a directory from save_memmap() (memory-mapped, nothing is copied)."""
+        if os.path.isdir(path):
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            weights = [np.load(os.path.join(path, f"weight_{i}.npy"), mmap_mode="r") for i in range(meta["layers"])]
+            biases = [np.load(os.path.join(path, f"bias_{i}.npy"), mmap_mode="r") for i in range(meta["layers"])]
+            return cls(weights, biases, meta["activation"], seed)
+        with np.load(path) as data:
+            layers = int(data["layers"])
+            weights = [data[f"weight_{i}"] for i in range(layers)]
+            biases = [data[f"bias_{i}"] for i in range(layers)]
+            activation = str(data["activation"])
+        return cls(weights, biases, activation, seed)
+
+    def save(self, path):
+        """Write an .npz export atomically: other processes see the old file or the whole new one."""
+        arrays = {"layers": np.array(len(self.weights)), "activation": np.array(self.activation)}
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"weight_{i}"] = weight
+            arrays[f"bias_{i}"] = bias
+        # Én midlertidig fil pr. skriver, så processer, der eksporterer samme model, ikke skriver i hinandens fil
+        fd, tmp_path = tempfile.mkstemp(suffix=".npz.tmp", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            # mkstemp giver kun ejeren adgang
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def save_memmap(self, directory):
+        """Save as one raw .npy per array, which load() maps into memory instead of reading.
+
+        Processes that load the same directory share the pages through the OS cache.
+        Every writer fills its own temporary directory and renames it into place; if
+        another process got there first, its identical copy is kept.
+        """
+        directory = directory.rstrip("/")
+        parent, name = os.path.split(os.path.abspath(directory))
+        tmp_directory = tempfile.mkdtemp(prefix=name + ".", suffix=".tmp", dir=parent)
+        old_directory = None
+        try:
+            # mkdtemp giver kun ejeren adgang; en eksport skal kunne læses som en almindelig mappe
+            os.chmod(tmp_directory, 0o755)
+            for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+                np.save(os.path.join(tmp_directory, f"weight_{i}.npy"), weight)
+                np.save(os.path.join(tmp_directory, f"bias_{i}.npy"), bias)
+            with open(os.path.join(tmp_directory, "meta.json"), "w") as f:
+                json.dump({"layers": len(self.weights), "activation": self.activation}, f)
+            # Mapninger af den gamle mappe virker stadig, efter den er slettet
+            if os.path.isdir(directory):
+                old_directory = tempfile.mkdtemp(prefix=name + ".", suffix=".old", dir=parent)
+                try:
+                    os.rename(directory, os.path.join(old_directory, name))
+                except FileNotFoundError:
+                    pass
+            try:
+                os.rename(tmp_directory, directory)
+            except OSError:
+                # En anden proces har lige lagt sin konvertering på plads
+                if not os.path.isdir(directory):
+                    raise
+        finally:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            if old_directory is not None:
+                shutil.rmtree(old_directory, ignore_errors=True)
+
+    def prewarm(self):
+        """Run one forward pass, so lazy setup (page faults on mapped weights, BLAS threads) happens before traffic."""
+        self.logits(np.zeros((1, self.input_size), dtype=np.float32))
+
+    @property
+    def input_size(self):
+        return self.weights[0].shape[1]
+
+    def logits(self, observations):
+        """Action logits for a single observation or a batch."""
+        x = np.asarray(observations, dtype=np.float32).reshape(-1, self.input_size)
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            x = self._activation(x @ weight.T + bias)
+        return x @ self.weights[-1].T + self.biases[-1]
+
+    def log_probabilities(self, observations):
+        """Log-softmax of the logits, i.e. SB3's normalized Categorical logits."""
+        logits = self.logits(observations)
+        logits -= logits.max(axis=1, keepdims=True)
+        return logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+
+    def action_probabilities(self, observations):
+        return np.exp(self.log_probabilities(observations))
+
+    def predict(self, observation, deterministic=False, symmetry=None, mask=None):
+        """Same contract as PPO.predict: (actions, None), unbatched in, unbatched out.
+
+        With a symmetry.BoardSymmetry, the probabilities are averaged over every
+        rotation and reflection of the board. `mask` (bools per action, e.g. from
+        action_mask.py) rules out actions, as MaskablePPO's action_masks does.
+        """
+        single = np.asarray(observation).ndim == 1
+        if symmetry is not None:
+            log_probabilities = symmetry.average_log_probabilities(self.log_probabilities, observation)
+        else:
+            log_probabilities = self.log_probabilities(observation)
+        if mask is not None:
+            # Som MaskablePPO: udelukkede træk får logit -1e8 før softmax, så de tilladte aldrig underflower til 0
+            mask = np.asarray(mask, dtype=bool).reshape(log_probabilities.shape)
+            log_probabilities = np.where(mask, log_probabilities, np.float32(-1e8))
+        if deterministic:
+            actions = log_probabilities.argmax(axis=1)
+        else:
+            # Det mest sandsynlige træk får vægt 1, så summen er mindst 1
+            probabilities = np.exp(log_probabilities - log_probabilities.max(axis=1, keepdims=True))
+            cumulative = probabilities.cumsum(axis=1)
+            draws = self._rng.random((cumulative.shape[0], 1)) * cumulative[:, -1:]
+            actions = (cumulative < draws).sum(axis=1)
+        return (actions[0] if single else actions), None
@@ -0,0 +1,130 @@
+"""Observation encodings shared by the training envs and the trained-snake server.
+
+"board" is the original encoding: one int per cell, own head/body 1/2, opponent
+head/body 3/4, food 5. "channels" gives every feature its own 0/1 plane (float32,
+channel-major, flattened to CHANNELS * width * height values):
+
+    own_head, own_body, own_tail     our snake (body includes head and tail)
+    enemy_head, enemy_body, enemy_tail
+    enemy_longer                     every cell of an enemy at least as long as us
+    food
+    health                           our health / 100 on every cell
+    age                              turns until a body cell is free / cells
+
+The encoders write into preallocated buffers with fancy indexing, one assignment
+per feature and snake (or per feature for a whole batch of boards).
+"""
+import numpy as np
+
+CHANNELS = (
+    "own_head", "own_body", "own_tail",
+    "enemy_head", "enemy_body", "enemy_tail", "enemy_longer",
+    "food", "health", "age",
+)
+(OWN_HEAD, OWN_BODY, OWN_TAIL, ENEMY_HEAD, ENEMY_BODY, ENEMY_TAIL,
+ ENEMY_LONGER, FOOD, HEALTH, AGE) = range(len(CHANNELS))
+
+MODES = ("board", "channels")
+
+
+def observation_size(mode, width, height):
+    return width * height * (len(CHANNELS) if mode == "channels" else 1)
+
+
+def observation_mode(size, width=11, height=11):
+    """The mode whose observations have `size` values, e.g. a model's input size."""
+    for mode in MODES:
+        if observation_size(mode, width, height) == size:
+            return mode
+    raise ValueError(f"No observation mode has {size} values on a {width}x{height} board")
+
+
+def observation_space(mode, width, height):
+    from gymnasium import spaces
+
+    if mode == "channels":
+        return spaces.Box(low=0, high=1, shape=(observation_size(mode, width, height),), dtype=np.float32)
+    # Uændret fra de første modeller, så gemte modeller stadig kan indlæses
+    return spaces.Box(low=0, high=3, shape=(width * height,), dtype=np.int32)
+
+
+def encode_snakes(out, you, enemies, food_cells, health):
+    """Fill `out` (CHANNELS x cells, zeroed here) from head-first cell sequences."""
+    out.fill(0)
+    cells = out.shape[1]
+    you = np.fromiter(you, dtype=np.int64)
+    _encode_body(out, you, OWN_HEAD, OWN_BODY, OWN_TAIL, cells)
+    for enemy in enemies:
+        enemy = np.fromiter(enemy, dtype=np.int64)
+        _encode_body(out, enemy, ENEMY_HEAD, ENEMY_BODY, ENEMY_TAIL, cells)
+        if len(enemy) >= len(you):
+            out[ENEMY_LONGER, enemy] = 1
+    out[FOOD, food_cells] = 1
+    out[HEALTH] = health / 100
+    return out
+
+
+def _encode_body(out, body, head_channel, body_channel, tail_channel, cells):
+    if not len(body):
+        return
+    out[body_channel, body] = 1
+    out[head_channel, body[0]] = 1
+    out[tail_channel, body[-1]] = 1
+    # Halen først, så en stablet hale får den største alder (den celle frigives sidst)
+    out[AGE, body[::-1]] = np.arange(1, len(body) + 1) / cells
+
+
+def encode_state(state, you_id, out=None):
+    """Channels for `you_id` on a BoardState, flattened; zeros if it is dead."""
+    cells = state.width * state.height
+    if out is None:
+        out = np.zeros((len(CHANNELS), cells), dtype=np.float32)
+    if you_id not in state.snakes:
+        out.fill(0)
+        return out.reshape(-1)
+    enemies = [body for snake_id, body in state.snakes.items() if snake_id != you_id]
+    encode_snakes(out, state.snakes[you_id], enemies, state.food_cells(), state.health[you_id])
+    return out.reshape(-1)
+
+
+class BatchEncoder:
+    """Channels for a batch of two-snake boards stored as ring buffers (BattlesnakeVecEnv's layout).
+
+    A body is body[env, (head + k) % cells] for k < length, head first. encode()
+    writes all boards into one preallocated (n_envs, CHANNELS * cells) buffer and
+    returns it (not a copy).
+    """
+
+    def __init__(self, n_envs, width, height):
+        cells = width * height
+        self.cells = cells
+        self.buffer = np.zeros((n_envs, len(CHANNELS) * cells), dtype=np.float32)
+        self._planes = self.buffer.reshape(n_envs, len(CHANNELS), cells)
+        self._index = np.arange(n_envs)
+        self._segments = np.arange(cells)
+
+    def encode(self, body, head, length, occupied, opp_body, opp_head, opp_length, opp_occupied, food, health):
+        planes = self._planes
+        index = self._index
+        self.buffer.fill(0)
+        planes[:, OWN_BODY] = occupied
+        planes[:, ENEMY_BODY] = opp_occupied
+        planes[:, ENEMY_LONGER] = opp_occupied & (opp_length >= length)[:, None]
+        planes[index, FOOD, food] = 1
+        planes[:, HEALTH] = (health / 100)[:, None]
+        self._encode_ring(body, head, length, OWN_HEAD, OWN_TAIL)
+        self._encode_ring(opp_body, opp_head, opp_length, ENEMY_HEAD, ENEMY_TAIL)
+        return self.buffer
+
+    def _encode_ring(self, body, head, length, head_channel, tail_channel):
+        planes = self._planes
+        index = self._index
+        planes[index, head_channel, body[index, head]] = 1
+        planes[index, tail_channel, body[index, (head + length - 1) % self.cells]] = 1
+        # Kun så mange segmenter som den længste slange har
+        segments = self._segments[None, :length.max()]
+        alive = segments < length[:, None]
+        cells = body[index[:, None], (head[:, None] + segments) % self.cells]
+        ages = (length[:, None] - segments) / self.cells
+        rows = np.broadcast_to(index[:, None], alive.shape)
+        planes[rows[alive], AGE, cells[alive]] = ages[alive]
@@ -0,0 +1,281 @@
+"""Columnar binary game replays: int8 board frames plus per-turn action, reward and health columns.
+
+A replay directory holds shards. A shard is a directory with one raw file per column
+(frames.bin, actions.bin, ...) and a meta.json with the dtypes, the board size, the
+number of complete rows and each episode's outcome. Writers append rows in chunks and
+only count rows in meta.json once they are on disk, so a crashed writer leaves at
+worst some ignored bytes at the end of a column. Every writer process has its own
+shard, so gunicorn workers and SubprocVecEnv workers never share a file.
+"""
+import glob
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from board_state import BoardState
+
+# Træningsmiljøets handlinger (up mindsker y) og de tilsvarende API-træk (up øger y)
+ACTION_TO_MOVE = ["down", "up", "left", "right"]
+MOVE_TO_ACTION = {move: action for action, move in enumerate(ACTION_TO_MOVE)}
+
+FORMAT_VERSION = 1
+
+
+def columns(cells):
+    """Column name -> (dtype, row shape)."""
+    return {
+        "frames": (np.int8, (cells,)),
+        "actions": (np.int8, ()),
+        "rewards": (np.float32, ()),
+        "health": (np.int16, ()),
+        "turns": (np.int16, ()),
+        "episodes": (np.int32, ()),
+        "dones": (np.bool_, ()),
+    }
+
+
+def frame(state, you_id, dtype=np.int8):
+    """BattlesnakeEnv-style board from `you_id`'s view: own head/body 1/2, others 3/4, food 5 (zeros if dead)."""
+    board = np.zeros(state.width * state.height, dtype=dtype)
+    if you_id not in state.snakes:
+        return board
+    own = state.snakes[you_id]
+    board[list(own)] = 2
+    board[own.head] = 1
+    for snake_id, body in state.snakes.items():
+        if snake_id != you_id:
+            board[list(body)] = 4
+            board[body.head] = 3
+    board[state.food_cells()] = 5
+    return board
+
+
+class ReplayWriter:
+    """Append-only writer for one shard of `width` x `height` frames.
+
+    Rows collect in preallocated chunk buffers and go to disk when a chunk is full,
+    on flush() and on close(). record_steps() is the batched entry point for the
+    vectorized envs: row i of every batch belongs to env slot i, whose episode id
+    changes after each done.
+    """
+
+    def __init__(self, directory, width, height, prefix="replay", chunk_size=4096):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.path = os.path.join(directory, f"{prefix}-{width}x{height}-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(self.path)
+
+        self._columns = columns(width * height)
+        self._buffers = {name: np.zeros((chunk_size, *shape), dtype=dtype) for name, (dtype, shape) in self._columns.items()}
+        self._pending = 0
+        self.rows = 0
+        self.episodes = {}
+        self._next_episode = 0
+        self._slot_episodes = np.zeros(0, dtype=np.int32)
+        self._write_meta()
+
+    def new_episode(self):
+        episode = self._next_episode
+        self._next_episode += 1
+        return episode
+
+    def end_episode(self, episode, outcome=None):
+        """Remember how an episode ended (1 won, 0 draw, -1 lost, None unknown); saved on the next flush."""
+        self.episodes[episode] = outcome
+
+    def append(self, frames, actions, rewards=0.0, health=-1, turns=-1, episodes=0, dones=False):
+        """Append a batch of rows; scalars are broadcast over the batch."""
+        frames = np.asarray(frames).reshape(-1, self.width * self.height)
+        values = {"frames": frames, "actions": actions, "rewards": rewards, "health": health,
+                  "turns": turns, "episodes": episodes, "dones": dones}
+        count = len(frames)
+        done = 0
+        while done < count:
+            take = min(count - done, self.chunk_size - self._pending)
+            for name, value in values.items():
+                value = np.asarray(value)
+                self._buffers[name][self._pending:self._pending + take] = value[done:done + take] if value.ndim else value
+            self._pending += take
+            done += take
+            if self._pending == self.chunk_size:
+                self.flush()
+
+    def record_steps(self, frames, actions, rewards, dones, health=-1, turns=-1):
+        """Record one step of a vectorized env: the observations the actions were chosen on, and their results."""
+        count = len(frames)
+        if len(self._slot_episodes) < count:
+            extra = [self.new_episode() for _ in range(count - len(self._slot_episodes))]
+            self._slot_episodes = np.concatenate([self._slot_episodes, np.array(extra, dtype=np.int32)])
+        slots = self._slot_episodes[:count]
+        self.append(frames, actions, rewards, health, turns, slots, dones)
+        for slot in np.flatnonzero(dones):
+            self.end_episode(int(slots[slot]))
+            slots[slot] = self.new_episode()
+
+    def flush(self):
+        if self._pending:
+            for name, buffer in self._buffers.items():
+                with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+                    f.write(buffer[:self._pending].tobytes())
+            self.rows += self._pending
+            self._pending = 0
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+
+    def _write_meta(self):
+        meta = {
+            "version": FORMAT_VERSION,
+            "width": self.width,
+            "height": self.height,
+            "rows": self.rows,
+            "columns": {name: [np.dtype(dtype).str, list(shape)] for name, (dtype, shape) in self._columns.items()},
+            "episodes": {str(episode): outcome for episode, outcome in self.episodes.items()},
+        }
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+
+class GameRecorder:
+    """Records the games a snake server plays, one writer per board size in each process.
+
+    record_move() stores our view of the board and the move we answered with.
+    end_game() stores the outcome and flushes, so finished games are on disk even if
+    the worker is killed later. Under gunicorn a game's /end often reaches another
+    worker than its moves; such a game is ended with an unknown outcome once it has
+    had no move for `ttl` seconds (checked every `evict_every` moves).
+    """
+
+    def __init__(self, directory, prefix="snake", chunk_size=1024, ttl=600.0, evict_every=1000):
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._moves = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._writers = {}
+        # (spil-id, slange-id) -> [episode, brætstørrelse, sidste træk]
+        self._episodes = {}
+
+    def _writer(self, width, height):
+        # Writere oprettes først i den proces, der skriver (gunicorn forker efter preload)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._writers = {}
+            self._episodes = {}
+        key = (width, height)
+        if key not in self._writers:
+            self._writers[key] = ReplayWriter(self.directory, width, height, self.prefix, self.chunk_size)
+        return self._writers[key]
+
+    def record_move(self, data, move, state=None):
+        board = data["board"]
+        you = data["you"]
+        board_frame = frame(state or BoardState.from_request(data), you["id"])
+        key = (data["game"]["id"], you["id"])
+        size = (board["width"], board["height"])
+        with self._lock:
+            writer = self._writer(*size)
+            if key not in self._episodes:
+                self._episodes[key] = [writer.new_episode(), size, 0.0]
+            entry = self._episodes[key]
+            entry[2] = time.monotonic()
+            writer.append(board_frame[None], MOVE_TO_ACTION[move], 0.0, you["health"], data.get("turn", 0), entry[0])
+            self._moves += 1
+            if self._moves % self.evict_every == 0:
+                self._end_expired()
+
+    def end_game(self, data):
+        board = data["board"]
+        you_id = data["you"]["id"]
+        alive = [snake["id"] for snake in board["snakes"]]
+        outcome = 1 if alive == [you_id] else 0 if not alive else -1
+        with self._lock:
+            entry = self._episodes.pop((data["game"]["id"], you_id), None)
+            if entry is not None and self._pid == os.getpid():
+                writer = self._writer(*entry[1])
+                writer.end_episode(entry[0], outcome)
+                writer.flush()
+
+    def _end_expired(self):
+        """End the episodes that have had no move for `ttl` seconds (their /end went to another worker)."""
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, (_, _, touched) in self._episodes.items() if touched < cutoff]
+        sizes = set()
+        for key in expired:
+            episode, size, _ = self._episodes.pop(key)
+            self._writers[size].end_episode(episode)
+            sizes.add(size)
+        for size in sizes:
+            self._writers[size].flush()
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+
+
+class ReplayDataset:
+    """All shards under one or more replay directories, memory-mapped column by column.
+
+    Only shards with the requested board size are used. Nothing is read until a batch
+    asks for it; batches() walks a shuffled permutation of all rows and gathers each
+    batch from the memmaps (indices sorted per shard for sequential-ish reads).
+    """
+
+    def __init__(self, directories, width=11, height=11):
+        if isinstance(directories, str):
+            directories = [directories]
+        self.width = width
+        self.height = height
+        self.shards = []
+        for directory in directories:
+            for meta_path in sorted(glob.glob(os.path.join(directory, "*", "meta.json"))):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                if meta["width"] != width or meta["height"] != height or not meta["rows"]:
+                    continue
+                shard_path = os.path.dirname(meta_path)
+                shard = {"path": shard_path, "rows": meta["rows"], "episodes": meta["episodes"], "columns": {}}
+                for name, (dtype, shape) in meta["columns"].items():
+                    shard["columns"][name] = np.memmap(os.path.join(shard_path, f"{name}.bin"), dtype=np.dtype(dtype),
+                                                       mode="r", shape=(meta["rows"], *shape))
+                self.shards.append(shard)
+        self._offsets = np.cumsum([0] + [shard["rows"] for shard in self.shards])
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def column(self, name):
+        """One column of every shard (memmaps, nothing is loaded)."""
+        return [shard["columns"][name] for shard in self.shards]
+
+    def gather(self, indices, names=("frames", "actions")):
+        """Rows at global `indices` as in-memory arrays, in the order given."""
+        indices = np.asarray(indices)
+        shard_ids = np.searchsorted(self._offsets, indices, side="right") - 1
+        result = {name: np.empty((len(indices), *self.shards[0]["columns"][name].shape[1:]),
+                                 dtype=self.shards[0]["columns"][name].dtype) for name in names}
+        for shard_id in np.unique(shard_ids):
+            positions = np.flatnonzero(shard_ids == shard_id)
+            local = indices[positions] - self._offsets[shard_id]
+            order = np.argsort(local)
+            for name in names:
+                result[name][positions[order]] = self.shards[shard_id]["columns"][name][local[order]]
+        return result
+
+    def batches(self, batch_size=256, shuffle=True, seed=None, names=("frames", "actions"), drop_last=False):
+        """Yield dicts of `names` -> arrays, one pass over the dataset."""
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        for start in range(0, stop, batch_size):
+            yield self.gather(order[start:start + batch_size], names)
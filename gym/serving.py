@@ -0,0 +1,30 @@
+import os
+import time
+
+from flask import jsonify
+
+
+def add_health_routes(app, is_ready=lambda: True, startup_seconds=lambda: None):
+    """Add /health (the process is alive) and /ready (it can answer /move) to a snake server.
+
+    `startup_seconds` returns how long the server took to become ready (None while
+    unknown); it is included in both responses.
+    """
+    started = time.time()
+
+    def status(value):
+        body = {"status": value, "pid": os.getpid()}
+        startup = startup_seconds()
+        if startup is not None:
+            body["startup_seconds"] = round(startup, 3)
+        return body
+
+    @app.route("/health", methods=["GET"])
+    def health():
+        return jsonify(dict(status("ok"), uptime=round(time.time() - started, 3)))
+
+    @app.route("/ready", methods=["GET"])
+    def ready():
+        if not is_ready():
+            return jsonify(status("starting")), 503
+        return jsonify(status("ready"))
@@ -0,0 +1,211 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from observation import observation_space
+
+
+def _views(buffers, n_envs, space):
+    """NumPy views over the shared blocks: obs, terminal obs, rewards, dones and actions."""
+    return (
+        np.ndarray((n_envs, *space.shape), dtype=space.dtype, buffer=buffers["obs"].buf),
+        np.ndarray((n_envs, *space.shape), dtype=space.dtype, buffer=buffers["terminal"].buf),
+        np.ndarray(n_envs, dtype=np.float32, buffer=buffers["rewards"].buf),
+        np.ndarray(n_envs, dtype=bool, buffer=buffers["dones"].buf),
+        np.ndarray(n_envs, dtype=np.int64, buffer=buffers["actions"].buf),
+    )
+
+
+def _worker(remote, parent_remote, names, n_envs, start, stop, width, height, observation, env_fn):
+    """Run a batched env over envs [start, stop) and write its results into shared memory."""
+    from battlesnake_vec_env import BattlesnakeVecEnv
+
+    parent_remote.close()
+    buffers = {key: shared_memory.SharedMemory(name=name) for key, name in names.items()}
+    obs, terminal, rewards, dones, actions = _views(buffers, n_envs, observation_space(observation, width, height))
+    if env_fn is None:
+        env = BattlesnakeVecEnv(n_envs=stop - start, width=width, height=height, observation=observation)
+    else:
+        env = env_fn(stop - start)
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                env.step_async(actions[start:stop])
+                step_obs, step_rewards, step_dones, infos = env.step_wait()
+                obs[start:stop] = step_obs
+                rewards[start:stop] = step_rewards
+                dones[start:stop] = step_dones
+                for env_idx in np.flatnonzero(step_dones):
+                    terminal[start + env_idx] = infos[env_idx]["terminal_observation"]
+                remote.send(None)
+            elif cmd == "reset":
+                env._seeds = data
+                obs[start:stop] = env.reset()
+                remote.send(None)
+            elif cmd == "env_method":
+                method_name, args, kwargs = data
+                remote.send(env.env_method(method_name, *args, **kwargs))
+            elif cmd == "get_attr":
+                remote.send(env.get_attr(data))
+            elif cmd == "has_attr":
+                remote.send(hasattr(env, data))
+            elif cmd == "set_attr":
+                try:
+                    env.set_attr(*data)
+                except ValueError as error:
+                    remote.send(error)
+                else:
+                    remote.send(None)
+            elif cmd == "close":
+                # Miljøets recorder skriver sin sidste chunk, før hovedprocessen får svar
+                env.close()
+                remote.send(None)
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+    except (EOFError, KeyboardInterrupt):
+        # Hovedprocessen er væk; gem alligevel det, der er optaget
+        env.close()
+    finally:
+        for buffer in buffers.values():
+            buffer.close()
+        remote.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """BattlesnakeVecEnv batches spread over worker processes.
+
+    Each worker steps its own slice of games with the batched NumPy engine, or with
+    `env_fn(n_envs)` if given (a picklable factory for another batched VecEnv with
+    the same spaces, e.g. a LeagueVecEnv). `observation` picks the observation
+    encoding (see observation.py) and must match what env_fn builds.
+    Observations, rewards, dones, terminal observations and actions live in shared
+    memory. The pipes only carry short commands and acknowledgements, so nothing
+    is pickled per step.
+    """
+
+    def __init__(self, n_workers=4, envs_per_worker=8, width=11, height=11, start_method=None, env_fn=None,
+                 observation="board"):
+        self.width = width
+        self.height = height
+        self.render_mode = None
+        self.waiting = False
+        self.closed = False
+
+        n_envs = n_workers * envs_per_worker
+        space = observation_space(observation, width, height)
+        obs_bytes = n_envs * int(np.prod(space.shape)) * space.dtype.itemsize
+        sizes = {
+            "obs": obs_bytes,
+            "terminal": obs_bytes,
+            "rewards": n_envs * 4,
+            "dones": n_envs,
+            "actions": n_envs * 8,
+        }
+        self._buffers = {key: shared_memory.SharedMemory(create=True, size=size) for key, size in sizes.items()}
+        self._obs, self._terminal, self._rewards, self._dones, self._actions = _views(self._buffers, n_envs, space)
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        names = {key: buffer.name for key, buffer in self._buffers.items()}
+        self._slices = [(worker * envs_per_worker, (worker + 1) * envs_per_worker) for worker in range(n_workers)]
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_workers)])
+        self.processes = []
+        for work_remote, remote, (start, stop) in zip(self.work_remotes, self.remotes, self._slices):
+            args = (work_remote, remote, names, n_envs, start, stop, width, height, observation, env_fn)
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        super().__init__(n_envs, space, spaces.Discrete(4))
+
+    def reset(self):
+        for remote, (start, stop) in zip(self.remotes, self._slices):
+            remote.send(("reset", self._seeds[start:stop]))
+        for remote in self.remotes:
+            remote.recv()
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs.copy()
+
+    def step_async(self, actions):
+        self._actions[:] = np.asarray(actions).reshape(self.num_envs)
+        for remote in self.remotes:
+            remote.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self):
+        for remote in self.remotes:
+            remote.recv()
+        self.waiting = False
+
+        infos = [{"TimeLimit.truncated": False} for _ in range(self.num_envs)]
+        for env_idx in np.flatnonzero(self._dones):
+            infos[env_idx]["terminal_observation"] = self._terminal[env_idx].copy()
+        return self._obs.copy(), self._rewards.copy(), self._dones.copy(), infos
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for remote in self.remotes:
+            remote.recv()
+        for process in self.processes:
+            process.join()
+        for buffer in self._buffers.values():
+            buffer.close()
+            buffer.unlink()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        if attr_name == "render_mode":
+            return [None for _ in self._get_indices(indices)]
+        return [self._call_env(env_idx, "get_attr", attr_name)[0] for env_idx in self._get_indices(indices)]
+
+    def has_attr(self, attr_name):
+        # Metoder som action_masks kan ikke sendes gennem en pipe, så kun svaret sendes
+        for remote in self.remotes:
+            remote.send(("has_attr", attr_name))
+        return all([remote.recv() for remote in self.remotes])
+
+    def set_attr(self, attr_name, value, indices=None):
+        """Set the attribute in the workers that hold `indices`; a worker's batch only takes all of its envs."""
+        indices = set(self._get_indices(indices))
+        remotes = []
+        for remote, (start, stop) in zip(self.remotes, self._slices):
+            local = [env_idx - start for env_idx in range(start, stop) if env_idx in indices]
+            if local:
+                remote.send(("set_attr", (attr_name, value, local)))
+                remotes.append(remote)
+        for remote in remotes:
+            error = remote.recv()
+            if error is not None:
+                raise error
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        """Call a batched BattlesnakeVecEnv method in every worker and concatenate per env."""
+        for remote in self.remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        results = [result for remote in self.remotes for result in remote.recv()]
+        return [results[env_idx] for env_idx in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _call_env(self, env_idx, cmd, data):
+        for worker, (start, stop) in enumerate(self._slices):
+            if start <= env_idx < stop:
+                self.remotes[worker].send((cmd, data))
+                return self.remotes[worker].recv()
+        raise IndexError(env_idx)
@@ -1,35 +1,27 @@
 import random
-from collections import deque
 import numpy as np
+from board_state import SnakeBody
+from spatial import board_mask, diamond_masks
 
 class SimpleSnake:
     def __init__(self):
         """Initialize the snake with default values."""
         self.head = None
-        self.body = []
+        self.body = SnakeBody()
+        self.width = None
 
     def reset(self, width, height):
         """Reset the snake to its initial position."""
+        self.width = width
         self.head = {"x": width // 4, "y": height // 4}
-        self.body = [self.head]
+        self.body = SnakeBody([self.head["y"] * width + self.head["x"]])
 
-    def _heuristic_space(self, board, start):
+    def _heuristic_space(self, free, start, width, height):
             """Estimer plads baseret på Manhattan-afstand."""
-            width, height = board.shape
-            x, y = start["x"], start["y"]
-
-            # Tæl gyldige celler inden for en bestemt afstand
+            # Tæl frie celler inden for en bestemt afstand, via forudberegnede diamant-masker
             max_distance = min(width, height)  # Begræns søgeområdet
-            score = 0
-
-            for dx in range(-max_distance, max_distance + 1):
-                for dy in range(-max_distance, max_distance + 1):
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < width and 0 <= ny < height and abs(dx) + abs(dy) <= max_distance:
-                        if board[ny, nx] == 0:  # Kun frie celler
-                            score += 1
-
-            return score
+            diamond = diamond_masks(width, height, max_distance)[start["y"] * width + start["x"]]
+            return (free & diamond).bit_count()
 
     def get_action(self, board):
         """Determine the action for the snake based on the board."""
@@ -53,7 +45,8 @@ class SimpleSnake:
 
         # Evaluér gyldige træk med _heuristic_space
         if valid_moves:
-            move_scores = {move: self._heuristic_space(board, next_head) for move, next_head in valid_moves.items()}
+            free = board_mask(board == 0)  # Kun frie celler
+            move_scores = {move: self._heuristic_space(free, next_head, board.shape[1], board.shape[0]) for move, next_head in valid_moves.items()}
             # Prioritér mad, hvis muligt
             for move, next_head in valid_moves.items():
                 if board[next_head["y"], next_head["x"]] == 5:  # Mad
@@ -67,6 +60,6 @@ class SimpleSnake:
 
     def move(self, new_head):
         """Update the snake's position based on the new head."""
-        self.body.insert(0, new_head)  # Add new head to the body
+        self.body.push(new_head["y"] * self.width + new_head["x"])  # Add new head to the body
         self.head = new_head  # Update the head reference
         self.body.pop()  # Remove the tail segment to simulate movement
@@ -0,0 +1,164 @@
+"""Spatial analysis on flat boards: cells are y * width + x, blocked cells are a bitmask int.
+
+Neighbour lists are precomputed once per board size and always ordered
++y, -y, -x, +x (the Battlesnake API's up, down, left, right).
+"""
+from collections import deque
+from functools import lru_cache
+
+DELTAS = ((0, 1), (0, -1), (-1, 0), (1, 0))
+
+
+@lru_cache(maxsize=None)
+def neighbor_table(width, height):
+    """For every cell, the tuple of on-board neighbour cells in DELTAS order."""
+    table = []
+    for cell in range(width * height):
+        x, y = cell % width, cell // width
+        table.append(tuple(
+            (y + dy) * width + x + dx
+            for dx, dy in DELTAS
+            if 0 <= x + dx < width and 0 <= y + dy < height
+        ))
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def _bitboard_geometry(width, height):
+    full = (1 << (width * height)) - 1
+    first_column = 0
+    for y in range(height):
+        first_column |= 1 << (y * width)
+    return full, first_column, first_column << (width - 1)
+
+
+def neighbor_mask(mask, width, height):
+    """All cells next to a cell in `mask`, as one bitmask."""
+    full, first_column, last_column = _bitboard_geometry(width, height)
+    return (
+        ((mask & ~last_column) << 1) |
+        ((mask & ~first_column) >> 1) |
+        (mask << width) |
+        (mask >> width)
+    ) & full
+
+
+def bfs(width, height, blocked, start, goal=None):
+    """Breadth-first search from `start` over unblocked cells.
+
+    Returns (distance, parent) as flat lists (-1 = not reached). The start cell is
+    always expanded, even if blocked (it is usually a snake head). Stops early
+    once `goal` is reached.
+    """
+    neighbors = neighbor_table(width, height)
+    distance = [-1] * (width * height)
+    parent = [-1] * (width * height)
+    distance[start] = 0
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if cell == goal:
+            break
+        next_distance = distance[cell] + 1
+        for neighbor in neighbors[cell]:
+            if distance[neighbor] < 0 and not (blocked >> neighbor) & 1:
+                distance[neighbor] = next_distance
+                parent[neighbor] = cell
+                queue.append(neighbor)
+    return distance, parent
+
+
+def shortest_path(width, height, blocked, start, goal):
+    """Cells from the step after `start` up to `goal`, or None if unreachable."""
+    distance, parent = bfs(width, height, blocked, start, goal)
+    if distance[goal] < 0:
+        return None
+    path = []
+    cell = goal
+    while cell != start:
+        path.append(cell)
+        cell = parent[cell]
+    path.reverse()
+    return path
+
+
+def component_labels(width, height, blocked):
+    """Label the connected regions of unblocked cells in one pass.
+
+    Returns (labels, sizes): labels[cell] is the region index (-1 for blocked cells)
+    and sizes[label] its cell count.
+    """
+    neighbors = neighbor_table(width, height)
+    labels = [-1] * (width * height)
+    sizes = []
+    for seed in range(width * height):
+        if labels[seed] >= 0 or (blocked >> seed) & 1:
+            continue
+        label = len(sizes)
+        labels[seed] = label
+        stack = [seed]
+        size = 0
+        while stack:
+            cell = stack.pop()
+            size += 1
+            for neighbor in neighbors[cell]:
+                if labels[neighbor] < 0 and not (blocked >> neighbor) & 1:
+                    labels[neighbor] = label
+                    stack.append(neighbor)
+        sizes.append(size)
+    return labels, sizes
+
+
+def reachable_areas(width, height, blocked, starts):
+    """Size of the open region around each start cell (0 for blocked starts), from one labelling pass."""
+    labels, sizes = component_labels(width, height, blocked)
+    return [sizes[labels[cell]] if labels[cell] >= 0 else 0 for cell in starts]
+
+
+def voronoi(width, height, blocked, sources):
+    """Cells each source reaches strictly first, expanding all sources one layer at a time.
+
+    `sources` are bitmasks (a head, or several heads treated as one team); cells two
+    sources reach in the same layer belong to nobody. Returns the count per source.
+    """
+    free = _bitboard_geometry(width, height)[0] & ~blocked
+    frontiers = list(sources)
+    claimed = 0
+    for frontier in frontiers:
+        claimed |= frontier
+    areas = [0] * len(frontiers)
+    while any(frontiers):
+        reached = [neighbor_mask(frontier, width, height) & free & ~claimed for frontier in frontiers]
+        for i, cells in enumerate(reached):
+            contested = 0
+            for j, other in enumerate(reached):
+                if i != j:
+                    contested |= other
+            frontiers[i] = cells & ~contested
+            areas[i] += frontiers[i].bit_count()
+        for cells in reached:
+            claimed |= cells
+    return areas
+
+
+@lru_cache(maxsize=None)
+def diamond_masks(width, height, radius):
+    """For every cell, the bitmask of cells within Manhattan distance `radius`."""
+    masks = []
+    for cell in range(width * height):
+        x, y = cell % width, cell // width
+        mask = 0
+        for ny in range(max(0, y - radius), min(height, y + radius + 1)):
+            reach = radius - abs(ny - y)
+            for nx in range(max(0, x - reach), min(width, x + reach + 1)):
+                mask |= 1 << (ny * width + nx)
+        masks.append(mask)
+    return tuple(masks)
+
+
+def board_mask(condition):
+    """Bitmask of the cells where a boolean NumPy board (any shape, row-major) is True."""
+    import numpy as np
+
+    packed = np.packbits(np.asarray(condition, dtype=bool).ravel(), bitorder="little")
+    return int.from_bytes(packed.tobytes(), "little")
@@ -0,0 +1,151 @@
+"""Rotations and reflections of the board for observations, actions and PPO rollouts.
+
+A Battlesnake position played mirrored or rotated is the same position, so every
+transition PPO collects is also a valid transition in each of the board's
+symmetries: 8 on a square board (the dihedral group), 4 on a rectangular one.
+BoardSymmetry permutes the cells of flat observations ("board" or "channels",
+see observation.py) and the env actions with precomputed index arrays, so a
+whole rollout buffer is transformed with one fancy-indexing operation per array.
+
+augment_rollout_buffer() expands PPO's rollout buffer into all variants after
+each rollout, up to 8x the samples per env step (SymmetryCallback in
+auto-training.py). average_log_probabilities() is the inference side: the policy
+sees every variant and the action probabilities are mapped back and averaged.
+"""
+import numpy as np
+
+# Env-handlingernes retning i cellekoordinater (celle = y * width + x), som DX/DY i battlesnake_vec_env.py
+DX = np.array([0, 0, -1, 1], dtype=np.int64)
+DY = np.array([-1, 1, 0, 0], dtype=np.int64)
+
+
+def transforms(width, height):
+    """(swap, flip_x, flip_y) for every symmetry of the board, identity first."""
+    return [
+        (swap, flip_x, flip_y)
+        for swap in ((False, True) if width == height else (False,))
+        for flip_x in (False, True)
+        for flip_y in (False, True)
+    ]
+
+
+class BoardSymmetry:
+    """Index arrays that apply each board symmetry to flat observations and env actions.
+
+    cells[s] gathers a transformed observation from the original (per channel) and
+    actions[s] maps an original action to the transformed one.
+    """
+
+    def __init__(self, width, height, symmetries=None):
+        self.width = width
+        self.height = height
+        self.transforms = symmetries or transforms(width, height)
+
+        x, y = np.meshgrid(np.arange(width), np.arange(height))
+        x, y = x.reshape(-1), y.reshape(-1)
+        self.cells = np.empty((len(self.transforms), width * height), dtype=np.int64)
+        self.actions = np.empty((len(self.transforms), len(DX)), dtype=np.int64)
+        for s, (swap, flip_x, flip_y) in enumerate(self.transforms):
+            new_x, new_y = (y, x) if swap else (x, y)
+            new_x = width - 1 - new_x if flip_x else new_x
+            new_y = height - 1 - new_y if flip_y else new_y
+            # Cellen (x, y) havner på (new_x, new_y), så den transformerede observation henter derfra
+            self.cells[s, new_y * width + new_x] = y * width + x
+
+            dx, dy = (DY, DX) if swap else (DX, DY)
+            dx, dy = (-dx if flip_x else dx), (-dy if flip_y else dy)
+            for action in range(len(DX)):
+                self.actions[s, action] = np.flatnonzero((DX == dx[action]) & (DY == dy[action]))[0]
+
+    def __len__(self):
+        return len(self.transforms)
+
+    def observations(self, observations):
+        """All variants of `observations` (..., channels * cells), stacked on a new first axis."""
+        observations = np.asarray(observations)
+        cells = self.width * self.height
+        planes = observations.reshape(*observations.shape[:-1], -1, cells)
+        # (..., kanaler, symmetri, celler) -> (symmetri, ..., kanaler * celler)
+        variants = np.moveaxis(planes[..., self.cells], -2, 0)
+        return variants.reshape(len(self), *observations.shape)
+
+    def transform_actions(self, actions):
+        """All variants of an int array of env actions, stacked on a new first axis."""
+        return self.actions[:, np.asarray(actions)]
+
+    def average_log_probabilities(self, log_probabilities, observations):
+        """Log of the action probabilities averaged over every symmetry of the board.
+
+        `log_probabilities` maps a batch of observations to (batch, actions); it is
+        called once on all variants together. The average is taken in log space,
+        so unlikely actions keep a finite log-probability instead of underflowing to 0.
+        """
+        observations = np.asarray(observations).reshape(-1, np.shape(observations)[-1])
+        variants = self.observations(observations)
+        transformed = log_probabilities(variants.reshape(-1, observations.shape[-1])).reshape(len(self), len(observations), -1)
+        # Sandsynligheden for den oprindelige handling a er variantens sandsynlighed for actions[s, a]
+        aligned = np.take_along_axis(transformed, self.actions[:, None, :], axis=2)
+        top = aligned.max(axis=0)
+        return top + np.log(np.exp(aligned - top).mean(axis=0))
+
+
+def augment_rollout_buffer(buffer, policy, symmetry):
+    """Expand a filled SB3 RolloutBuffer in place with every symmetric variant of its transitions.
+
+    Rewards, returns and advantages are the same in every variant. The variants'
+    log-probabilities and values are recomputed with `policy`, which has not been
+    updated since the rollout, so PPO's ratio starts at 1 for them as for the
+    originals. Returns the original n_envs for restore_rollout_buffer().
+    """
+    import torch
+
+    n_envs = buffer.n_envs
+    k = len(symmetry)
+    observations = symmetry.observations(buffer.observations)
+    actions = symmetry.transform_actions(buffer.actions.astype(np.int64)).astype(buffer.actions.dtype)
+
+    # MaskablePPO's buffer har også action masks: maskens søjle for actions[s, a] er den oprindelige søjle a
+    masks = getattr(buffer, "action_masks", None)
+    if masks is not None:
+        masks = np.moveaxis(masks[..., np.argsort(symmetry.actions, axis=1)], -2, 0)
+
+    values = np.repeat(buffer.values[None], k, axis=0)
+    log_probs = np.repeat(buffer.log_probs[None], k, axis=0)
+    flat_observations = observations[1:].reshape(-1, observations.shape[-1])
+    flat_actions = actions[1:].reshape(-1)
+    new_values, new_log_probs = [], []
+    with torch.no_grad():
+        for start in range(0, len(flat_actions), 8192):
+            obs = torch.as_tensor(flat_observations[start:start + 8192], device=policy.device)
+            act = torch.as_tensor(flat_actions[start:start + 8192], device=policy.device)
+            if masks is None:
+                value, log_prob, _ = policy.evaluate_actions(obs, act)
+            else:
+                mask = masks[1:].reshape(-1, masks.shape[-1])[start:start + 8192]
+                value, log_prob, _ = policy.evaluate_actions(obs, act, action_masks=mask)
+            new_values.append(value.flatten().cpu().numpy())
+            new_log_probs.append(log_prob.cpu().numpy())
+    values[1:] = np.concatenate(new_values).reshape(values[1:].shape)
+    log_probs[1:] = np.concatenate(new_log_probs).reshape(log_probs[1:].shape)
+
+    # (variant, step, env, ...) -> (step, variant * n_envs + env, ...), som en rollout med k gange så mange miljøer
+    def widen(array):
+        return np.moveaxis(array, 0, 1).reshape(array.shape[1], k * n_envs, *array.shape[3:])
+
+    buffer.observations = widen(observations)
+    buffer.actions = widen(actions)
+    buffer.values = widen(values)
+    buffer.log_probs = widen(log_probs)
+    if masks is not None:
+        buffer.action_masks = widen(masks)
+    for name in ("rewards", "returns", "advantages", "episode_starts"):
+        setattr(buffer, name, np.tile(getattr(buffer, name), (1, k)))
+    buffer.n_envs = k * n_envs
+    return n_envs
+
+
+def restore_rollout_buffer(buffer, n_envs):
+    """Shrink an augmented buffer back to the env's n_envs before it is filled again."""
+    buffer.n_envs = n_envs
+    buffer.reset()
+
@@ -0,0 +1,71 @@
+"""Parity of the exported NumPy policy with SB3: python -m pytest gym/test_numpy_policy.py"""
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from action_mask import load_model
+from export_policy import check_parity, export_policy
+from numpy_policy import NumpyPolicy
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trained-snake", "test123.zip")
+
+
+@pytest.fixture(scope="module")
+def model():
+    return load_model(MODEL_PATH, device="cpu")
+
+
+@pytest.fixture(scope="module")
+def policy(model, tmp_path_factory):
+    # Gennem en fil, som serverne indlæser den
+    path = str(tmp_path_factory.mktemp("export") / "test123.npz")
+    export_policy(model).save(path)
+    return NumpyPolicy.load(path, seed=0)
+
+
+@pytest.fixture(scope="module")
+def observations(policy):
+    return np.random.default_rng(0).integers(0, 6, size=(500, policy.input_size)).astype(np.int32)
+
+
+def test_logits_match_sb3(model, policy, observations):
+    with torch.no_grad():
+        obs_tensor, _ = model.policy.obs_to_tensor(observations)
+        expected = model.policy.get_distribution(obs_tensor).distribution.logits.cpu().numpy()
+    assert np.abs(policy.log_probabilities(observations) - expected).max() < 1e-4
+
+
+def test_greedy_actions_match_sb3(model, policy, observations):
+    sb3_actions, _ = model.predict(observations, deterministic=True)
+    numpy_actions, _ = policy.predict(observations, deterministic=True)
+    assert (sb3_actions == numpy_actions).all()
+    assert check_parity(model, policy) < 1e-4
+
+
+def test_single_observation_is_unbatched(policy, observations):
+    action, state = policy.predict(observations[0], deterministic=True)
+    assert np.ndim(action) == 0 and state is None
+    assert action == policy.predict(observations[:1], deterministic=True)[0][0]
+
+
+def test_masked_predict_only_picks_allowed_actions(policy, observations):
+    masks = np.random.default_rng(1).random((len(observations), 4)) < 0.5
+    masks[~masks.any(axis=1), 0] = True
+
+    greedy, _ = policy.predict(observations, deterministic=True, mask=masks)
+    probabilities = np.where(masks, policy.action_probabilities(observations), -1)
+    assert (greedy == probabilities.argmax(axis=1)).all()
+    for _ in range(5):
+        sampled, _ = policy.predict(observations, mask=masks)
+        assert masks[np.arange(len(observations)), sampled].all()
+
+
+def test_mask_survives_a_peaked_policy():
+    # Tilladte træk ville underflowe til sandsynlighed 0 i float32
+    peaked = NumpyPolicy([np.zeros((4, 121))], [np.array([0.0, -300.0, -200.0, -250.0])], seed=0)
+    observation = np.zeros(121, dtype=np.int32)
+    mask = np.array([False, True, True, False])
+    assert peaked.predict(observation, deterministic=True, mask=mask)[0] == 2
+    assert {int(peaked.predict(observation, mask=mask)[0]) for _ in range(20)} <= {1, 2}
@@ -1,8 +1,7 @@
 from stable_baselines3 import PPO
-from stable_baselines3.common.env_util import make_vec_env
-from battlesnake_env import BattlesnakeEnv
+from battlesnake_vec_env import BattlesnakeVecEnv
 
-env = make_vec_env(BattlesnakeEnv, n_envs=1)
+env = BattlesnakeVecEnv(n_envs=8)
 
 model = PPO("MlpPolicy", env, verbose=1, device="cpu", learning_rate=0.0001)
 
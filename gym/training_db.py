@@ -0,0 +1,125 @@
+"""SQLite record of the generational training in auto-training.py.
+
+One row per generation (base model, best model, timings) and one per candidate
+model (parent, seed, status, trained timesteps, score, timings). main() reads it
+back to resume an interrupted run where it stopped. Only the orchestrating
+process writes to it; training workers report through their return values.
+"""
+import os
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    generation INTEGER PRIMARY KEY,
+    base_model TEXT,
+    best_model TEXT,
+    started REAL,
+    finished REAL,
+    train_seconds REAL,
+    eval_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS models (
+    path TEXT PRIMARY KEY,
+    generation INTEGER,
+    candidate INTEGER,
+    parent TEXT,
+    seed INTEGER,
+    status TEXT,
+    timesteps INTEGER DEFAULT 0,
+    score REAL,
+    train_seconds REAL,
+    created REAL
+);
+"""
+
+# Modellernes status i rækkefølge
+PLANNED = "planned"
+TRAINED = "trained"
+EVALUATED = "evaluated"
+PRUNED = "pruned"
+
+
+class TrainingDB:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Generationer
+
+    def last_generation(self):
+        """The newest generation row, finished or not (None on a new database)."""
+        return self.conn.execute("SELECT * FROM generations ORDER BY generation DESC LIMIT 1").fetchone()
+
+    def start_generation(self, generation, base_model):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO generations (generation, base_model, started) VALUES (?, ?, ?)",
+                (generation, base_model, time.time()),
+            )
+
+    def finish_generation(self, generation, best_model, train_seconds, eval_seconds):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE generations SET best_model = ?, finished = ?, train_seconds = ?, eval_seconds = ? WHERE generation = ?",
+                (best_model, time.time(), train_seconds, eval_seconds, generation),
+            )
+
+    # Modeller
+
+    def add_model(self, path, generation, candidate=None, parent=None, seed=None, status=PLANNED):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO models (path, generation, candidate, parent, seed, status, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, generation, candidate, parent, seed, status, time.time()),
+            )
+
+    def model(self, path):
+        return self.conn.execute("SELECT * FROM models WHERE path = ?", (path,)).fetchone()
+
+    def models(self, generation=None, status=None):
+        query, args = "SELECT * FROM models WHERE 1 = 1", []
+        if generation is not None:
+            query += " AND generation = ?"
+            args.append(generation)
+        if status is not None:
+            query += " AND status = ?"
+            args.append(status)
+        return self.conn.execute(query + " ORDER BY generation, candidate", args).fetchall()
+
+    def model_trained(self, path, timesteps, train_seconds):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE models SET status = ?, timesteps = ?, train_seconds = ? WHERE path = ?",
+                (TRAINED, timesteps, train_seconds, path),
+            )
+
+    def model_scored(self, path, score):
+        with self.conn:
+            self.conn.execute("UPDATE models SET status = ?, score = ? WHERE path = ?", (EVALUATED, score, path))
+
+    def model_pruned(self, path):
+        with self.conn:
+            self.conn.execute("UPDATE models SET status = ? WHERE path = ?", (PRUNED, path))
+
+    def dominated(self, keep, protected=()):
+        """Evaluated models outside the `keep` best scores, except the `protected` ones."""
+        rows = self.conn.execute(
+            "SELECT path FROM models WHERE status = ? ORDER BY score DESC", (EVALUATED,)
+        ).fetchall()
+        return [row["path"] for row in rows[keep:] if row["path"] not in protected]
+
+
+def remove_model_files(path):
+    """Delete a model and the files written next to it (.npz export, profile, checkpoint)."""
+    stem = os.path.splitext(path)[0]
+    directory, name = os.path.split(stem)
+    for file in (path, stem + ".npz", stem + ".profile.json", os.path.join(directory, "checkpoints", name + ".zip")):
+        if os.path.exists(file):
+            os.remove(file)
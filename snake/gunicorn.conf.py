@@ -0,0 +1,20 @@
+# Produktionsserver: gunicorn -c gunicorn.conf.py main:app (køres fra denne mappe)
+#
+# main.py importerer fælles moduler fra ../gym, så en deployment skal have repoets layout:
+#   <rod>/gym/*.py og <rod>/snake/ (se requirements.txt).
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+
+# Flere processer, så et langsomt /move ikke blokerer de andre spil
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", "4"))
+
+# Appen indlæses én gang i master-processen og deles copy-on-write efter fork
+preload_app = True
+
+# Battlesnake giver 500 ms pr. træk; en hængende worker genstartes
+timeout = 30
+keepalive = 5
@@ -1,8 +1,51 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+import os
 import random
-from collections import deque
+import sys
+import time
+
+# Fælles moduler (board_state m.fl.) ligger i gym/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gym"))
+from board_state import BoardState
+from game_cache import GameStateCache
+from metrics import ServerMetrics
+from serving import add_health_routes
+from search import search_move
+from spatial import reachable_areas, shortest_path
+from transposition import PositionHash, TranspositionTable, cached_move
 
 app = Flask(__name__)
+add_health_routes(app)
+
+# "heuristic" vælger ét træk frem, "search" søger dybere inden for tidsbudgettet
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "heuristic")
+# Tidsbudget for /move i millisekunder, målt fra requestens ankomst
+MOVE_DEADLINE_MS = int(os.environ.get("MOVE_DEADLINE_MS", "350"))
+
+# Brættet for hvert igangværende spil, opdateret med hver turs ændringer
+games = GameStateCache()
+
+# GET /metrics: svartider pr. endpoint og fase; svar på NEAR_DEADLINE_MS eller mere tælles for sig
+NEAR_DEADLINE_MS = int(os.environ.get("NEAR_DEADLINE_MS", str(MOVE_DEADLINE_MS * 4 // 5)))
+metrics = ServerMetrics(NEAR_DEADLINE_MS)
+metrics.install(app)
+metrics.add_gauge("battlesnake_games_in_flight", "Games in this process's board cache", lambda: len(games))
+
+# Stillinger, der allerede er regnet på (på tværs af spil og spejlinger), og deres træk; 0 slår cachen fra
+MOVE_CACHE_SIZE = int(os.environ.get("MOVE_CACHE_SIZE", "100000"))
+move_cache = TranspositionTable(MOVE_CACHE_SIZE)
+
+# Sæt REPLAY_DIR for at gemme alle spil (bræt + valgt træk) til behaviour cloning
+REPLAY_DIR = os.environ.get("REPLAY_DIR")
+recorder = None
+if REPLAY_DIR:
+    # Optagelsen kræver numpy, som serveren ellers kan undvære
+    from replay import GameRecorder
+    recorder = GameRecorder(REPLAY_DIR)
+
+@app.before_request
+def record_arrival():
+    g.arrival = time.perf_counter()
 
 @app.route("/", methods=["GET"])
 def index():
@@ -17,12 +60,50 @@ def index():
 
 @app.route("/start", methods=["POST"])
 def start():
+    games.start(request.json)
     return jsonify({"color": "#88CC88", "headType": "beluga", "tailType": "round-bum"})
 
 @app.route("/move", methods=["POST"])
 def move():
-    data = request.json
-
+    with metrics.phase("parse"):
+        data = request.json
+    with metrics.phase("board"):
+        game, changed = games.update(data)
+    if MOVE_CACHE_SIZE:
+        best_move = cached_heuristic_move(data, game, changed)
+    else:
+        best_move = choose_move(data, game.state)
+
+    if SEARCH_MODE == "search":
+        deadline = g.arrival + MOVE_DEADLINE_MS / 1000
+        with metrics.phase("search"):
+            best_move = search_move(game.state, data["you"]["id"], deadline, fallback=best_move)
+
+    if recorder:
+        recorder.record_move(data, best_move, game.state)
+    with metrics.phase("serialize"):
+        return jsonify({"move": best_move})
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "moves": move_cache.stats(),
+        "games": {"size": len(games), "hits": games.hits, "rebuilds": games.rebuilds},
+    })
+
+def cached_heuristic_move(data, game, changed):
+    """choose_move() through the transposition table, hashing only the cells that changed this turn."""
+    you_id = data["you"]["id"]
+    with metrics.phase("hash"):
+        if game.extra is None or changed is None:
+            game.extra = PositionHash(game.state, you_id)
+        else:
+            game.extra.update(game.state, you_id, changed)
+    # Ved lige gode træk kan et spejlet opslag give et andet, men symmetrisk lige så godt, træk
+    return cached_move(move_cache, game.extra, lambda: choose_move(data, game.state))
+
+def choose_move(data, state=None):
+    """One-ply heuristic move: food via BFS when hungry, otherwise the safe move with most space."""
     # Board and snake details
     board = data["board"]
     width, height = board["width"], board["height"]
@@ -34,11 +115,17 @@ def move():
 
     # Other snakes
     snakes = board["snakes"]
-    max_opponent_length = max(snake["length"] for snake in snakes if snake["id"] != you["id"])
+    max_opponent_length = max((snake["length"] for snake in snakes if snake["id"] != you["id"]), default=0)
 
     # Food locations
     food = board["food"]
 
+    # Occupancy bitmask for O(1) collision tests
+    if state is None:
+        with metrics.phase("board"):
+            state = BoardState.from_request(data)
+    occupied = state.occupied
+
     # Directions
     moves = {
         "up": {"x": head["x"], "y": head["y"] + 1},
@@ -53,10 +140,7 @@ def move():
         if cell["x"] < 0 or cell["x"] >= width or cell["y"] < 0 or cell["y"] >= height:
             return False
         # Check collisions with any snake body
-        for snake in snakes:
-            if {"x": cell["x"], "y": cell["y"]} in snake["body"]:
-                return False
-        return True
+        return not (occupied >> (cell["y"] * width + cell["x"])) & 1
 
     # Evaluate threats from opponent heads
     def is_threatened(cell):
@@ -68,25 +152,9 @@ def move():
                         return True
         return False
 
-    # Flood-fill to estimate space
-    def flood_fill(start):
-        visited = set()
-        queue = deque([start])
-        area = 0
-        while queue:
-            cell = queue.popleft()
-            if (cell["x"], cell["y"]) in visited:
-                continue
-            visited.add((cell["x"], cell["y"]))
-            area += 1
-            for direction in moves.values():
-                neighbor = {"x": cell["x"] + direction["x"] - head["x"], "y": cell["y"] + direction["y"] - head["y"]}
-                if is_safe(neighbor) and (neighbor["x"], neighbor["y"]) not in visited:
-                    queue.append(neighbor)
-        return area
-
     # Safe moves
-    safe_moves = {move: pos for move, pos in moves.items() if is_safe(pos) and not is_threatened(pos)}
+    with metrics.phase("safety"):
+        safe_moves = {move: pos for move, pos in moves.items() if is_safe(pos) and not is_threatened(pos)}
 
     # Find food only if necessary and uncontested
     if food and (length < max_opponent_length or health <= 80):
@@ -113,26 +181,16 @@ def move():
 
         # Use BFS to move towards the selected food if it's safe
         if best_food:
-            visited = set()
-            queue = deque([(head, [])])  # (current position, path to get there)
-            while queue:
-                current, path = queue.popleft()
-                if (current["x"], current["y"]) in visited:
-                    continue
-                visited.add((current["x"], current["y"]))
-
-                # Check if we've reached the best food
-                if current == best_food:
-                    return jsonify({"move": path[0]})  # Return the first step in the path
-
-                # Add neighbors to the queue
-                for move, direction in moves.items():
-                    neighbor = {"x": current["x"] + direction["x"] - head["x"], "y": current["y"] + direction["y"] - head["y"]}
-                    if is_safe(neighbor):
-                        queue.append((neighbor, path + [move]))
-
-    # Flood-fill for each safe move
-    move_scores = {move: flood_fill(pos) for move, pos in safe_moves.items()}
+            with metrics.phase("bfs"):
+                path = shortest_path(width, height, occupied, head["y"] * width + head["x"], best_food["y"] * width + best_food["x"])
+            if path:
+                first_step = {pos["y"] * width + pos["x"]: move for move, pos in moves.items() if 0 <= pos["x"] < width and 0 <= pos["y"] < height}
+                return first_step[path[0]]  # Return the first step in the path
+
+    # Flood-fill for each safe move, all from one labelling of the free regions
+    with metrics.phase("flood_fill"):
+        areas = reachable_areas(width, height, occupied, [pos["y"] * width + pos["x"] for pos in safe_moves.values()])
+    move_scores = dict(zip(safe_moves, areas))
 
     # Choose move with maximum space
     if move_scores:
@@ -140,13 +198,17 @@ def move():
     else:
         best_move = random.choice(list(safe_moves.keys())) if safe_moves else "up"
 
-    return jsonify({"move": best_move})
+    return best_move
 
 
 
 @app.route("/end", methods=["POST"])
 def end():
+    games.end(request.json)
+    if recorder:
+        recorder.end_game(request.json)
     return "Game over", 200
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    # Udviklingsserver; brug gunicorn -c gunicorn.conf.py main:app i produktion
+    app.run(host="0.0.0.0", port=8080, threaded=True)
@@ -0,0 +1,235 @@
+import time
+
+from spatial import voronoi
+
+# Samme koordinater som Battlesnake API'et: "up" øger y
+MOVES = {
+    "up": (0, 1),
+    "down": (0, -1),
+    "left": (-1, 0),
+    "right": (1, 0),
+}
+
+WIN = 100000
+LOSS = -100000
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the move deadline has passed."""
+
+
+def territory(state, you_id):
+    """Count the free cells `you_id` reaches strictly before every other snake (bitboard Voronoi)."""
+    ours = 1 << state.snakes[you_id].head
+    theirs = 0
+    for snake_id, body in state.snakes.items():
+        if snake_id != you_id:
+            theirs |= 1 << body.head
+    return voronoi(state.width, state.height, state.occupied, [ours, theirs])[0]
+
+
+def evaluate(state, you_id, ply, solo=False):
+    """Score a position for `you_id`; deaths and wins found earlier count more."""
+    if you_id not in state.snakes:
+        return LOSS + ply
+    if len(state.snakes) == 1 and not solo:
+        return WIN - ply
+
+    length = len(state.snakes[you_id])
+    longest_opponent = max((len(body) for snake_id, body in state.snakes.items() if snake_id != you_id), default=length)
+    health = state.health[you_id]
+
+    score = territory(state, you_id) * 10
+    score += max(-5, min(5, length - longest_opponent)) * 20
+    if health < 30:
+        score -= (30 - health) * 5
+    return score
+
+
+def candidate_moves(state, snake_id):
+    """Moves that do not run straight into a wall or a body (tails are assumed to move)."""
+    body = state.snakes[snake_id]
+    head_x, head_y = body.head % state.width, body.head // state.width
+    occupied = state.occupied
+    for snake in state.snakes.values():
+        # Halen flytter sig, medmindre slangen lige har spist (stablet hale)
+        if len(snake) > 1 and snake.cells[-2] != snake.tail:
+            occupied &= ~(1 << snake.tail)
+
+    moves = []
+    for move, (dx, dy) in MOVES.items():
+        x, y = head_x + dx, head_y + dy
+        if state.in_bounds(x, y) and not (occupied >> (y * state.width + x)) & 1:
+            moves.append(move)
+    return moves
+
+
+def advance(state, joint_moves):
+    """Return a new state after every snake in `joint_moves` has moved (standard rules)."""
+    state = state.copy()
+    width = state.width
+    new_heads = {}
+    for snake_id, move in joint_moves.items():
+        body = state.snakes[snake_id]
+        dx, dy = MOVES[move]
+        x, y = body.head % width + dx, body.head // width + dy
+        new_heads[snake_id] = y * width + x if state.in_bounds(x, y) else None
+
+    # Haler flyttes først, så man godt må følge efter en hale
+    for body in state.snakes.values():
+        body.pop()
+    occupied = state.occupied
+
+    dead = set()
+    for snake_id, head in new_heads.items():
+        if head is None or (occupied >> head) & 1 or state.health[snake_id] <= 1 and not (state.food >> head) & 1:
+            dead.add(snake_id)
+
+    # Hoved mod hoved: den korteste dør, ved lige længde dør begge
+    for snake_id, head in new_heads.items():
+        if head is None:
+            continue
+        length = len(state.snakes[snake_id])
+        for other_id, other_head in new_heads.items():
+            if other_id != snake_id and other_head == head and len(state.snakes[other_id]) >= length:
+                dead.add(snake_id)
+
+    eaten = 0
+    for snake_id, head in new_heads.items():
+        if snake_id in dead:
+            continue
+        body = state.snakes[snake_id]
+        body.push(head)
+        if (state.food >> head) & 1:
+            body.cells.append(body.tail)
+            state.health[snake_id] = 100
+            eaten |= 1 << head
+        else:
+            state.health[snake_id] -= 1
+    state.food &= ~eaten
+
+    for snake_id in dead:
+        del state.snakes[snake_id]
+        del state.health[snake_id]
+    return state
+
+
+class Search:
+    """Iterative-deepening paranoid search over simultaneous moves.
+
+    Every round we pick a move, then each nearby opponent picks the reply that is
+    worst for us, and all moves are resolved together. Opponents too far away to
+    interact within the search horizon just take their first candidate move.
+    """
+
+    def __init__(self, state, you_id, deadline):
+        self.state = state
+        self.you_id = you_id
+        self.deadline = deadline
+        self.solo = len(state.snakes) == 1
+        self.nodes = 0
+        self.depth = 0
+
+    def run(self, fallback=None, max_depth=32):
+        """Search until the deadline and return the best move from the deepest finished iteration."""
+        moves = candidate_moves(self.state, self.you_id)
+        if not moves:
+            return fallback or "up"
+        if fallback in moves:
+            moves.remove(fallback)
+            moves.insert(0, fallback)
+
+        best_move = moves[0]
+        for depth in range(1, max_depth + 1):
+            started = time.perf_counter()
+            try:
+                scores = self._root(moves, depth)
+            except SearchTimeout:
+                break
+            moves.sort(key=lambda move: -scores[move])
+            best_move = moves[0]
+            self.depth = depth
+
+            if scores[best_move] >= WIN - max_depth:
+                break
+            # Næste iteration er mindst et par gange dyrere end denne
+            remaining = self.deadline - time.perf_counter()
+            if (time.perf_counter() - started) * 3 > remaining:
+                break
+        return best_move
+
+    def _check_deadline(self):
+        self.nodes += 1
+        if time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def _root(self, moves, depth):
+        scores = {}
+        alpha = LOSS - 1
+        opponents = self._opponent_order(self.state, depth)
+        for move in moves:
+            score = self._opponents(self.state, {self.you_id: move}, opponents, depth, 0, alpha, WIN + 1)
+            scores[move] = score
+            alpha = max(alpha, score)
+        return scores
+
+    def _opponent_order(self, state, depth):
+        """Opponents close enough to reach our head within `depth` rounds, nearest first."""
+        width = state.width
+        head = state.snakes[self.you_id].head
+        head_x, head_y = head % width, head // width
+        nearby = []
+        for snake_id, body in state.snakes.items():
+            if snake_id == self.you_id:
+                continue
+            distance = abs(body.head % width - head_x) + abs(body.head // width - head_y)
+            if distance <= 2 * depth + 1:
+                nearby.append((distance, snake_id))
+        nearby.sort()
+        return [snake_id for _, snake_id in nearby]
+
+    def _opponents(self, state, joint_moves, opponents, depth, ply, alpha, beta):
+        """Min node: the next nearby opponent picks its move, then the round is resolved."""
+        self._check_deadline()
+        if not opponents:
+            for snake_id in state.snakes:
+                if snake_id not in joint_moves:
+                    # Fjerne modstandere spiller bare deres første mulige træk
+                    candidates = candidate_moves(state, snake_id)
+                    joint_moves[snake_id] = candidates[0] if candidates else "up"
+            child = advance(state, joint_moves)
+            return self._max(child, depth - 1, ply + 1, alpha, beta)
+
+        snake_id, rest = opponents[0], opponents[1:]
+        candidates = candidate_moves(state, snake_id) or ["up"]
+        value = WIN + 1
+        for move in candidates:
+            moves = dict(joint_moves)
+            moves[snake_id] = move
+            value = min(value, self._opponents(state, moves, rest, depth, ply, alpha, beta))
+            beta = min(beta, value)
+            if beta <= alpha:
+                break
+        return value
+
+    def _max(self, state, depth, ply, alpha, beta):
+        """Max node: our move in the current round."""
+        if depth == 0 or self.you_id not in state.snakes or len(state.snakes) == 1 and not self.solo:
+            return evaluate(state, self.you_id, ply, self.solo)
+
+        moves = candidate_moves(state, self.you_id)
+        if not moves:
+            return LOSS + ply + 1
+        opponents = self._opponent_order(state, depth)
+        value = LOSS - 1
+        for move in moves:
+            value = max(value, self._opponents(state, {self.you_id: move}, opponents, depth, ply, alpha, beta))
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return value
+
+
+def search_move(state, you_id, deadline, fallback=None):
+    """Best move for `you_id` found before `deadline` (a time.perf_counter() value)."""
+    return Search(state, you_id, deadline).run(fallback)
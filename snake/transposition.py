@@ -0,0 +1,230 @@
+"""Zobrist hashing of /move positions and a transposition table shared by all games.
+
+A position is hashed as the XOR of one random 64-bit key per (layer, cell) that is
+set, where the layers are what choose_move() looks at: food, our head and body,
+enemy heads (split by whether the enemy is at least as long as us) and enemy
+bodies, plus one key for "hungry" (health <= 80 or shorter than an opponent).
+
+PositionHash keeps the hash of a game's position under every board symmetry and
+updates all of them from GameStateCache's changed cells, so a turn costs a few
+XORs instead of a pass over the board. The smallest of them is the canonical key:
+the same position mirrored or rotated, in another game or later in this one,
+finds the same TranspositionTable entry. Moves are stored in the canonical frame
+and mapped back through the symmetry on the way out.
+"""
+import random
+import threading
+from collections import OrderedDict
+
+LAYERS = ("food", "own_head", "own_body", "enemy_head", "enemy_threat", "enemy_body")
+FOOD, OWN_HEAD, OWN_BODY, ENEMY_HEAD, ENEMY_THREAT, ENEMY_BODY = (1 << i for i in range(len(LAYERS)))
+
+# Samme retninger som API'et: "up" øger y
+DIRECTIONS = {"up": (0, 1), "down": (0, -1), "left": (-1, 0), "right": (1, 0)}
+MOVE_OF = {vector: move for move, vector in DIRECTIONS.items()}
+
+# Fast seed, så alle worker-processer hasher ens
+SEED = 0x5EED
+
+
+def symmetries(width, height):
+    """(swap, flip_x, flip_y) for every symmetry of the board: 8 on a square board, 4 otherwise."""
+    return [
+        (swap, flip_x, flip_y)
+        for swap in ((False, True) if width == height else (False,))
+        for flip_x in (False, True)
+        for flip_y in (False, True)
+    ]
+
+
+def transform_cell(symmetry, cell, width, height):
+    swap, flip_x, flip_y = symmetry
+    x, y = cell % width, cell // width
+    if swap:
+        x, y = y, x
+    if flip_x:
+        x = width - 1 - x
+    if flip_y:
+        y = height - 1 - y
+    return y * width + x
+
+
+def transform_move(symmetry, move):
+    """The direction `move` becomes when the board is transformed by `symmetry`."""
+    swap, flip_x, flip_y = symmetry
+    dx, dy = DIRECTIONS[move]
+    if swap:
+        dx, dy = dy, dx
+    return MOVE_OF[(-dx if flip_x else dx, -dy if flip_y else dy)]
+
+
+def inverse_move(symmetry, move):
+    """The direction that `transform_move(symmetry, ...)` turns into `move`."""
+    swap, flip_x, flip_y = symmetry
+    dx, dy = DIRECTIONS[move]
+    dx, dy = -dx if flip_x else dx, -dy if flip_y else dy
+    if swap:
+        dx, dy = dy, dx
+    return MOVE_OF[(dx, dy)]
+
+
+class Zobrist:
+    """Random keys for one board size, pre-permuted for each of its symmetries."""
+
+    _tables = {}
+    _lock = threading.Lock()
+
+    def __init__(self, width, height, seed=SEED):
+        rng = random.Random(seed * 1000003 + width * 1009 + height)
+        cells = width * height
+        keys = [[rng.getrandbits(64) for _ in range(cells)] for _ in LAYERS]
+        self.width = width
+        self.height = height
+        self.hungry = rng.getrandbits(64)
+        self.symmetries = symmetries(width, height)
+        # keys[s][cell][layer]: nøglen for cellen, efter brættet er transformeret med symmetri s
+        self.keys = [
+            [[keys[layer][transform_cell(symmetry, cell, width, height)] for layer in range(len(LAYERS))]
+             for cell in range(cells)]
+            for symmetry in self.symmetries
+        ]
+
+    @classmethod
+    def for_board(cls, width, height):
+        """The shared instance for a board size."""
+        with cls._lock:
+            table = cls._tables.get((width, height))
+            if table is None:
+                table = cls._tables[(width, height)] = cls(width, height)
+            return table
+
+
+def cell_layers(state, you_id, cells):
+    """{cell: layer bits} for `cells` as seen by `you_id`."""
+    you = state.snakes[you_id]
+    length = len(you)
+    enemy_body = 0
+    enemy_heads = {}
+    for snake_id, body in state.snakes.items():
+        if snake_id != you_id:
+            enemy_body |= body.mask
+            enemy_heads[body.head] = enemy_heads.get(body.head, 0) | (ENEMY_THREAT if len(body) >= length else ENEMY_HEAD)
+
+    layers = {}
+    for cell in cells:
+        bits = enemy_heads.get(cell, 0)
+        if (state.food >> cell) & 1:
+            bits |= FOOD
+        if (you.mask >> cell) & 1:
+            bits |= OWN_BODY
+        if cell == you.head:
+            bits |= OWN_HEAD
+        if (enemy_body >> cell) & 1:
+            bits |= ENEMY_BODY
+        layers[cell] = bits
+    return layers
+
+
+def is_hungry(state, you_id):
+    """choose_move's condition for going after food."""
+    length = len(state.snakes[you_id])
+    longest = max((len(body) for snake_id, body in state.snakes.items() if snake_id != you_id), default=0)
+    return length < longest or state.health[you_id] <= 80
+
+
+class PositionHash:
+    """Zobrist hashes of one game's position for `you_id`, one per board symmetry."""
+
+    __slots__ = ("zobrist", "layers", "hashes", "hungry")
+
+    def __init__(self, state, you_id):
+        self.zobrist = Zobrist.for_board(state.width, state.height)
+        self.layers = [0] * (state.width * state.height)
+        self.hashes = [0] * len(self.zobrist.symmetries)
+        self.hungry = False
+        self.update(state, you_id, None)
+
+    def update(self, state, you_id, changed):
+        """Bring the hashes up to date; `changed` is the set of cells that may differ (None = all)."""
+        cells = range(len(self.layers)) if changed is None else changed
+        keys = self.zobrist.keys
+        hashes = self.hashes
+        for cell, bits in cell_layers(state, you_id, cells).items():
+            diff = self.layers[cell] ^ bits
+            if not diff:
+                continue
+            self.layers[cell] = bits
+            layer = 0
+            while diff:
+                if diff & 1:
+                    for s, table in enumerate(keys):
+                        hashes[s] ^= table[cell][layer]
+                diff >>= 1
+                layer += 1
+
+        hungry = is_hungry(state, you_id)
+        if hungry != self.hungry:
+            self.hungry = hungry
+            for s in range(len(hashes)):
+                hashes[s] ^= self.zobrist.hungry
+        return self
+
+    def canonical(self):
+        """(key, symmetry) for the smallest hash; equal positions under any symmetry get the same key."""
+        s = min(range(len(self.hashes)), key=self.hashes.__getitem__)
+        return (self.zobrist.width, self.zobrist.height, self.hashes[s]), self.zobrist.symmetries[s]
+
+
+class TranspositionTable:
+    """Bounded LRU of position key -> value, shared by every request in the process."""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+def cached_move(table, position, compute):
+    """The move for `position` from `table`, or `compute()` stored in the canonical frame."""
+    key, symmetry = position.canonical()
+    move = table.get(key)
+    if move is not None:
+        return inverse_move(symmetry, move)
+    move = compute()
+    table.put(key, transform_move(symmetry, move))
+    return move
@@ -0,0 +1,312 @@
+"""Reproducible benchmarks for the env, the SimpleSnake opponent, the /move servers and PPO training.
+
+    python tools/benchmark.py --output baseline.json
+    python tools/benchmark.py --compare baseline.json --tolerance 0.15
+
+Everything is seeded. Results are written as JSON. With --compare, the run exits 1
+if any metric is more than --tolerance worse than the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "gym"))
+
+from loadtest import load_payloads, run_load
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "move_payloads.jsonl")
+BOARD_SIZES = [(7, 7), (11, 11), (19, 19)]
+SNAKE_LENGTHS = [3, 10, 25]
+SERVERS = {
+    # trained-snake's model is trained on 11x11 and can only answer those boards
+    "snake": {"directory": "snake", "boards": None},
+    "trained-snake": {"directory": "trained-snake", "boards": {(11, 11)}},
+}
+SUITES = ["env", "vec_env", "opponent", "server", "ppo"]
+
+# Metrics where a higher value is better; every other number is a latency
+HIGHER_IS_BETTER = ("per_second", "throughput_rps")
+
+
+def percentiles_us(samples):
+    samples = sorted(samples)
+    return {
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 2),
+        "p99_us": round(samples[min(len(samples) - 1, int(0.99 * len(samples)))] * 1e6, 2),
+        "calls_per_second": round(len(samples) / sum(samples), 1),
+    }
+
+
+def long_body(width, height, length):
+    """Snake cells from the env's start head, winding right and down through the lower half of the board."""
+    path = []
+    for row, y in enumerate(range(height // 2, height)):
+        xs = range(width) if row % 2 == 0 else range(width - 1, -1, -1)
+        path.extend(y * width + x for x in xs)
+    start = path.index((height // 2) * width + width // 2)
+    return path[start:start + length]
+
+
+def safe_action(env, rng):
+    """A random move that does not crash, so the game keeps going (a crash freezes BattlesnakeEnv)."""
+    safe = env._get_safe_moves(env._point(env.snake.head))
+    return ["up", "down", "left", "right"].index(rng.choice(safe)) if safe else rng.randrange(4)
+
+
+def bench_env(seed, steps):
+    from battlesnake_env import BattlesnakeEnv
+    from board_state import SnakeBody
+
+    results = {}
+    for width, height in BOARD_SIZES:
+        for length in SNAKE_LENGTHS:
+            env = BattlesnakeEnv(width, height)
+            rng = random.Random(seed)
+            env.reset(seed=seed)
+            elapsed = 0.0
+            for step in range(steps):
+                if step % 200 == 0:
+                    # Start forfra med en slange af den ønskede længde
+                    env.reset()
+                    env.snake = SnakeBody(long_body(width, height, length))
+                    env.food = env._generate_food()
+                    env._board = None  # Brættet fra reset passer ikke længere
+                action = safe_action(env, rng)
+                started = time.perf_counter()
+                env.step(action)
+                elapsed += time.perf_counter() - started
+            results[f"{width}x{height}/length{length}"] = {"steps_per_second": round(steps / elapsed, 1)}
+    return results
+
+
+def bench_vec_env(seed, steps):
+    from battlesnake_vec_env import BattlesnakeVecEnv
+
+    results = {}
+    rng = np.random.default_rng(seed)
+    for width, height in BOARD_SIZES:
+        for n_envs, observation in ((1, "board"), (64, "board"), (64, "channels")):
+            env = BattlesnakeVecEnv(n_envs, width, height, observation=observation)
+            env.seed(seed)
+            env.reset()
+            actions = rng.integers(0, 4, size=(steps, n_envs))
+            started = time.perf_counter()
+            for step_actions in actions:
+                env.step(step_actions)
+            elapsed = time.perf_counter() - started
+            key = f"{width}x{height}/n_envs{n_envs}" + ("" if observation == "board" else f"/{observation}")
+            results[key] = {"steps_per_second": round(steps * n_envs / elapsed, 1)}
+    return results
+
+
+def bench_opponent(seed, calls):
+    from battlesnake_env import BattlesnakeEnv
+
+    results = {}
+    for width, height in BOARD_SIZES:
+        env = BattlesnakeEnv(width, height)
+        env.reset(seed=seed)
+        rng = random.Random(seed)
+        samples = []
+        for _ in range(calls):
+            board = env._get_observation().reshape(height, width)
+            started = time.perf_counter()
+            env.opponent.get_action(board)
+            samples.append(time.perf_counter() - started)
+            env.step(safe_action(env, rng))
+        results[f"{width}x{height}"] = percentiles_us(samples)
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} was not ready after {timeout} s")
+
+
+def bench_server(name, payloads, concurrency, requests, workers):
+    """Start one server under gunicorn on a free port and run the load generator against it."""
+    server = SERVERS[name]
+    if server["boards"]:
+        payloads = [p for p in payloads if (p["board"]["width"], p["board"]["height"]) in server["boards"]]
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    environment = dict(os.environ, BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=os.path.join(ROOT, server["directory"]), env=environment,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(url)
+        run_load(url, payloads, concurrency, min(requests, 100))  # Opvarmning
+        stats = run_load(url, payloads, concurrency, requests)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {key: value for key, value in stats.items() if key != "first_error" or value}
+
+
+def bench_ppo(seed, timesteps):
+    from stable_baselines3 import PPO
+    from battlesnake_vec_env import BattlesnakeVecEnv
+
+    env = BattlesnakeVecEnv(n_envs=8)
+    model = PPO("MlpPolicy", env, n_steps=256, device="cpu", seed=seed)
+    model.learn(total_timesteps=256 * 8)  # Opvarmning
+    started = time.perf_counter()
+    model.learn(total_timesteps=timesteps, reset_num_timesteps=False)
+    elapsed = time.perf_counter() - started
+    return {"n_envs8": {"timesteps_per_second": round(timesteps / elapsed, 1)}}
+
+
+def machine_info():
+    import torch
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def higher_is_better(metric):
+    return metric.endswith(HIGHER_IS_BETTER)
+
+
+def best_of(runs):
+    """Merge repeated runs of one suite, keeping each metric's best value (the least disturbed run)."""
+    merged = {}
+    for key, value in runs[0].items():
+        if isinstance(value, dict):
+            merged[key] = best_of([run[key] for run in runs])
+        else:
+            pick = max if higher_is_better(key) else min
+            merged[key] = pick(run[key] for run in runs)
+    return merged
+
+
+def run(args):
+    results = {}
+    if "env" in args.suites:
+        results["env"] = best_of([bench_env(args.seed, args.env_steps) for _ in range(args.repeat)])
+    if "vec_env" in args.suites:
+        results["vec_env"] = best_of([bench_vec_env(args.seed, args.env_steps) for _ in range(args.repeat)])
+    if "opponent" in args.suites:
+        results["opponent"] = best_of([bench_opponent(args.seed, args.opponent_calls) for _ in range(args.repeat)])
+    if "server" in args.suites:
+        payloads = load_payloads(args.payloads)
+        results["server"] = {
+            name: bench_server(name, payloads, args.concurrency, args.requests, args.workers)
+            for name in args.servers
+        }
+    if "ppo" in args.suites:
+        results["ppo"] = bench_ppo(args.seed, args.ppo_timesteps)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "machine": machine_info(),
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{key}/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[f"{prefix}{key}"] = value
+    return metrics
+
+
+def compare(current, baseline, tolerance):
+    """Return (rows, regressions), where a row is (metric, baseline, current, relative change; positive = better)."""
+    ours = flatten(current["results"])
+    theirs = flatten(baseline["results"])
+    rows, regressions = [], []
+    for metric in sorted(ours.keys() & theirs.keys()):
+        old, new = theirs[metric], ours[metric]
+        # Tællere (antal requests, fejl, ...) sammenlignes ikke relativt
+        if metric.endswith(("/requests", "/concurrency", "/errors", "/over_deadline")) or not old:
+            continue
+        change = (new - old) / abs(old)
+        if not higher_is_better(metric):
+            change = -change
+        rows.append((metric, old, new, change))
+        if change < -tolerance:
+            regressions.append(metric)
+    for metric in sorted(ours.keys() & theirs.keys()):
+        if metric.endswith("/errors") and ours[metric] > theirs[metric]:
+            regressions.append(metric)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the in-process suites; the best value per metric is kept")
+    parser.add_argument("--env-steps", type=int, default=2000)
+    parser.add_argument("--opponent-calls", type=int, default=2000)
+    parser.add_argument("--payloads", default=FIXTURES, help="Recorded /move payloads (see tools/record_payloads.py)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers per server")
+    parser.add_argument("--ppo-timesteps", type=int, default=8192)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(report, baseline, args.tolerance)
+        for metric, old, new, change in rows:
+            flag = "  REGRESSION" if metric in regressions else ""
+            print(f"{metric:55s} {old:>12} -> {new:>12}  {change:+7.1%}{flag}")
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Load generator for the snake servers: concurrent POST /move traffic with latency percentiles.
+
+    python tools/loadtest.py --url http://localhost:8080 --concurrency 32 --requests 2000
+"""
+import argparse
+import glob
+import json
+import random
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def random_payload(rng, width=11, height=11, snakes=4, game_id=None):
+    """A plausible /move payload: random non-overlapping snakes and some food."""
+    occupied = set()
+    bodies = []
+    for _ in range(snakes):
+        free = [(x, y) for x in range(width) for y in range(height) if (x, y) not in occupied]
+        body = [rng.choice(free)]
+        occupied.add(body[0])
+        for _ in range(rng.randint(2, 14)):
+            x, y = body[-1]
+            options = [(x + dx, y + dy) for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                       if 0 <= x + dx < width and 0 <= y + dy < height and (x + dx, y + dy) not in occupied]
+            if not options:
+                break
+            body.append(rng.choice(options))
+            occupied.add(body[-1])
+        bodies.append(body)
+
+    snake_dicts = []
+    for i, body in enumerate(bodies):
+        points = [{"x": x, "y": y} for x, y in body]
+        snake_dicts.append({
+            "id": f"snake-{i}", "name": f"snake-{i}", "health": rng.randint(1, 100), "body": points,
+            "head": points[0], "length": len(points), "latency": "0", "shout": "",
+        })
+    free = [(x, y) for x in range(width) for y in range(height) if (x, y) not in occupied]
+    food = [{"x": x, "y": y} for x, y in rng.sample(free, min(len(free), rng.randint(1, 5)))]
+    return {
+        "game": {"id": game_id or f"game-{rng.getrandbits(32):08x}", "ruleset": {"name": "standard", "version": "v1"}, "timeout": 500},
+        "turn": rng.randint(0, 300),
+        "board": {"width": width, "height": height, "food": food, "hazards": [], "snakes": snake_dicts},
+        "you": snake_dicts[0],
+    }
+
+
+def load_payloads(path):
+    """Recorded /move payloads from a directory of *.json files or a .jsonl file (one payload per line)."""
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    payloads = []
+    for file_path in sorted(glob.glob(f"{path}/*.json")):
+        with open(file_path) as f:
+            payloads.append(json.load(f))
+    return payloads
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))], 2)
+
+
+def run_load(url, payloads, concurrency=16, requests=1000, deadline_ms=500, timeout=5.0):
+    """POST `requests` /move calls with `concurrency` threads and return latency statistics (ms)."""
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+
+    def call(i):
+        request = urllib.request.Request(f"{url}/move", data=bodies[i % len(bodies)], headers={"Content-Type": "application/json"})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                json.loads(response.read())
+            return (time.perf_counter() - started) * 1000, None
+        except Exception as error:
+            return (time.perf_counter() - started) * 1000, repr(error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, error in results if error is None)
+    errors = [error for _, error in results if error is not None]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.50),
+        "p90_ms": percentile(latencies, 0.90),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": percentile(latencies, 1.0),
+        "over_deadline": sum(latency > deadline_ms for latency in latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--payloads", help="Recorded /move payloads: a directory of *.json or a .jsonl file")
+    parser.add_argument("--deadline-ms", type=float, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.payloads:
+        payloads = load_payloads(args.payloads)
+    else:
+        rng = random.Random(args.seed)
+        payloads = [random_payload(rng) for _ in range(200)]
+
+    stats = run_load(args.url, payloads, args.concurrency, args.requests, args.deadline_ms)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
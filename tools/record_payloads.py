@@ -0,0 +1,68 @@
+"""Recording proxy: forwards Battlesnake requests to a snake server and saves every /move payload.
+
+    python tools/record_payloads.py --target http://localhost:8080 --port 8090 --output moves.jsonl
+    battlesnake play -W 11 -H 11 -r 1 -n a -u http://localhost:8090 -n b -u http://localhost:8090
+
+Each line of the output file is one /move request body, in arrival order.
+"""
+import argparse
+import json
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(target, output, every=1):
+    lock = threading.Lock()
+    seen = [0]
+
+    class RecordingHandler(BaseHTTPRequestHandler):
+        def _forward(self, body=None):
+            request = urllib.request.Request(f"{target}{self.path}", data=body, method=self.command,
+                                             headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                status, content = response.status, response.read()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            self._forward()
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path == "/move":
+                with lock:
+                    if seen[0] % every == 0:
+                        output.write(json.dumps(json.loads(body), separators=(",", ":")) + "\n")
+                        output.flush()
+                    seen[0] += 1
+            self._forward(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RecordingHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default="http://localhost:8080")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--output", default="moves.jsonl")
+    parser.add_argument("--every", type=int, default=1, help="Keep every n-th /move payload")
+    args = parser.parse_args()
+
+    with open(args.output, "a") as output:
+        server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(args.target, output, args.every))
+        print(f"Recording /move payloads for {args.target} on :{args.port} to {args.output}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Lægges i køen af close(); tråden stopper, når den når den
+_STOP = object()
+
+
+class _Pending:
+    __slots__ = ("observation", "mask", "done", "result", "error")
+
+    def __init__(self, observation, mask):
+        self.observation = observation
+        self.mask = mask
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collect observations from concurrent requests and run them through one batched predict.
+
+    A background thread takes the first waiting observation, then keeps collecting
+    for at most `max_wait_ms` or until `max_batch_size` observations are waiting.
+    It stacks them into one batch and hands every caller its own row of the result.
+    `max_wait_ms=0` only batches requests that are already queued, so a lone
+    request never waits. Larger windows trade a little latency for bigger batches.
+    Requests with an action mask are batched together and their stacked masks are
+    passed to `predict_batch` as a second argument.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=32, max_wait_ms=2.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.batches = 0
+        self.requests = 0
+
+    def predict(self, observation, mask=None):
+        """Return the prediction for a single observation (blocks until its batch has run)."""
+        self._ensure_thread()
+        pending = _Pending(observation, mask)
+        with self._lock:
+            if self._closed:
+                # Efter close() (fx en model smidt ud af et register) svares der direkte
+                return self._predict_group([pending])[0]
+            self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def close(self):
+        """Stop the background thread once the requests already queued are answered."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                if self._pid == os.getpid():
+                    self._queue.put(_STOP)
+
+    def _ensure_thread(self):
+        # Tråde overlever ikke et fork, så hver worker-proces starter sin egen
+        if self._pid == os.getpid() or self._closed:
+            return
+        with self._lock:
+            if self._pid != os.getpid() and not self._closed:
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    pending = self._queue.get(timeout=remaining)
+                else:
+                    pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is _STOP:
+                # Besvar resten af batchen først
+                self._queue.put(_STOP)
+                break
+            batch.append(pending)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # Kun observationer med samme form kan stables (forskellige brætstørrelser)
+            groups = {}
+            for pending in batch:
+                groups.setdefault((pending.observation.shape, pending.mask is None), []).append(pending)
+
+            for group in groups.values():
+                try:
+                    results = self._predict_group(group)
+                    for pending, result in zip(group, results):
+                        pending.result = result
+                except Exception as error:
+                    for pending in group:
+                        pending.error = error
+                for pending in group:
+                    pending.done.set()
+
+            self.batches += 1
+            self.requests += len(batch)
+
+    def _predict_group(self, group):
+        observations = np.stack([pending.observation for pending in group])
+        if group[0].mask is None:
+            return self.predict_batch(observations)
+        return self.predict_batch(observations, np.stack([pending.mask for pending in group]))
@@ -0,0 +1,29 @@
+# Produktionsserver: gunicorn -c gunicorn.conf.py main:app (køres fra denne mappe)
+#
+# main.py importerer fælles moduler fra ../gym, så en deployment skal have repoets layout:
+#   <rod>/gym/*.py og <rod>/trained-snake/ (se dockerfile).
+# En .zip-model kræver desuden torch og stable-baselines3 (se requirements.txt); en model,
+# der er eksporteret med gym/export_policy.py, gør ikke.
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+
+# Flere processer, så et langsomt /move ikke blokerer de andre spil
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", "4"))
+
+# Appen indlæses én gang i master-processen og deles copy-on-write efter fork
+preload_app = True
+
+# Battlesnake giver 500 ms pr. træk; en hængende worker genstartes
+timeout = 30
+keepalive = 5
+
+
+def post_worker_init(worker):
+    # Hver worker starter sine batch-tråde og forvarmer modellerne, før den tager imod requests
+    import main
+
+    main.prewarm()
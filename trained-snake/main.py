@@ -1,47 +1,136 @@
+import time
+
+# Opstartstiden måles fra, før noget andet er importeret
+STARTED = time.perf_counter()
+
 from flask import Flask, request, jsonify
-from stable_baselines3 import PPO
 import numpy as np
+import os
+import sys
+
+# Fælles moduler (board_state m.fl.) ligger i gym/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gym"))
+from board_state import BoardState
+from game_cache import GameStateCache
+from metrics import ServerMetrics
+from serving import add_health_routes
+from observation import encode_state
+from action_mask import action_mask
+from replay import ACTION_TO_MOVE
+from registry import ModelRegistry
 
 app = Flask(__name__)
 
-# Indlæs den trænede model
-MODEL_PATH = "test123.zip"
-model = PPO.load(MODEL_PATH)
+# Modellerne (eksporteret med gym/export_policy.py, ingen torch nødvendig) ligger i MODEL_DIR og vælges ved navn
+MODEL_DIR = os.environ.get("MODEL_DIR", os.path.dirname(os.path.abspath(__file__)))
+MODEL_NAME = os.environ.get("MODEL_NAME", "test123")
+# A/B-test: "navn:vægt,navn:vægt" fordeler spillene (efter spil-id) mellem modellerne
+MODEL_SPLIT = os.environ.get("MODEL_SPLIT", "")
+# Antal modeller, der holdes indlæst på én gang
+MODEL_CACHE_SIZE = int(os.environ.get("MODEL_CACHE_SIZE", "4"))
+# Sæt for at kunne skifte model med POST /models; ellers kun via miljøvariablerne
+MODEL_ADMIN_TOKEN = os.environ.get("MODEL_ADMIN_TOKEN")
+# "1": konvertér modellerne til .weights-mapper og memory-map dem (workers deler siderne, ingen indlæsning)
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "0") == "1"
+# "1": gennemsnit af modellens sandsynligheder over brættets 8 spejlinger/rotationer (8x beregning pr. træk)
+SYMMETRY_AVERAGING = os.environ.get("SYMMETRY_AVERAGING", "0") == "1"
+# "1": modellen vælger kun mellem træk, der ikke går direkte ind i en væg eller en krop
+ACTION_MASKING = os.environ.get("ACTION_MASKING", "1") == "1"
+
+# Samtidige /move-requests til samme model samles i én forward pass:
+# BATCH_MAX_SIZE observationer pr. batch, BATCH_WINDOW_MS ventetid på flere
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "32"))
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "2"))
+
+registry = ModelRegistry(MODEL_DIR, MODEL_NAME, MODEL_CACHE_SIZE, BATCH_MAX_SIZE, BATCH_WINDOW_MS, memmap=MODEL_MMAP,
+                         symmetry=SYMMETRY_AVERAGING)
+if MODEL_SPLIT:
+    registry.set_split({name: float(weight) for name, weight in (arm.split(":") for arm in MODEL_SPLIT.split(","))})
+# Indlæs og forvarm standardmodellen og A/B-modellerne før fork, så workerne deler dem
+for name in {MODEL_NAME, *registry.split}:
+    registry.get(name)
+STARTUP_SECONDS = time.perf_counter() - STARTED
+print(f"Klar efter {STARTUP_SECONDS:.3f} s")
+
+def prewarm():
+    """Send a dummy observation through every loaded model's micro-batcher (starts its thread in this process)."""
+    for name in registry.loaded():
+        model = registry.get(name)
+        model.predict(np.zeros(model.policy.input_size, dtype=np.float32))
+
+# Klar til /move, når standardmodellen er indlæst
+add_health_routes(app, is_ready=lambda: registry.is_loaded(registry.default), startup_seconds=lambda: STARTUP_SECONDS)
+
+# Brættet og observationen for hvert igangværende spil, opdateret med hver turs ændringer
+games = GameStateCache()
+
+# GET /metrics: svartider pr. endpoint og fase; svar på NEAR_DEADLINE_MS eller mere tælles for sig
+NEAR_DEADLINE_MS = int(os.environ.get("NEAR_DEADLINE_MS", "300"))
+metrics = ServerMetrics(NEAR_DEADLINE_MS)
+metrics.install(app)
+metrics.add_gauge("battlesnake_games_in_flight", "Games in this process's board cache", lambda: len(games))
+metrics.add_gauge("battlesnake_models_loaded", "Models loaded in this process", lambda: len(registry.loaded()))
 
 # Funktion til at konvertere Battlesnake API-data til observationsformat
 def create_observation(data):
-    board = data["board"]
-    width, height = board["width"], board["height"]
+    return encode_observation(BoardState.from_request(data), data["you"]["id"])
 
-    # Spejl y-koordinaten
-    def flip_y(y):
-        return y #height - 1 - y
-
-    observation = np.zeros((height, width), dtype=np.int32)
+def encode_observation(state, you_id):
+    # Cellerne er y * width + x, dvs. samme rækkefølge som et fladt (height, width) bræt
+    observation = np.zeros(state.height * state.width, dtype=np.int32)
 
     # Placér modstandere
-    for snake in board["snakes"]:
-        for segment in snake["body"]:
-            observation[flip_y(segment["y"]), segment["x"]] = 4  # Krop
-        observation[flip_y(snake["head"]["y"]), snake["head"]["x"]] = 3  # Hoved
+    for body in state.snakes.values():
+        observation[list(body)] = 4  # Krop
+        observation[body.head] = 3  # Hoved
 
     # Placér din slange
-    you = data["you"]
-    for segment in you["body"]:
-        observation[flip_y(segment["y"]), segment["x"]] = 2  # Krop
-    observation[flip_y(you["head"]["y"]), you["head"]["x"]] = 1  # Hoved
+    you = state.snakes[you_id]
+    observation[list(you)] = 2  # Krop
+    observation[you.head] = 1  # Hoved
 
     # Placér mad
-    for food in board["food"]:
-        observation[flip_y(food["y"]), food["x"]] = 5
-
-    print(observation)
-
-    return observation.flatten()
+    observation[state.food_cells()] = 5
+
+    return observation
+
+def cell_value(state, you_id, cell):
+    """The value encode_observation writes into a single cell."""
+    if (state.food >> cell) & 1:
+        return 5
+    you = state.snakes[you_id]
+    if cell == you.head:
+        return 1
+    if cell in you:
+        return 2
+    bodies = [body for snake_id, body in state.snakes.items() if snake_id != you_id]
+    if any(cell == body.head for body in bodies):
+        return 3
+    if any(cell in body for body in bodies):
+        return 4
+    return 0
+
+def cached_observation(data, observation="board"):
+    """Observation for this turn, patched in place from the game's previous turn when possible."""
+    you_id = data["you"]["id"]
+    with metrics.phase("board"):
+        game, changed = games.update(data)
+    with metrics.phase("observation"):
+        if observation == "channels":
+            # Helbred og alder ændrer sig hver tur, så planerne bygges forfra fra det cachede bræt
+            game.extra = None
+            return encode_state(game.state, you_id)
+        if changed is None or game.extra is None:
+            game.extra = encode_observation(game.state, you_id)
+        else:
+            for cell in changed:
+                game.extra[cell] = cell_value(game.state, you_id, cell)
+        return game.extra.copy()
 
 
 @app.route("/", methods=["GET"])
-def index():
+@app.route("/models/<model_name>/", methods=["GET"])
+def index(model_name=None):
     return jsonify({
         "apiversion": "1",
         "author": "your_name",
@@ -51,31 +140,76 @@ def index():
     })
 
 @app.route("/start", methods=["POST"])
-def start():
-    print("Game started!")
+@app.route("/models/<model_name>/start", methods=["POST"])
+def start(model_name=None):
+    games.start(request.json)
     return "OK"
 
 @app.route("/move", methods=["POST"])
-def move():
-    data = request.json
+@app.route("/models/<model_name>/move", methods=["POST"])
+def move(model_name=None):
+    with metrics.phase("parse"):
+        data = request.json
+
+    # /models/<navn>/move vælger modellen; ellers standardmodellen eller spillets A/B-arm
+    try:
+        model = registry.get(registry.route(data["game"]["id"], model_name))
+    except KeyError:
+        return jsonify({"error": f"unknown model {model_name}"}), 404
 
     # Opret observation fra data
-    observation = create_observation(data)
+    observation = cached_observation(data, model.observation)
 
-    # Brug modellen til at forudsige næste træk
-    action, _states = model.predict(observation)
+    # Brug modellen til at forudsige næste træk (batches sammen med andre spil)
+    mask = None
+    if ACTION_MASKING:
+        with metrics.phase("safety"):
+            game = games.get(data)
+            mask = action_mask(game.state, data["you"]["id"])
+    # Inklusive ventetiden i micro-batcheren
+    with metrics.phase("inference"):
+        action = model.predict(observation, mask)
 
-    # Konverter numerisk handling til retning
-    actions = ["up", "down", "left", "right"]
-    direction = actions[action]
-    print(direction)
+    # Konverter numerisk handling til retning; samme handlinger som i træningen (0 mindsker y, dvs. API'ets "down")
+    direction = ACTION_TO_MOVE[action]
 
-    return jsonify({"move": direction})
+    with metrics.phase("serialize"):
+        return jsonify({"move": direction})
 
 @app.route("/end", methods=["POST"])
-def end():
-    print("Game ended!")
+@app.route("/models/<model_name>/end", methods=["POST"])
+def end(model_name=None):
+    games.end(request.json)
     return "OK"
 
+@app.route("/models", methods=["GET"])
+def models():
+    return jsonify({
+        "default": registry.default,
+        "split": registry.split,
+        "loaded": registry.loaded(),
+        "available": registry.available(),
+    })
+
+@app.route("/models", methods=["POST"])
+def update_models():
+    """Skift standardmodel og/eller A/B-fordeling: {"default": navn, "split": {navn: vægt}}.
+
+    Gælder kun den worker-proces, der får requesten; brug MODEL_NAME/MODEL_SPLIT
+    og en genstart for at ændre alle workers.
+    """
+    if not MODEL_ADMIN_TOKEN or request.headers.get("Authorization") != f"Bearer {MODEL_ADMIN_TOKEN}":
+        return jsonify({"error": "forbidden"}), 403
+    data = request.json
+    try:
+        if "default" in data:
+            registry.set_default(data["default"])
+        if "split" in data:
+            registry.set_split(data["split"])
+    except KeyError as error:
+        return jsonify({"error": f"unknown model {error.args[0]}"}), 404
+    return models()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    # Udviklingsserver; brug gunicorn -c gunicorn.conf.py main:app i produktion
+    app.run(host="0.0.0.0", port=8080, threaded=True)
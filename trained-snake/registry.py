@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from numpy_policy import NumpyPolicy
+from observation import observation_mode
+from batching import MicroBatcher
+from symmetry import BoardSymmetry
+
+
+# Foretrukken filtype, når flere er lige nye
+EXTENSIONS = (".weights", ".npz", ".zip")
+
+
+class LoadedModel:
+    """One deserialized policy with its own micro-batcher and observation mode.
+
+    The policy runs one forward pass on a dummy observation here, so the first
+    real /move does not pay for lazy initialization. With `symmetry`, every
+    prediction averages the policy over the 8 rotations and reflections of the board.
+    """
+
+    def __init__(self, name, path, policy, batch_size, window_ms, symmetry=False):
+        started = time.perf_counter()
+        self.name = name
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        policy.prewarm()
+        self.policy = policy
+        # "board" eller "channels", afhængigt af hvad modellen er trænet på (modellen kender kun 11x11)
+        self.observation = observation_mode(policy.input_size)
+        self.symmetry = BoardSymmetry(11, 11) if symmetry else None
+        self.batcher = MicroBatcher(
+            lambda observations, masks=None: policy.predict(observations, symmetry=self.symmetry, mask=masks)[0],
+            batch_size, window_ms,
+        )
+        self.loaded = time.time()
+        self.prewarm_seconds = time.perf_counter() - started
+
+    def predict(self, observation, mask=None):
+        return self.batcher.predict(observation, mask)
+
+
+def load_policy(path, memmap=False):
+    """NumpyPolicy from a .weights directory, an .npz export or an SB3 .zip.
+
+    A .zip (PPO, or MaskablePPO with sb3-contrib) needs torch and is exported once
+    to an .npz next to it. With `memmap`, an .npz or .zip is also converted to a
+    .weights directory, which is then memory-mapped instead of read (if the
+    directory is writable).
+    """
+    stem, extension = os.path.splitext(path)
+    if extension in (".weights", ".npz"):
+        policy = NumpyPolicy.load(path)
+    else:
+        # torch og SB3 importeres kun, når en model ikke er eksporteret endnu
+        from action_mask import load_model
+        from export_policy import export_policy
+
+        # PPO eller MaskablePPO, afhængigt af hvordan generationen er trænet
+        policy = export_policy(load_model(path, device="cpu"))
+        # save() skriver atomisk: de andre workers ser enten den gamle .npz eller hele den nye
+        try:
+            policy.save(stem + ".npz")
+        except OSError as error:
+            # Skrivebeskyttet mappe: modellen bruges alligevel, den eksporteres bare igen næste gang
+            print(f"Kunne ikke gemme {stem}.npz: {error}")
+    if memmap and extension != ".weights":
+        try:
+            policy.save_memmap(stem + ".weights")
+            policy = NumpyPolicy.load(stem + ".weights")
+        except OSError as error:
+            # Modellen bruges fra hukommelsen i stedet for at blive memory-mappet
+            print(f"Kunne ikke memory-mappe {stem}.weights: {error}")
+    return policy
+
+
+class ModelRegistry:
+    """Named policies from `directory`, loaded on demand and kept in an LRU of `capacity` models.
+
+    A name is a file stem: "model_gen4_3" is model_gen4_3.weights, .npz or .zip. route()
+    picks the model for a request: an explicitly requested name, otherwise one
+    from the A/B split chosen by a hash of the game id, so a game keeps its model
+    in every worker process. A file that changes on disk is loaded again on its
+    next use, at most every `reload_interval` seconds; the new model replaces the
+    old one in a single assignment, and requests that already hold the old model
+    finish with it.
+    """
+
+    def __init__(self, directory, default, capacity=4, batch_size=32, window_ms=2.0, reload_interval=5.0,
+                 memmap=False, symmetry=False):
+        self.directory = directory
+        self.default = default
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.window_ms = window_ms
+        self.reload_interval = reload_interval
+        self.memmap = memmap
+        self.symmetry = symmetry
+        # Navn -> andel af spillene; tom betyder alt til default
+        self.split = {}
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._checked = {}
+
+    def path(self, name):
+        if os.path.basename(name) != name or name.startswith("."):
+            raise KeyError(name)
+        paths = [os.path.join(self.directory, name + extension) for extension in EXTENSIONS]
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            raise KeyError(name)
+        # Den nyeste fil vinder; eksporterne bruges, medmindre .zip-filen er nyere
+        return max(paths, key=lambda path: (os.path.getmtime(path), -EXTENSIONS.index(os.path.splitext(path)[1])))
+
+    def available(self):
+        """Names of every model file in the directory."""
+        return sorted({os.path.splitext(f)[0] for f in os.listdir(self.directory) if f.endswith(EXTENSIONS)})
+
+    def loaded(self):
+        with self._lock:
+            return list(self._models)
+
+    def is_loaded(self, name):
+        with self._lock:
+            return name in self._models
+
+    def get(self, name=None):
+        """The loaded model `name` (default if None), loading or reloading it if needed."""
+        name = name or self.default
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                if not self._stale(model):
+                    return model
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Kun én tråd indlæser et givet navn; andre modeller svarer imens
+        with load_lock:
+            with self._lock:
+                current = self._models.get(name)
+            if current is not None and current is not model:
+                return current
+            path = self.path(name)
+            try:
+                loaded = LoadedModel(name, path, load_policy(path, self.memmap), self.batch_size, self.window_ms,
+                                     self.symmetry)
+            except Exception:
+                # En fil, der stadig bliver skrevet, må ikke tage den kørende model ned
+                if model is not None:
+                    return model
+                raise
+            with self._lock:
+                self._models[name] = loaded
+                self._models.move_to_end(name)
+                evicted = []
+                while len(self._models) > self.capacity:
+                    evicted.append(self._models.popitem(last=False)[1])
+            for old in evicted + ([model] if model is not None else []):
+                old.batcher.close()
+            return loaded
+
+    def _stale(self, model):
+        """True if the model's file has changed (checked at most every reload_interval seconds)."""
+        now = time.monotonic()
+        if now - self._checked.get(model.name, 0) < self.reload_interval:
+            return False
+        self._checked[model.name] = now
+        try:
+            return os.path.getmtime(model.path) != model.mtime
+        except OSError:
+            return False
+
+    def set_default(self, name):
+        self.get(name)
+        self.default = name
+
+    def set_split(self, split):
+        """Route games to models by weight, e.g. {"model_gen4_3": 1, "model_gen5_1": 1}; {} routes all to default."""
+        for name in split:
+            self.path(name)
+        total = sum(split.values())
+        self.split = {name: weight / total for name, weight in split.items() if weight > 0} if total else {}
+
+    def route(self, game_id, requested=None):
+        """The model name for a request: `requested` if given, else the game's A/B arm, else the default."""
+        if requested:
+            return requested
+        split = self.split
+        if not split:
+            return self.default
+        point = zlib.crc32(game_id.encode()) / 2 ** 32
+        for name, share in split.items():
+            point -= share
+            if point < 0:
+                return name
+        return name